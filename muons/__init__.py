@@ -1,9 +1,35 @@
+import importlib
 from .detection import detection
 from .extraction import extract_muons_from_run
 from . import trigger
 from . import tools
-from . import isdc_production
-from . import muon_ring_simulation
+from . import circle_ransac
+from . import batch_detection
+from . import hough
+from . import ring_metrics
+from . import prefilter
+from . import phs_output
+from . import catalog
+from . import instrumentation
 from . import detection_with_simple_ring_fit
-from . import psf_monitoring
-from . import analysis_utensils
+
+# The analysis and simulation subpackages pull in matplotlib, pandas, scoop
+# and more. They are only imported on first access, so the extraction on
+# the worker nodes does not pay for them.
+_lazy_submodules = [
+    'isdc_production',
+    'muon_ring_simulation',
+    'psf_monitoring',
+    'analysis_utensils',
+]
+
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError(
+        "module '{}' has no attribute '{}'".format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + _lazy_submodules)
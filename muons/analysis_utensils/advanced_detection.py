@@ -2,9 +2,10 @@ import numpy as np
 from muons.tools import circle_overlapp
 from muons.tools import tight_circle_on_off_region
 from muons.tools import xy2polar
+from muons.tools import ring_population_is_even
+from muons.tools import sigma_clipping_mask
 from circlehough.hough import main as hough_transform
-from skimage.measure import ransac
-from skimage.measure import CircleModel
+from muons.circle_ransac import circle_ransac
 
 
 deg2rad = np.deg2rad(1)
@@ -104,25 +105,8 @@ def detection(
 
 
 def cut_hist(nsb_cherenkov_photon_stream):
-    cherenkov_photons = []
-    r = np.sqrt(
-        nsb_cherenkov_photon_stream[:,0]**2
-        + nsb_cherenkov_photon_stream[:,1]**2
-    )
-    r_stedev = np.std(r)
-    r_average = np.average(r)
-    t_stdev = np.std(nsb_cherenkov_photon_stream[:,2])
-    t_average = np.average(nsb_cherenkov_photon_stream[:,2])
-    for photon in nsb_cherenkov_photon_stream:
-        photon_r = np.sqrt(photon[0]**2 + photon[1]**2)
-        if not (photon_r > r_average + 1.95*r_stedev) and not (
-            photon_r < r_average - 1.95*r_stedev
-        ):
-            if not (photon[2] > t_average + 1.95*t_stdev) and not (
-                photon[2] < t_average - 1.95*t_stdev
-            ):
-                cherenkov_photons.append(photon)
-    return np.array(cherenkov_photons)
+    mask = sigma_clipping_mask(nsb_cherenkov_photon_stream)
+    return nsb_cherenkov_photon_stream[mask]
 
 
 def check_photon_count(
@@ -148,16 +132,13 @@ def perform_circleModel(
 ):
     initial_circle_model_residual_threshold *= deg2rad
     try:
-        with np.errstate(invalid='ignore'):
-            circle_model, inliers = ransac(
-                data=full_clusters_fps[:, 0:2],  # only cx and cy not the time
-                model_class=CircleModel,
-                min_samples=initial_circle_model_min_samples,
-                residual_threshold=initial_circle_model_residual_threshold,
-                max_trials=initial_circle_model_max_trials)
-        cx = circle_model.params[0]
-        cy = circle_model.params[1]
-        r = circle_model.params[2]
+        (cx, cy, r), inliers = circle_ransac(
+            xy=full_clusters_fps[:, 0:2],  # only cx and cy not the time
+            residual_threshold=initial_circle_model_residual_threshold,
+            min_samples=initial_circle_model_min_samples,
+            max_trials=initial_circle_model_max_trials)
+        if np.isnan(r):
+            raise ValueError('No circle model found.')
         ret['muon_ring_cx'] = cx
         ret['muon_ring_cy'] = cy
         ret['muon_ring_r'] = r
@@ -384,21 +365,8 @@ def check_if_population_is_even(
     ring_population_hist,
     number_of_fraction_bins
 ):
-    is_populated_evenly = False
-    is_populated_at_all = False
-    most_even_population_std = 1e99
-    for i in range(ring_population_hist.shape[0]):
-        section = np.take(
-            ring_population_hist,
-            range(i, i+number_of_fraction_bins),
-            mode='wrap')
-        if (section > 0).sum() >= 0.5*number_of_fraction_bins:
-            is_populated_at_all = True
-            rel_std = section.std()/section.mean()
-            if rel_std < most_even_population_std:
-                most_even_population_std = rel_std
-    if is_populated_at_all and most_even_population_std < 0.8:
-        is_populated_evenly = True
+    is_populated_evenly = ring_population_is_even(
+        ring_population_hist, number_of_fraction_bins)
     if is_populated_evenly:
         ret['is_muon'] = True
     return ret
\ No newline at end of file
@@ -1,2 +1,3 @@
 from . import many_simulations
 from . import ring_simulation
+from . import pure_ring_cache
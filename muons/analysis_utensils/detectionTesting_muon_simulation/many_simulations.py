@@ -1,40 +1,44 @@
 import numpy as np
 from . import ring_simulation as rs
+from muons.muon_ring_simulation import simulation_truth
+from muons.muon_ring_simulation import eventsDistribution as ed
 
 
-def draw_position_on_aperture_plane(max_aperture_radius):
-    theta = np.random.uniform(
+def draw_position_on_aperture_plane(max_aperture_radius, prng=None):
+    prng = np.random if prng is None else prng
+    theta = prng.uniform(
         low=0,
         high=2 * np.pi)
-    b = np.random.uniform(
+    b = prng.uniform(
         low=0,
         high=1)
     return theta, np.sqrt(b)*max_aperture_radius
 
 
-def draw_inclination(low=0, high=np.pi/2, size=1):
+def draw_inclination(low=0, high=np.pi/2, size=1, prng=None):
+    prng = np.random if prng is None else prng
     v_min = (np.cos(low)+1)/2
     v_max = (np.cos(high)+1)/2
-    v = np.random.uniform(
-        low=v_min,
-        high=v_max,
-        size=size)
+    # v_max < v_min, which np.random.Generator.uniform() does not accept
+    v = v_min + (v_max - v_min)*prng.uniform(size=size)
     return np.arccos(2*v - 1)
 
 
-def draw_azimuth(low=0, high=2*np.pi, size=1):
-    return np.random.uniform(
+def draw_azimuth(low=0, high=2*np.pi, size=1, prng=None):
+    prng = np.random if prng is None else prng
+    return prng.uniform(
         low=low,
         high=high,
         size=size)
 
 
-def get_trajectory(max_inclination, max_aperture_radius):
+def get_trajectory(max_inclination, max_aperture_radius, prng=None):
     max_inclination = np.deg2rad(max_inclination)
-    inclination = draw_inclination(high=max_inclination)
-    azimuth = draw_azimuth()
+    inclination = draw_inclination(high=max_inclination, prng=prng)
+    azimuth = draw_azimuth(prng=prng)
     muon_direction_ground = rs.pol2cart(1, azimuth, inclination)
-    theta, b = draw_position_on_aperture_plane(max_aperture_radius)
+    theta, b = draw_position_on_aperture_plane(
+        max_aperture_radius, prng=prng)
     muon_support_ground = rs.pol2cart(b, theta, 0.5*np.pi)
     return muon_support_ground, muon_direction_ground
 
@@ -64,14 +68,24 @@ def create_jobs(
     fact_aperture_radius,
     random_seed,
     point_spread_function_std,
+    with_nsb=True,
 ):
+    """
+    Returns the jobs to simulate 'number_of_muons' muon rings. Each muon is
+    drawn from its own random streams of the 'random_seed', see
+    eventsDistribution.event_prng(), so the rings only depend on the
+    'random_seed' and the event id. Without 'with_nsb', only the pure
+    Cherenkov events are simulated.
+    """
     jobs = []
     for event_id in range(number_of_muons):
         job = {}
-        opening_angle = np.random.uniform(min_opening_angle, max_opening_angle)
+        prng = ed.event_prng(random_seed, event_id, ed.TRAJECTORY_STREAM)
+        opening_angle = prng.uniform(min_opening_angle, max_opening_angle)
         muon_support_ground, muon_direction_ground = get_trajectory(
             max_inclination,
-            max_aperture_radius
+            max_aperture_radius,
+            prng=prng
         )
         casual_muon_support, casual_muon_direction = casual_trajectory(
             muon_support_ground,
@@ -88,6 +102,7 @@ def create_jobs(
         job["random_seed"] = random_seed
         job["point_spread_function_std"] = point_spread_function_std
         job["muon_support_ground"] = muon_support_ground
+        job["with_nsb"] = with_nsb
         jobs.append(job)
     return jobs
 
@@ -102,47 +117,14 @@ def run_job(job):
         arrival_time_std=job["arrival_time_std"],
         ch_rate=job["ch_rate"],
         fact_aperture_radius=job["fact_aperture_radius"],
-        point_spread_function_std=job["point_spread_function_std"]
+        point_spread_function_std=job["point_spread_function_std"],
+        prng=ed.event_prng(
+            job["random_seed"], job["event_id"], ed.RESPONSE_STREAM),
+        with_nsb=job.get("with_nsb", True)
     )
     return {"pure_event": pure_event, "nsb_event": nsb_event}
 
 
 def write_to_csv(simTruthPath, simulationTruths):
-    with open(simTruthPath, "wt") as fout:
-        h = "casual_muon_support0,"
-        h += "casual_muon_support1,"
-        h += "casual_muon_support2,"
-        h += "casual_muon_direction0,"
-        h += "casual_muon_direction1,"
-        h += "casual_muon_direction2,"
-        h += "event_id,"
-        h += "nsb_rate_per_pixel,"
-        h += "ch_rate,"
-        h += "opening_angle,"
-        h += "fact_aperture_radius,"
-        h += "arrival_time_std,"
-        h += "random_seed,"
-        h += "point_spread_function_std,"
-        h += "muon_support_ground0,"
-        h += "muon_support_ground1\n"
-        fout.write(h)
-        for sT in simulationTruths:
-            s = "{:f},{:f},{:f},".format(
-                sT["casual_muon_support"][0],
-                sT["casual_muon_support"][1],
-                sT["casual_muon_support"][2])
-            s += "{:f},{:f},{:f},".format(
-                sT["casual_muon_direction"][0],
-                sT["casual_muon_direction"][1],
-                sT["casual_muon_direction"][2])
-            s += "{:d},".format(sT["event_id"])
-            s += "{:f},".format(sT["nsb_rate_per_pixel"])
-            s += "{:f},".format(sT["ch_rate"])
-            s += "{:f},".format(sT["opening_angle"])
-            s += "{:f},".format(sT["fact_aperture_radius"])
-            s += "{:f},".format(sT["arrival_time_std"])
-            s += "{:d},".format(sT["random_seed"])
-            s += "{:f},".format(sT["point_spread_function_std"])
-            s += "{:f},".format(sT["muon_support_ground"][0])
-            s += "{:f}\n".format(sT["muon_support_ground"][1])
-            fout.write(s)
+    simulation_truth.export_csv(
+        simTruthPath, simulation_truth.from_jobs(simulationTruths))
@@ -0,0 +1,79 @@
+"""
+A cache of simulated pure Cherenkov muon rings, i.e. without night sky
+background (NSB). The rings are keyed by their simulation parameters,
+including the random seed, so a scan over NSB rates simulates the rings
+once and overlays the NSB of each rate onto the same rings.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import photon_stream as ps
+from muons.muon_ring_simulation import eventsDistribution as ed
+from muons.muon_ring_simulation import single_simulation as rs
+
+# Bump when the simulation of the rings changes, to invalidate the cache.
+CACHE_VERSION = 2
+PURE_RINGS_FILENAME = 'pure.sim.phs'
+PARAMETERS_FILENAME = 'parameters.json'
+
+
+def cache_key(parameters):
+    """
+    Returns the key of the pure rings simulated with 'parameters', a dict
+    of JSON serializable simulation parameters.
+    """
+    keyed = dict(parameters, cache_version=CACHE_VERSION)
+    return hashlib.sha1(
+        json.dumps(keyed, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def cached_pure_rings(cache_dir, parameters, simulate):
+    """
+    Returns the path of the pure Cherenkov events simulated with
+    'parameters'. When they are not in the cache yet, 'simulate' is called
+    with a temporary directory inside 'cache_dir' and has to return the
+    path of the events it simulated there.
+    """
+    key_dir = os.path.join(cache_dir, cache_key(parameters))
+    pure_rings_path = os.path.join(key_dir, PURE_RINGS_FILENAME)
+    if os.path.exists(pure_rings_path):
+        return pure_rings_path
+    os.makedirs(cache_dir, exist_ok=True)
+    simulation_dir = tempfile.mkdtemp(prefix='.simulation_', dir=cache_dir)
+    try:
+        simulated_path = simulate(simulation_dir)
+        os.makedirs(key_dir, exist_ok=True)
+        with open(os.path.join(key_dir, PARAMETERS_FILENAME), 'wt') as fout:
+            json.dump(parameters, fout, indent=4, sort_keys=True)
+        os.replace(simulated_path, pure_rings_path)
+    finally:
+        shutil.rmtree(simulation_dir, ignore_errors=True)
+    return pure_rings_path
+
+
+def overlay_nsb_on_run(
+    pure_rings_path,
+    out_path,
+    nsb_rate_per_pixel,
+    random_seed
+):
+    """
+    Writes the events of 'pure_rings_path' with NSB of 'nsb_rate_per_pixel'
+    overlaid to 'out_path'. The NSB of each event is drawn from its own
+    random stream of 'random_seed' and its event id.
+    """
+    with open(out_path + '.temp', 'wb') as fout:
+        for event in ps.EventListReader(pure_rings_path):
+            prng = ed.event_prng(
+                random_seed,
+                int(event.simulation_truth.event),
+                ed.NSB_OVERLAY_STREAM)
+            event.photon_stream.raw = rs.overlay_nsb(
+                event.photon_stream.raw,
+                nsb_rate_per_pixel,
+                prng=prng)
+            ps.io.binary.append_event_to_file(event, fout)
+    os.replace(out_path + '.temp', out_path)
@@ -1,80 +1,13 @@
 import numpy as np
-import fact
-import scipy
 import photon_stream as ps
-import single_photon_extractor as spe
-
-
-def pol2cart(r, azimuth, inclination):
-    x = r * np.cos(azimuth) * np.sin(inclination)
-    y = r * np.sin(azimuth) * np.sin(inclination)
-    z = r * np.cos(inclination)
-    return np.array([float(x), float(y), float(z)])
-
-
-def position_on_ray(support, direction, alpha):
-    return support + np.multiply(alpha, direction)
-
-
-def get_d_alpha(ch_rate):
-    d_alpha = -np.log(np.random.uniform())/ch_rate
-    return d_alpha
-
-
-def emit_photons(
-    casual_muon_support,
-    casual_muon_direction,
-    opening_angle,
-    ch_rate
-):
-    casual_muon_support = np.array(casual_muon_support)
-    casual_muon_direction = np.array(casual_muon_direction)
-    path_length = 0
-    photon_emission_pos = []
-    photon_directions = []
-    u, v = get_u_v(casual_muon_direction)
-    while True:
-        d_alpha = get_d_alpha(ch_rate)
-        path_length += d_alpha
-        ch_emission_position = position_on_ray(
-            casual_muon_support,
-            casual_muon_direction,
-            path_length
-        )
-        if ch_emission_position[2] <= 0:
-            break
-        photon_emission_pos.append(ch_emission_position)
-        direction_of_photon = draw_direction_of_cherenkov_photon(
-            opening_angle,
-            u,
-            v,
-            casual_muon_direction)
-        photon_directions.append(direction_of_photon)
-    return np.array(photon_emission_pos), np.array(photon_directions)
-
-
-def get_u_v(direction):
-    dx, dz = direction[0], direction[2]
-    a = np.sqrt(1 / (1+((dx/dz)**2)))
-    b = np.sqrt(1 - a**2)
-    u = (a, 0, b)
-    v = np.cross(np.array(u), np.array(direction))
-    return np.array(u), v
-
-
-def draw_direction_of_cherenkov_photon(
-    opening_angle,
-    u,
-    v,
-    casual_muon_direction
-):
-    azimuth = np.random.uniform(
-        low=0,
-        high=2*np.pi)
-    position_on_ring = np.cos(azimuth)*u + np.sin(azimuth)*v
-    dist_on_mu_path = 1 / np.tan(opening_angle)
-    cherenkov_ph_dir = dist_on_mu_path*casual_muon_direction + position_on_ring
-    return cherenkov_ph_dir/np.linalg.norm(cherenkov_ph_dir)
+# The muon track, the Cherenkov emission, the pixel assignment and the raw
+# photon-stream are shared with the muon calibration simulation.
+from muons.muon_ring_simulation.single_simulation import pol2cart
+from muons.muon_ring_simulation.single_simulation import emit_photons
+from muons.muon_ring_simulation.single_simulation import fact_pixel_tree
+from muons.muon_ring_simulation.single_simulation import assign_to_pixels
+from muons.muon_ring_simulation.single_simulation import (
+    create_raw_photon_stream)
 
 
 def project_ch_photon_on_ground(
@@ -113,64 +46,42 @@ def perfect_imaging(
     return photon_directions[inside_aperture, 0:2]
 
 
-def create_fact_pixel_tree():
-    x_pos_mm, y_pos_mm = fact.instrument.get_pixel_coords()
-    x_angle = np.arctan(x_pos_mm/fact.instrument.constants.FOCAL_LENGTH_MM)
-    y_angle = np.arctan(y_pos_mm/fact.instrument.constants.FOCAL_LENGTH_MM)
-    return scipy.spatial.KDTree(np.c_[x_angle, y_angle])
-
-
-def artificial_point_spread_function(number_photons, standard_dev):
-    return np.random.normal(
+def artificial_point_spread_function(number_photons, standard_dev, prng=None):
+    prng = np.random if prng is None else prng
+    return prng.normal(
         loc=0,
         scale=standard_dev,
         size=(number_photons, 2))
 
 
-def assign_to_pixels(
-    photons_cx_cy,
-    pixel_position_tree,
-    pixel_radius=np.deg2rad(fact.instrument.camera.FOV_PER_PIXEL_DEG)/2
-):
-    distances, pixel_CHIDs = pixel_position_tree.query(
-        photons_cx_cy)
-    inside_field_of_view = distances <= pixel_radius
-    return inside_field_of_view, pixel_CHIDs
-
-
 def arrival_times_for_cherenkov_photons_from_muon(
     number_photons,
-    arrival_time_std
+    arrival_time_std,
+    prng=None
 ):
-    return np.random.normal(
+    prng = np.random if prng is None else prng
+    return prng.normal(
         loc=0.0,
         scale=arrival_time_std,
         size=number_photons)
 
 
-def create_raw_photon_stream(pixel_CHIDs, arrival_times, nsb_rate_per_pixel):
-    arrival_slices = np.round(
-        arrival_times/ps.io.magic_constants.TIME_SLICE_DURATION_S).astype(
-            np.int)
-    lol = spe.air_shower_classification.air_shower_classification.generate_nsb(
-        nsb_rate_per_pixel
-    )
-    for i in range(len(lol)):
-        lol[i] = list(lol[i])
-    for photon, chid in enumerate(pixel_CHIDs):
-        lol[chid].append(arrival_slices[photon])
-    return ps.representations.list_of_lists_to_raw_phs(lol)
-
-
-def create_event(arrival_times, ch_CHIDs, event_id, nsb_rate_per_pixel):
-    arrival_times += 22e-9
+def create_event(
+    arrival_times,
+    ch_CHIDs,
+    event_id,
+    nsb_rate_per_pixel,
+    prng=None
+):
+    arrival_times = arrival_times + 22e-9
     phs = ps.PhotonStream()
     phs.slice_duration = np.float32(
         ps.io.magic_constants.TIME_SLICE_DURATION_S)
     phs.raw = create_raw_photon_stream(
         ch_CHIDs,
         arrival_times,
-        nsb_rate_per_pixel)
+        nsb_rate_per_pixel,
+        prng=prng)
     event = ps.Event()
     event.photon_stream = phs
     event.photon_stream.saturated_pixels = np.zeros(0, dtype=np.uint16)
@@ -193,29 +104,42 @@ def simulate_response(
     arrival_time_std,
     ch_rate,
     fact_aperture_radius,
-    point_spread_function_std
+    point_spread_function_std,
+    prng=None,
+    with_nsb=True
 ):
+    """
+    Returns the pure Cherenkov event of a muon and the same event with night
+    sky background, or None instead of the latter without 'with_nsb'. All
+    random numbers are drawn from 'prng', a np.random.Generator, or from
+    the global np.random state when None.
+    """
     ch_sup, ch_dir = emit_photons(
         casual_muon_support,
         casual_muon_direction,
         opening_angle,
-        ch_rate)
+        ch_rate,
+        prng=prng)
     photons_cx_cy = perfect_imaging(
         ch_sup,
         ch_dir,
         aperture_radius=fact_aperture_radius)
     fuzz_cx_cy = photons_cx_cy + artificial_point_spread_function(
         number_photons=photons_cx_cy.shape[0],
-        standard_dev=point_spread_function_std)
+        standard_dev=point_spread_function_std,
+        prng=prng)
     inside_pixels, ch_CHIDs = assign_to_pixels(
         fuzz_cx_cy,
-        create_fact_pixel_tree())
+        fact_pixel_tree())
     ch_CHIDs = ch_CHIDs[inside_pixels]
     arrival_times = arrival_times_for_cherenkov_photons_from_muon(
         number_photons=ch_CHIDs.shape[0],
-        arrival_time_std=arrival_time_std)
+        arrival_time_std=arrival_time_std,
+        prng=prng)
     pure_event = create_event(
         arrival_times, ch_CHIDs, event_id, 0)
+    if not with_nsb:
+        return pure_event, None
     nsb_event = create_event(
-        arrival_times, ch_CHIDs, event_id, nsb_rate_per_pixel)
+        arrival_times, ch_CHIDs, event_id, nsb_rate_per_pixel, prng=prng)
     return pure_event, nsb_event
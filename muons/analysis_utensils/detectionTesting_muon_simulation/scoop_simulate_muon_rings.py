@@ -2,7 +2,7 @@
 Simulate muon rings
 Call with 'python -m scoop --hostfile scoop_hosts.txt'
 
-Usage: scoop_simulate_muon_rings.py --output_dir=DIR --number_of_muons=NBR --max_inclination=ANGL --max_aperture_radius=RDS [--min_opening_angle=ANGL] [--max_opening_angle=ANGL] [--nsb_rate_per_pixel=NBR] [--arrival_time_std=STD] [--ch_rate=CHR] [--fact_aperture_radius=RDS] [--random_seed=INT] [--point_spread_function_std=FLT] [--test_detection=BOOL]
+Usage: scoop_simulate_muon_rings.py --output_dir=DIR --number_of_muons=NBR --max_inclination=ANGL --max_aperture_radius=RDS [--min_opening_angle=ANGL] [--max_opening_angle=ANGL] [--nsb_rate_per_pixel=NBR] [--arrival_time_std=STD] [--ch_rate=CHR] [--fact_aperture_radius=RDS] [--random_seed=INT] [--point_spread_function_std=FLT] [--test_detection=BOOL] [--pure_only]
 
 Options:
     --output_dir=DIR                   The output directory for simulations
@@ -18,6 +18,7 @@ Options:
     --random_seed=INT                  [default: 1] Random seed
     --point_spread_function_std=FLT    [default: 0] Standard deviation of the point spread function
     --test_detection=BOOL              [default:False] For checking the efficiency of cherenkov photon detection
+    --pure_only                        Only simulate the pure Cherenkov events, written to 'output_dir/pure'
 """
 import docopt
 import scoop
@@ -33,7 +34,7 @@ def main():
         arguments = docopt.docopt(__doc__)
         rndm_seed = int(arguments['--random_seed'])
         test_detection = arguments['--test_detection']
-        np.random.seed(seed=rndm_seed)
+        pure_only = arguments['--pure_only']
         jobs = muons.analysis_utensils.detectionTesting_muon_simulation.many_simulations.create_jobs(
             number_of_muons=int(
                 arguments['--number_of_muons']),
@@ -55,8 +56,9 @@ def main():
                 arguments['--fact_aperture_radius']),
             random_seed=rndm_seed,
             point_spread_function_std=np.deg2rad(float(
-                arguments['--point_spread_function_std'])
-        ))
+                arguments['--point_spread_function_std'])),
+            with_nsb=not pure_only
+        )
         events = list(
             scoop.futures.map(
                 muons.analysis_utensils.detectionTesting_muon_simulation.many_simulations.run_job,
@@ -66,7 +68,10 @@ def main():
         pure_events = [event.get("pure_event") for event in events]
         nsb_events = [event.get("nsb_event") for event in events]
         output_dir = arguments["--output_dir"]
-        if test_detection:
+        if pure_only:
+            save_file(
+                os.path.join(output_dir, "pure"), arguments, pure_events, jobs)
+        elif test_detection:
             save_file(
                 os.path.join(output_dir, "pure"), arguments, pure_events, jobs)
             save_file(
@@ -87,10 +92,11 @@ def save_file(output_dir, arguments, events, jobs):
         ".simulationtruth.csv"]
     )
     simTruthPath = os.path.join(output_dir, simTruthFilename)
-    muons.analysis_utensils.detectionTesting_muon_simulation.many_simulations.write_to_csv(
-        simTruthPath+".temp",
-        jobs
-    )
+    truth = muons.muon_ring_simulation.simulation_truth.from_jobs(jobs)
+    muons.muon_ring_simulation.simulation_truth.write(
+        simTruthPath[:-len(".csv")] + ".npy", truth)
+    muons.muon_ring_simulation.simulation_truth.export_csv(
+        simTruthPath + ".temp", truth)
     simulationFileName = "".join([
         "psf_",
         arguments["--point_spread_function_std"],
@@ -0,0 +1,62 @@
+import os
+import tempfile
+from muons.analysis_utensils.detectionTesting_muon_simulation import (
+    pure_ring_cache)
+
+
+def test_pure_rings_are_simulated_once_for_each_parameters():
+    simulated = []
+
+    def simulate(simulation_dir):
+        path = os.path.join(simulation_dir, 'psf_0.sim.phs')
+        with open(path, 'wb') as fout:
+            fout.write(str(len(simulated)).encode())
+        simulated.append(path)
+        return path
+
+    parameters = {'number_of_muons': 3, 'random_seed': 1}
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        first = pure_ring_cache.cached_pure_rings(tmp, parameters, simulate)
+        again = pure_ring_cache.cached_pure_rings(
+            tmp, dict(parameters), simulate)
+        other_seed = pure_ring_cache.cached_pure_rings(
+            tmp, dict(parameters, random_seed=2), simulate)
+        assert first == again
+        assert first != other_seed
+        assert len(simulated) == 2
+        with open(first, 'rb') as fin:
+            assert fin.read() == b'0'
+        assert len(os.listdir(tmp)) == 2
+
+
+def test_muon_rings_depend_only_on_the_random_seed():
+    import numpy as np
+    from muons.analysis_utensils.detectionTesting_muon_simulation import (
+        many_simulations)
+
+    def create_jobs(random_seed):
+        return many_simulations.create_jobs(
+            number_of_muons=5,
+            max_inclination=4.5,
+            max_aperture_radius=4,
+            min_opening_angle=np.deg2rad(0.4),
+            max_opening_angle=np.deg2rad(1.6),
+            nsb_rate_per_pixel=35e6,
+            arrival_time_std=500e-12,
+            ch_rate=3.0,
+            fact_aperture_radius=1.965,
+            random_seed=random_seed,
+            point_spread_function_std=0.0,
+            with_nsb=False)
+
+    np.random.seed(0)
+    jobs = create_jobs(random_seed=1)
+    np.random.seed(1)
+    again = create_jobs(random_seed=1)
+    other_seed = create_jobs(random_seed=2)
+    for job, job_again, job_other in zip(jobs, again, other_seed):
+        assert job['opening_angle'] == job_again['opening_angle']
+        np.testing.assert_array_equal(
+            job['casual_muon_support'], job_again['casual_muon_support'])
+        assert job['opening_angle'] != job_other['opening_angle']
+        assert not job['with_nsb']
@@ -1,5 +1,6 @@
 import photon_stream as ps
 import numpy as np
+from muons.ring_metrics import radial_distances
 import os
 import json
 from pathlib import Path
@@ -12,13 +13,9 @@ warnings.filterwarnings("ignore")
 
 
 def standard_deviation(point_cloud, muon_props):
-    x_loc = point_cloud[:, 0]
-    y_loc = point_cloud[:, 1]
-    difference = [x_loc - muon_props["muon_ring_cx"],
-                  y_loc - muon_props["muon_ring_cy"]]
-    deviation_from_fit = (np.sqrt(np.square(difference[0])
-                          + np.square(difference[1]))
-                          - muon_props["muon_ring_r"])
+    distances = radial_distances(
+        point_cloud, muon_props["muon_ring_cx"], muon_props["muon_ring_cy"])
+    deviation_from_fit = distances - np.asarray(muon_props["muon_ring_r"])
     real_std = np.std(deviation_from_fit)
     return real_std
 
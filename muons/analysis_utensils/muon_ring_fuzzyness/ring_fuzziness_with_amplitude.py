@@ -1,5 +1,7 @@
 import photon_stream as ps
 import numpy as np
+from muons.ring_metrics import radial_distances
+from muons.ring_metrics import hough_response
 import os
 import json
 from pathlib import Path
@@ -18,20 +20,10 @@ def evaluate_ring(
     r,
     hough_epsilon=np.deg2rad(0.5*0.1111)
 ):
-    total_amplitude = 0
-    point_positions_max = point_positions.shape[0]
-    for i_point in range(point_positions_max):
-        point_x = point_positions[i_point, 0]
-        point_y = point_positions[i_point, 1]
-        r_point = calculate_point_distance(
-            ring_cx=cx, ring_cy=cy,
-            point_x=point_x, point_y=point_y)
-        point_contribution = apply_triangular_evaluation(
-            ring_radius=r, amplitude=1,
-            r_point=r_point, hough_epsilon=hough_epsilon)
-        total_amplitude += point_contribution
-        normed_amplitude = total_amplitude/point_positions_max
-    return normed_amplitude
+    return hough_response(
+        distances=radial_distances(point_positions, cx, cy),
+        r=r,
+        hough_epsilon=hough_epsilon)
 
 
 def calculate_point_distance(
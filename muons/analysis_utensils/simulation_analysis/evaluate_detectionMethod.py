@@ -11,6 +11,7 @@ import matplotlib.pyplot as plt
 import glob
 from numbers import Number
 from muons.analysis_utensils import detectionTesting_muon_simulation as mrs
+from muons.tools import sigma_clipping_mask
 
 
 class DetectionMethodEvaluation:
@@ -18,13 +19,15 @@ class DetectionMethodEvaluation:
     """ Evaluate detection method """
 
     def __init__(
-        self, output_dir, number_of_muons, steps, step_size, scoop_hosts
+        self, output_dir, number_of_muons, steps, step_size, scoop_hosts,
+        random_seed=1, cache_dir=None
     ):
         self.output_dir = output_dir
         self.number_of_muons = number_of_muons
         self.steps = steps
         self.step_size = step_size
         self.scoop_hosts = scoop_hosts
+        self.random_seed = random_seed
         self.check_input_correctness()
         self.scoop_simulateFile = self.get_scoop_simulate_muon_rings_path()
         self.simulation_dir = os.path.join(self.output_dir, "simulations")
@@ -32,6 +35,9 @@ class DetectionMethodEvaluation:
             self.simulation_dir, "pure")
         self.nsb_dir = os.path.join(
             self.simulation_dir, "NSB")
+        if cache_dir is None:
+            cache_dir = os.path.join(self.output_dir, "pure_ring_cache")
+        self.cache_dir = cache_dir
         self.create_outputDir()
 
 
@@ -72,38 +78,45 @@ class DetectionMethodEvaluation:
             os.makedirs(self.output_dir)
 
 
-    def run_simulation(self, simulation_dir, nsb_rate=35e6):
+    def run_simulation(self, simulation_dir, nsb_rate=35e6, pure_only=False):
         scoopList = [
             "python", "-m", "scoop", "--hostfile",
             self.scoop_hosts, self.scoop_simulateFile, "--output_dir",
             str(simulation_dir), "--number_of_muons",
             str(self.number_of_muons), "--max_inclination", str(4.5),
             "--max_aperture_radius", str(4), "--test_detection", str(True),
-            "--nsb_rate_per_pixel", str(nsb_rate)
+            "--nsb_rate_per_pixel", str(nsb_rate),
+            "--random_seed", str(self.random_seed)
         ]
+        if pure_only:
+            scoopList.append("--pure_only")
         subprocess.call(scoopList)
 
 
+    def simulation_parameters(self):
+        return {
+            "number_of_muons": self.number_of_muons,
+            "max_inclination": 4.5,
+            "max_aperture_radius": 4,
+            "random_seed": self.random_seed,
+        }
+
+
+    def simulate_pure_rings(self):
+        """
+        Returns the path of the pure Cherenkov events, which are simulated
+        only once for all NSB rates and kept in the cache_dir.
+        """
+        def simulate(simulation_dir):
+            self.run_simulation(simulation_dir, pure_only=True)
+            return os.path.join(simulation_dir, "pure", "psf_0.sim.phs")
+        return mrs.pure_ring_cache.cached_pure_rings(
+            self.cache_dir, self.simulation_parameters(), simulate)
+
+
     def cut_hist(self, nsb_cherenkov_photon_stream):
-        cherenkov_photons = []
-        r = np.sqrt(
-            nsb_cherenkov_photon_stream[:,0]**2
-            + nsb_cherenkov_photon_stream[:,1]**2
-        )
-        r_stedev = np.std(r)
-        r_average = np.average(r)
-        t_stdev = np.std(nsb_cherenkov_photon_stream[:,2])
-        t_average = np.average(nsb_cherenkov_photon_stream[:,2])
-        for photon in nsb_cherenkov_photon_stream:
-            photon_r = np.sqrt(photon[0]**2 + photon[1]**2)
-            if not (photon_r > r_average + 1.95*r_stedev) and not (
-                photon_r < r_average - 1.95*r_stedev
-            ):
-                if not (photon[2] > t_average + 1.95*t_stdev) and not (
-                    photon[2] < t_average - 1.95*t_stdev
-                ):
-                    cherenkov_photons.append(photon)
-        return cherenkov_photons
+        mask = sigma_clipping_mask(nsb_cherenkov_photon_stream)
+        return nsb_cherenkov_photon_stream[mask]
 
 
     def do_clustering(
@@ -234,11 +247,13 @@ class DetectionMethodEvaluation:
         simulation_dir = os.path.join(output_dir, "simulation")
         if not os.path.isdir(simulation_dir):
             os.makedirs(simulation_dir)
-        self.run_simulation(simulation_dir, nsb_rate)
-        pure_cherenkov_events_path = os.path.join(
-            simulation_dir, "pure", "psf_0.sim.phs")
-        events_with_nsb_path = os.path.join(
-            simulation_dir, "NSB", "psf_0.sim.phs")
+        pure_cherenkov_events_path = self.simulate_pure_rings()
+        events_with_nsb_path = os.path.join(simulation_dir, "psf_0.sim.phs")
+        mrs.pure_ring_cache.overlay_nsb_on_run(
+            pure_cherenkov_events_path,
+            events_with_nsb_path,
+            nsb_rate_per_pixel=nsb_rate,
+            random_seed=self.random_seed)
         clustering_results = self.do_clustering(
             pure_cherenkov_events_path, events_with_nsb_path)
         events = self.true_false_decisions(
@@ -6,11 +6,11 @@ from muons.detection_with_simple_ring_fit import (
     detection_with_simple_ring_fit as dwsrf)
 from muons.detection import detection
 import os
-import pandas
 import docopt
 import sys
 from muons.analysis_utensils.simulation_analysis import (
     plot_single_simulation as pss)
+from muons.muon_ring_simulation import simulation_truth
 
 
 class ExtractionMethod_Evaluation:
@@ -25,6 +25,7 @@ class ExtractionMethod_Evaluation:
         self.simulationTruth_path = simulationTruth_path
         self.output_dir = output_dir
         self.check_for_correct_input()
+        self.simulation_truth_by_event_id = None
 
 
     def check_for_correct_input(self):
@@ -34,9 +35,12 @@ class ExtractionMethod_Evaluation:
         if ".sim.phs" not in self.simulationFile:
             raise ValueError(
                 "Entered path to simulation file is not '.sim.phs' file")
-        if "simulationtruth.csv" not in self.simulationTruth_path:
+        if not self.simulationTruth_path.endswith(
+            (simulation_truth.NPY_SUFFIX, simulation_truth.CSV_SUFFIX)
+        ):
             raise ValueError(
-                "Simulationtruth file not ending with 'simulationtruth.csv'")
+                "Simulationtruth file not ending with 'simulationtruth.npy'"
+                " or 'simulationtruth.csv'")
         if not os.path.exists(self.simulationTruth_path):
             raise ValueError(
                 "Entered path to simulationtruth file does not exist")
@@ -113,11 +117,14 @@ class ExtractionMethod_Evaluation:
 
 
     def read_cx_cy_from_simulationTruth(self, eventId):
-        simulationTruth = pandas.read_csv(self.simulationTruth_path)
-        muon_ring_cx = float(simulationTruth.loc[
-            simulationTruth["event_id"] == eventId, "casual_muon_direction0"])
-        muon_ring_cy = float(simulationTruth.loc[
-            simulationTruth["event_id"] == eventId, "casual_muon_direction1"])
+        # The simulation truth is read once, and indexed by event_id.
+        if self.simulation_truth_by_event_id is None:
+            self.simulation_truth_by_event_id = (
+                simulation_truth.index_by_event_id(
+                    simulation_truth.read(self.simulationTruth_path)))
+        truth = self.simulation_truth_by_event_id[eventId]
+        muon_ring_cx = float(truth["casual_muon_direction0"])
+        muon_ring_cy = float(truth["casual_muon_direction1"])
         return muon_ring_cx, muon_ring_cy
 
 
@@ -7,6 +7,8 @@ import docopt
 import os
 import sys
 import csv
+from muons.muon_ring_simulation import (
+    simulation_truth as simulation_truth_store)
 
 
 
@@ -51,7 +53,8 @@ class SingleSimulatonPlotting:
 
 
     def read_dataframes(self):
-        simulation_truth = pandas.read_csv(self.simulationTruth_path)
+        simulation_truth = pandas.DataFrame(
+            simulation_truth_store.read(self.simulationTruth_path))
         extracted_muons = pandas.read_csv(self.reconstructed_muons_path)
         return simulation_truth, extracted_muons
 
@@ -0,0 +1,248 @@
+import numpy as np
+from .circle_ransac import circle_ransac
+from .tools import circle_overlapp_array
+from .tools import segment_ids
+from .tools import segment_sum
+from .tools import segment_mean_std
+from .tools import ring_population_is_even_batch
+
+deg2rad = np.deg2rad(1)
+
+muon_features_dtype = np.dtype([
+    ('is_muon', np.bool_),
+    ('number_of_photons', np.uint32),
+    ('muon_ring_cx', np.float64),
+    ('muon_ring_cy', np.float64),
+    ('muon_ring_r', np.float64),
+    ('muon_ring_overlapp_with_field_of_view', np.float64),
+    ('arrival_time_stddev', np.float64),
+    ('mean_arrival_time_muon_cluster', np.float64),
+    ('initial_circle_model_photon_ratio', np.float64),
+    ('visible_muon_ring_circumfance', np.float64),
+    ('density_circle_model_on_off_ratio', np.float64),
+    ('density_circle_model_inner_ratio', np.float64)])
+
+
+def concatenate_point_clouds(point_clouds):
+    """
+    Returns the flat concatenation of a list of point clouds together with
+    the offsets of the individual point clouds in it.
+
+    Parameter
+    ---------
+    point_clouds    List of np.arrays shape=(N_i, 3), e.g. the Cherenkov
+                    photons 'clusters.point_cloud[clusters.labels >= 0]' of
+                    many events.
+    """
+    offsets = np.zeros(len(point_clouds) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([pc.shape[0] for pc in point_clouds])
+    if len(point_clouds) == 0:
+        return np.zeros(shape=(0, 3)), offsets
+    return np.concatenate(point_clouds, axis=0), offsets
+
+
+def batch_detection(
+    point_cloud,
+    offsets,
+    field_of_view_radius,
+    initial_circle_model_min_samples=3,
+    initial_circle_model_residual_threshold=0.25,
+    initial_circle_model_max_trails=15,
+    initial_circle_model_min_photon_ratio=0.6,
+    density_circle_model_residual_threshold=0.20,
+    density_circle_model_min_on_off_ratio=3.5,
+    density_circle_model_max_ratio_photon_inside_ring=0.25,
+    min_circumference_of_muon_ring_in_field_of_view=1.5,
+    max_arrival_time_stddev=5e-9,
+    min_overlap_of_muon_ring_with_field_of_view=0.2,
+    min_muon_ring_radius=0.45,
+    max_muon_ring_radius=1.6,
+    random_state=None
+):
+    """
+    Detects muon events in a batch of many events.
+    Applies the same cuts as detection_with_simple_ring_fit() but evaluates
+    them with segment reductions over all events at once. Only the initial
+    circle fit is done event by event.
+    A structured array of muon features with dtype 'muon_features_dtype' is
+    returned, one row for each event. Features are evaluated for all events
+    with a ring fit, also when an earlier cut already failed. Features which
+    could not be evaluated are NaN.
+
+    Parameter
+    ---------
+
+    point_cloud             np.array shape=(N, 3)
+                            The concatenated Cherenkov photons (cx, cy, t)
+                            of all events.
+
+    offsets                 np.array shape=(number_events + 1, )
+                            Start of each event in 'point_cloud' followed
+                            by N, see concatenate_point_clouds().
+
+    field_of_view_radius    Radius of the field of view.
+
+    random_state            Seed for the initial circle model of each event,
+                            or a np.random.RandomState shared by all events.
+                            With a seed, each event gets its own
+                            np.random.RandomState(seed), so its result does
+                            not depend on the other events in the batch.
+                            None uses the global np.random state.
+    """
+    initial_circle_model_residual_threshold *= deg2rad
+    density_circle_model_residual_threshold *= deg2rad
+    min_muon_ring_radius *= deg2rad
+    max_muon_ring_radius *= deg2rad
+    min_circumference_of_muon_ring_in_field_of_view *= deg2rad
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    number_events = offsets.shape[0] - 1
+    ids = segment_ids(offsets)
+    number_of_photons = np.diff(offsets)
+
+    ret = np.zeros(number_events, dtype=muon_features_dtype)
+    for name in muon_features_dtype.names[2:]:
+        ret[name] = np.nan
+    ret['number_of_photons'] = number_of_photons
+
+    # initial circle model
+    # --------------------
+    number_of_ring_photons = np.zeros(number_events)
+    has_ring = number_of_photons >= initial_circle_model_min_samples
+    for e in np.flatnonzero(has_ring):
+        (cx, cy, r), inliers = circle_ransac(
+            xy=point_cloud[offsets[e]:offsets[e + 1], 0:2],
+            residual_threshold=initial_circle_model_residual_threshold,
+            min_samples=initial_circle_model_min_samples,
+            max_trials=initial_circle_model_max_trails,
+            random_state=random_state)
+        ret['muon_ring_cx'][e] = cx
+        ret['muon_ring_cy'][e] = cy
+        ret['muon_ring_r'][e] = r
+        number_of_ring_photons[e] = inliers.sum()
+
+    cx = ret['muon_ring_cx']
+    cy = ret['muon_ring_cy']
+    r = ret['muon_ring_r']
+
+    has_ring &= ~np.isnan(ret['muon_ring_r'])
+    is_muon = has_ring.copy()
+    with np.errstate(invalid='ignore'):
+        is_muon &= r >= min_muon_ring_radius
+        is_muon &= r <= max_muon_ring_radius
+
+    overlapp = circle_overlapp_array(
+        cx1=0.0,
+        cy1=0.0,
+        r1=field_of_view_radius,
+        cx2=cx,
+        cy2=cy,
+        r2=r)
+    overlapp[~has_ring] = np.nan
+    ret['muon_ring_overlapp_with_field_of_view'] = overlapp
+    with np.errstate(invalid='ignore'):
+        is_muon &= overlapp >= min_overlap_of_muon_ring_with_field_of_view
+
+    # arrival time
+    # ------------
+    mean_t, std_t = segment_mean_std(point_cloud[:, 2], ids, number_events)
+    ret['arrival_time_stddev'][has_ring] = std_t[has_ring]
+    ret['mean_arrival_time_muon_cluster'][has_ring] = mean_t[has_ring]
+    with np.errstate(invalid='ignore'):
+        is_muon &= std_t <= max_arrival_time_stddev
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        photon_ratio = number_of_ring_photons/number_of_photons
+    ret['initial_circle_model_photon_ratio'][has_ring] = photon_ratio[has_ring]
+    with np.errstate(invalid='ignore'):
+        is_muon &= photon_ratio >= initial_circle_model_min_photon_ratio
+
+    visible_ring_circumfance = r*2*np.pi*overlapp
+    ret['visible_muon_ring_circumfance'] = visible_ring_circumfance
+    with np.errstate(invalid='ignore'):
+        is_muon &= (
+            visible_ring_circumfance >=
+            min_circumference_of_muon_ring_in_field_of_view)
+
+    # circle model ON/OFF ratio
+    # -------------------------
+    x = point_cloud[:, 0] - cx[ids]
+    y = point_cloud[:, 1] - cy[ids]
+    R = np.sqrt(x*x + y*y)
+    r_photon = r[ids]
+    t = density_circle_model_residual_threshold
+
+    r_inner_off_start = r - 1.5*t
+    r_on_start = r - 0.5*t
+    r_on_end = r + 0.5*t
+    r_outer_off_end = r + 1.5*t
+
+    A_inner_off = np.pi*(r_on_start**2 - r_inner_off_start**2)
+    A_on = np.pi*(r_on_end**2 - r_on_start**2)
+    A_outer_off = np.pi*(r_outer_off_end**2 - r_on_end**2)
+
+    with np.errstate(invalid='ignore'):
+        on = (R > r_photon - 0.5*t)*(R <= r_photon + 0.5*t)
+        inner_off = (R > r_photon - 1.5*t)*(R <= r_photon - 0.5*t)
+        outer_off = (R > r_photon + 0.5*t)*(R <= r_photon + 1.5*t)
+        inside_off = R < r_photon - 0.5*t
+
+    on_density = segment_sum(on, ids, number_events)/A_on
+    inner_off_density = segment_sum(
+        inner_off, ids, number_events)/A_inner_off
+    outer_off_density = segment_sum(
+        outer_off, ids, number_events)/A_outer_off
+    off_density = (outer_off_density + inner_off_density)/2
+
+    is_muon &= off_density > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        on_off_ratio = on_density/off_density
+    on_off_ratio[off_density == 0] = np.nan
+    ret['density_circle_model_on_off_ratio'] = on_off_ratio
+    with np.errstate(invalid='ignore'):
+        is_muon &= on_off_ratio >= density_circle_model_min_on_off_ratio
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio_inside_circle = segment_sum(
+            inside_off, ids, number_events)/number_of_photons
+    ret['density_circle_model_inner_ratio'][has_ring] = (
+        ratio_inside_circle[has_ring])
+    with np.errstate(invalid='ignore'):
+        is_muon &= (
+            ratio_inside_circle <=
+            density_circle_model_max_ratio_photon_inside_ring)
+
+    # ring population
+    # ----------------
+    phi = np.arctan2(y, x)
+    number_bins = 3*np.ceil(np.sqrt(number_of_photons)).astype(np.int64)
+    number_hist_bins = np.maximum(number_bins - 1, 0)
+    hist_offsets = np.zeros(number_events + 1, dtype=np.int64)
+    hist_offsets[1:] = np.cumsum(number_hist_bins)
+
+    candidates = np.flatnonzero(is_muon)
+    photon_is_candidate = is_muon[ids]
+    bin_width = 2*np.pi/number_hist_bins[ids[photon_is_candidate]]
+    phi_bin = np.floor(
+        (phi[photon_is_candidate] + np.pi)/bin_width).astype(np.int64)
+    phi_bin = np.clip(
+        phi_bin, 0, number_hist_bins[ids[photon_is_candidate]] - 1)
+    ring_population_hists = np.bincount(
+        hist_offsets[ids[photon_is_candidate]] + phi_bin,
+        minlength=hist_offsets[-1])
+
+    min_ring_circumfance = 2.5*deg2rad
+    with np.errstate(invalid='ignore', divide='ignore'):
+        min_ring_fraction = np.maximum(
+            min_ring_circumfance/(2*r*np.pi), 0.33)
+    number_of_fraction_bins = np.zeros(number_events, dtype=np.int64)
+    number_of_fraction_bins[candidates] = np.round(
+        min_ring_fraction[candidates]*number_bins[candidates])
+    is_even = ring_population_is_even_batch(
+        ring_population_hists=ring_population_hists,
+        hist_offsets=hist_offsets,
+        number_of_fraction_bins=number_of_fraction_bins)
+    is_muon &= is_even
+
+    ret['is_muon'] = is_muon
+    return ret
@@ -0,0 +1,231 @@
+"""
+Usage: phs_muon_catalog --muon_dir=DIR --catalog_dir=DIR
+
+Options:
+    --muon_dir=DIR      The output directory of the muon extraction. All
+                        '*_muons.info' files below are ingested.
+    --catalog_dir=DIR   The directory of the catalog. Created if not
+                        existing, updated otherwise.
+
+Merges the run headers '*_muons.info' of all extracted runs into one
+catalog. The catalog is sorted by (Night, Run, Event) and stores each column
+of extraction.header_dtype in its own '.npy' file, which is read as a
+np.memmap. Only new or modified runs are read on an update.
+"""
+import docopt
+import glob
+import json
+import os
+import numpy as np
+from .extraction import header_dtype
+
+KEY_RUN_BITS = 12
+KEY_EVENT_BITS = 20
+INDEXED_COLUMNS = ['UnixTime_s', 'ring_radius']
+MANIFEST_FILENAME = 'ingested.json'
+
+
+def pack_key(night, run, event):
+    """
+    Returns the uint64 key (Night << 32 | Run << 20 | Event), which sorts
+    events by night, run and event.
+    """
+    night = np.asarray(night, dtype=np.uint64)
+    run = np.asarray(run, dtype=np.uint64)
+    event = np.asarray(event, dtype=np.uint64)
+    if np.any(run >= 2**KEY_RUN_BITS) or np.any(event >= 2**KEY_EVENT_BITS):
+        raise ValueError(
+            'Run must be < {:d} and Event < {:d} to be packed.'.format(
+                2**KEY_RUN_BITS, 2**KEY_EVENT_BITS))
+    return (
+        (night << np.uint64(KEY_RUN_BITS + KEY_EVENT_BITS)) |
+        (run << np.uint64(KEY_EVENT_BITS)) |
+        event)
+
+
+def update_catalog(muon_dir, catalog_dir):
+    """
+    Adds the '*_muons.info' files below 'muon_dir' which are new or were
+    modified since the last update to the catalog in 'catalog_dir'.
+    The rows of a modified file replace the rows it contributed before.
+    Returns the number of files ingested.
+
+    Parameter
+    ---------
+    muon_dir        The output directory of the muon extraction.
+
+    catalog_dir     The directory of the catalog.
+    """
+    os.makedirs(catalog_dir, exist_ok=True)
+    manifest_path = os.path.join(catalog_dir, MANIFEST_FILENAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'rt') as fin:
+            manifest = json.load(fin)
+
+    info_paths = sorted(glob.glob(
+        os.path.join(muon_dir, '**', '*_muons.info'), recursive=True))
+    new_rows = []
+    replaced_runs = []
+    ingested = {}
+    for path in info_paths:
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        state = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        previous = manifest.get(path)
+        if (
+            previous is not None and
+            previous['size'] == state['size'] and
+            previous['mtime'] == state['mtime']
+        ):
+            continue
+        if previous is not None:
+            replaced_runs += previous['runs']
+        rows = np.fromfile(path, dtype=header_dtype)
+        state['runs'] = np.unique(
+            np.c_[rows['Night'], rows['Run']], axis=0).tolist()
+        new_rows.append(rows)
+        ingested[path] = state
+
+    if len(ingested) == 0:
+        return 0
+
+    new_rows = np.concatenate(new_rows)
+    new_keys = pack_key(new_rows['Night'], new_rows['Run'], new_rows['Event'])
+    order = np.argsort(new_keys, kind='stable')
+    new_keys = new_keys[order]
+    new_rows = new_rows[order]
+
+    if os.path.exists(os.path.join(catalog_dir, 'key.npy')):
+        catalog = read_catalog(catalog_dir)
+        old_keys = catalog['key']
+        keep = np.ones(old_keys.shape[0], dtype=np.bool_)
+        keep &= ~np.isin(old_keys, new_keys)
+        if replaced_runs:
+            run_keys = pack_key(
+                [n for n, r in replaced_runs], [r for n, r in replaced_runs],
+                0) >> np.uint64(KEY_EVENT_BITS)
+            keep &= ~np.isin(old_keys >> np.uint64(KEY_EVENT_BITS), run_keys)
+    else:
+        catalog = None
+        old_keys = np.zeros(0, dtype=np.uint64)
+        keep = np.zeros(0, dtype=np.bool_)
+
+    kept_keys = old_keys[keep]
+    number_rows = kept_keys.shape[0] + new_keys.shape[0]
+    # positions of the new rows in the merged, sorted catalog
+    new_positions = (
+        np.searchsorted(kept_keys, new_keys) + np.arange(new_keys.shape[0]))
+    is_old = np.ones(number_rows, dtype=np.bool_)
+    is_old[new_positions] = False
+
+    columns = ['key'] + list(header_dtype.names)
+    for column in columns:
+        dtype = np.uint64 if column == 'key' else header_dtype[column]
+        tmp_path = os.path.join(catalog_dir, column + '.npy.tmp')
+        out = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=dtype, shape=(number_rows,))
+        if column == 'key':
+            out[new_positions] = new_keys
+        else:
+            out[new_positions] = new_rows[column]
+        if catalog is not None:
+            out[is_old] = catalog[column][keep]
+        out.flush()
+        del out
+    del catalog
+    for column in columns:
+        os.replace(
+            os.path.join(catalog_dir, column + '.npy.tmp'),
+            os.path.join(catalog_dir, column + '.npy'))
+
+    for column in INDEXED_COLUMNS:
+        values = np.load(
+            os.path.join(catalog_dir, column + '.npy'), mmap_mode='r')
+        index = np.argsort(values, kind='stable')
+        np.save(os.path.join(catalog_dir, 'index_' + column + '.npy'), index)
+        np.save(
+            os.path.join(catalog_dir, 'sorted_' + column + '.npy'),
+            values[index])
+
+    manifest.update(ingested)
+    with open(manifest_path + '.tmp', 'wt') as fout:
+        json.dump(manifest, fout)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return len(ingested)
+
+
+def read_catalog(catalog_dir):
+    """
+    Returns a dict of the catalog's columns as read-only np.memmaps. The
+    columns are the fields of extraction.header_dtype, and the packed
+    (Night, Run, Event) 'key' by which all columns are sorted.
+    """
+    catalog = {}
+    for column in ['key'] + list(header_dtype.names):
+        catalog[column] = np.load(
+            os.path.join(catalog_dir, column + '.npy'), mmap_mode='r')
+    catalog['catalog_dir'] = catalog_dir
+    return catalog
+
+
+def select_nights(catalog, start_night, stop_night):
+    """
+    Returns the slice of the rows of the nights in
+    [start_night, stop_night]. Slicing the columns gives views without a
+    copy.
+    """
+    night_shift = np.uint64(KEY_RUN_BITS + KEY_EVENT_BITS)
+    start = np.uint64(start_night) << night_shift
+    stop = np.uint64(stop_night + 1) << night_shift
+    return slice(
+        int(np.searchsorted(catalog['key'], start, side='left')),
+        int(np.searchsorted(catalog['key'], stop, side='left')))
+
+
+def select_range(catalog, column, start, stop):
+    """
+    Returns the sorted indices of the rows with 'column' in [start, stop).
+    Only the indexed columns 'UnixTime_s' and 'ring_radius' are supported.
+    """
+    if column not in INDEXED_COLUMNS:
+        raise KeyError(
+            "Column '{}' is not indexed, indexed are {}.".format(
+                column, INDEXED_COLUMNS))
+    catalog_dir = catalog['catalog_dir']
+    sorted_values = np.load(
+        os.path.join(catalog_dir, 'sorted_' + column + '.npy'),
+        mmap_mode='r')
+    index = np.load(
+        os.path.join(catalog_dir, 'index_' + column + '.npy'),
+        mmap_mode='r')
+    lo = np.searchsorted(sorted_values, start, side='left')
+    hi = np.searchsorted(sorted_values, stop, side='left')
+    return np.sort(index[lo:hi])
+
+
+def find_event(catalog, night, run, event):
+    """
+    Returns the row of the event (night, run, event), or -1 when the event
+    is not in the catalog.
+    """
+    key = pack_key(night, run, event)
+    row = int(np.searchsorted(catalog['key'], key))
+    if row < catalog['key'].shape[0] and catalog['key'][row] == key:
+        return row
+    return -1
+
+
+def main():
+    try:
+        arguments = docopt.docopt(__doc__)
+        number_files = update_catalog(
+            muon_dir=arguments['--muon_dir'],
+            catalog_dir=arguments['--catalog_dir'])
+        print('Ingested', number_files, 'runs.')
+    except docopt.DocoptExit as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import numpy as np
+
+
+def circle_ransac(
+    xy,
+    residual_threshold,
+    min_samples=3,
+    max_trials=15,
+    random_state=None
+):
+    """
+    Robust circle fit using RANSAC.
+    Returns the circle (cx, cy, r) and the inlier mask of the points.
+    Same semantics as skimage.measure.ransac() with
+    skimage.measure.CircleModel, but all 'max_trials' hypotheses are drawn
+    and scored at once.
+    Each hypothesis is the algebraic circle fit of 'min_samples' random
+    points, which is the circumcircle for 3 points. A point is an inlier
+    when its distance to the circle is below 'residual_threshold'. The
+    hypothesis with most inliers wins, ties are broken by the smaller sum
+    of squared residuals. The winner is refined with an algebraic fit on
+    its inliers. When no hypothesis has inliers, the circle is NaN.
+
+    Parameter
+    ---------
+    xy                      np.array shape=(N, 2)
+                            The points.
+
+    residual_threshold      Maximum distance of an inlier to the circle.
+
+    min_samples             Number of points for one hypothesis.
+
+    max_trials              Number of hypotheses.
+
+    random_state            None, int, np.random.RandomState or
+                            np.random.Generator. None uses the global
+                            np.random state.
+    """
+    xy = np.asarray(xy, dtype=np.float64)
+    number_points = xy.shape[0]
+    if not (0 < min_samples <= number_points):
+        raise ValueError(
+            '`min_samples` must be in range (0, {:d}]'.format(number_points))
+
+    prng = _random_state(random_state)
+    samples = _draw_samples(
+        number_points=number_points,
+        min_samples=min_samples,
+        number_trials=max_trials,
+        prng=prng)
+
+    cx, cy, r = algebraic_circle_fit(xy[samples])
+    valid = np.isfinite(r)
+
+    dx = xy[np.newaxis, :, 0] - cx[:, np.newaxis]
+    dy = xy[np.newaxis, :, 1] - cy[:, np.newaxis]
+    with np.errstate(invalid='ignore'):
+        residuals = np.abs(np.hypot(dx, dy) - r[:, np.newaxis])
+        inliers = residuals < residual_threshold
+    number_inliers = inliers.sum(axis=1)
+    residuals_sum = np.einsum('ij,ij->i', residuals, residuals)
+
+    number_inliers[~valid] = -1
+    residuals_sum[~valid] = np.inf
+    # lexsort is stable, the earliest of equally good hypotheses wins
+    best = np.lexsort((residuals_sum, -number_inliers))[0]
+
+    if number_inliers[best] <= 0:
+        return (np.nan, np.nan, np.nan), np.zeros(number_points, dtype=bool)
+
+    best_inliers = inliers[best]
+    cx, cy, r = algebraic_circle_fit(xy[best_inliers][np.newaxis])
+    return (cx[0], cy[0], r[0]), best_inliers
+
+
+def algebraic_circle_fit(xy):
+    """
+    Returns the algebraic least squares circles (cx, cy, r) of a stack of
+    point sets. Degenerated point sets, e.g. collinear points, return NaN.
+    For three points the circle is their circumcircle.
+
+    Parameter
+    ---------
+    xy          np.array shape=(number_sets, number_points, 2)
+    """
+    origin = xy.mean(axis=1, keepdims=True)
+    uv = xy - origin
+    u = uv[:, :, 0]
+    v = uv[:, :, 1]
+
+    suu = (u*u).sum(axis=1)
+    svv = (v*v).sum(axis=1)
+    suv = (u*v).sum(axis=1)
+    su = 0.5*(u*u*u + u*v*v).sum(axis=1)
+    sv = 0.5*(v*v*v + v*u*u).sum(axis=1)
+
+    det = suu*svv - suv*suv
+    scale = (suu + svv)**2
+    with np.errstate(invalid='ignore', divide='ignore'):
+        degenerated = np.abs(det) <= 1e-12*scale
+        uc = (su*svv - sv*suv)/det
+        vc = (sv*suu - su*suv)/det
+        uc[degenerated] = np.nan
+        vc[degenerated] = np.nan
+
+    cx = uc + origin[:, 0, 0]
+    cy = vc + origin[:, 0, 1]
+    r = np.sqrt(
+        ((u - uc[:, np.newaxis])**2 + (v - vc[:, np.newaxis])**2).mean(axis=1))
+    return cx, cy, r
+
+
+def _draw_samples(number_points, min_samples, number_trials, prng):
+    if min_samples == 3 and number_points >= 3:
+        # three distinct indices without a sort of all points
+        u = prng.uniform(size=(number_trials, 3))
+        a = np.floor(u[:, 0]*number_points).astype(np.int64)
+        b = np.floor(u[:, 1]*(number_points - 1)).astype(np.int64)
+        c = np.floor(u[:, 2]*(number_points - 2)).astype(np.int64)
+        b += b >= a
+        low = np.minimum(a, b)
+        high = np.maximum(a, b)
+        c += c >= low
+        c += c >= high
+        return np.c_[a, b, c]
+    keys = prng.uniform(size=(number_trials, number_points))
+    return np.argsort(keys, axis=1)[:, 0:min_samples]
+
+
+def _random_state(random_state):
+    if random_state is None:
+        return np.random.mtrand._rand
+    if isinstance(random_state, (np.random.RandomState, np.random.Generator)):
+        return random_state
+    return np.random.RandomState(random_state)
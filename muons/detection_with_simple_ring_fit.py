@@ -1,12 +1,27 @@
 import numpy as np
-from skimage.measure import ransac
-from skimage.measure import CircleModel
+from .circle_ransac import circle_ransac
 from .tools import circle_overlapp
 from .tools import tight_circle_on_off_region
 from .tools import xy2polar
+from .tools import ring_population_is_even
+from .instrumentation import NULL_TIMER
 
 deg2rad = np.deg2rad(1)
 
+# The cuts in the order they are applied, see 'rejected_by'.
+CUTS = [
+    'number_of_photons',
+    'initial_circle_model',
+    'muon_ring_r',
+    'muon_ring_overlapp_with_field_of_view',
+    'arrival_time_stddev',
+    'initial_circle_model_photon_ratio',
+    'visible_muon_ring_circumfance',
+    'density_circle_model_on_off_ratio',
+    'density_circle_model_inner_ratio',
+    'ring_population',
+]
+
 
 def detection_with_simple_ring_fit(
     event,
@@ -22,11 +37,14 @@ def detection_with_simple_ring_fit(
     max_arrival_time_stddev=5e-9,
     min_overlap_of_muon_ring_with_field_of_view=0.2,
     min_muon_ring_radius=0.45,
-    max_muon_ring_radius=1.6
+    max_muon_ring_radius=1.6,
+    random_state=None,
+    timer=NULL_TIMER
 ):
     """
     Detects muon events.
-    A dictionary of muon relevant features is returned.
+    A dictionary of muon relevant features is returned. For an event which
+    is no muon, 'rejected_by' names the cut which rejected it, see CUTS.
 
     Parameter
     ---------
@@ -34,6 +52,12 @@ def detection_with_simple_ring_fit(
     event       FACT event.
 
     clusters    Photons-stream cluster of the event.
+
+    random_state    Seed or np.random.RandomState for the initial circle
+                    model. None uses the global np.random state.
+
+    timer       Records the time of the 'ransac' stage and counts the
+                rejecting cut as 'cut:<name>', see muons.instrumentation.
     """
     initial_circle_model_residual_threshold *= deg2rad
     density_circle_model_residual_threshold *= deg2rad
@@ -43,6 +67,7 @@ def detection_with_simple_ring_fit(
 
     ret = {}
     ret['is_muon'] = False
+    ret['rejected_by'] = None
 
     field_of_view_radius = event.photon_stream.geometry.fov_radius
 
@@ -51,29 +76,28 @@ def detection_with_simple_ring_fit(
 
     ret['number_of_photons'] = number_of_photons
     if number_of_photons < initial_circle_model_min_samples:
-        return ret
+        return rejected(ret, 'number_of_photons', timer)
 
     flat_photon_stream = clusters.point_cloud
     full_clusters_fps = flat_photon_stream[full_cluster_mask]
 
-    with np.errstate(invalid='ignore'):
-        circle_model, inliers = ransac(
-            data=full_clusters_fps[:, 0:2],  # only cx and cy not the time
-            model_class=CircleModel,
-            min_samples=initial_circle_model_min_samples,
+    with timer.stage('ransac'):
+        (cx, cy, r), inliers = circle_ransac(
+            xy=full_clusters_fps[:, 0:2],  # only cx and cy not the time
             residual_threshold=initial_circle_model_residual_threshold,
-            max_trials=initial_circle_model_max_trails)
-
-    cx = circle_model.params[0]
-    cy = circle_model.params[1]
-    r = circle_model.params[2]
+            min_samples=initial_circle_model_min_samples,
+            max_trials=initial_circle_model_max_trails,
+            random_state=random_state)
 
     ret['muon_ring_cx'] = cx
     ret['muon_ring_cy'] = cy
     ret['muon_ring_r'] = r
 
+    if np.isnan(r):
+        return rejected(ret, 'initial_circle_model', timer)
+
     if r < min_muon_ring_radius or r > max_muon_ring_radius:
-        return ret
+        return rejected(ret, 'muon_ring_r', timer)
 
     muon_ring_overlapp_with_field_of_view = circle_overlapp(
         cx1=0.0,
@@ -90,12 +114,12 @@ def detection_with_simple_ring_fit(
         muon_ring_overlapp_with_field_of_view <
         min_overlap_of_muon_ring_with_field_of_view
     ):
-        return ret
+        return rejected(ret, 'muon_ring_overlapp_with_field_of_view', timer)
 
     arrival_time_stddev = full_clusters_fps[:, 2].std()
     ret['arrival_time_stddev'] = arrival_time_stddev
     if arrival_time_stddev > max_arrival_time_stddev:
-        return ret
+        return rejected(ret, 'arrival_time_stddev', timer)
 
     ret['mean_arrival_time_muon_cluster'] = full_clusters_fps[:, 2].mean()
 
@@ -110,7 +134,7 @@ def detection_with_simple_ring_fit(
         initial_circle_model_photon_ratio <
         initial_circle_model_min_photon_ratio
     ):
-        return ret
+        return rejected(ret, 'initial_circle_model_photon_ratio', timer)
 
     visible_ring_circumfance = r*2*np.pi*muon_ring_overlapp_with_field_of_view
     ret['visible_muon_ring_circumfance'] = visible_ring_circumfance
@@ -118,7 +142,7 @@ def detection_with_simple_ring_fit(
         visible_ring_circumfance <
         min_circumference_of_muon_ring_in_field_of_view
     ):
-        return ret
+        return rejected(ret, 'visible_muon_ring_circumfance', timer)
 
     # circle model ON/OFF ratio
     # -------------------------
@@ -137,19 +161,19 @@ def detection_with_simple_ring_fit(
     off_density = (outer_off_density + inner_off_density)/2
 
     if off_density == 0:
-        return ret
+        return rejected(ret, 'density_circle_model_on_off_ratio', timer)
 
     on_off_ratio = on_density/off_density
 
     ret['density_circle_model_on_off_ratio'] = on_off_ratio
     if on_off_ratio < density_circle_model_min_on_off_ratio:
-        return ret
+        return rejected(ret, 'density_circle_model_on_off_ratio', timer)
 
     number_of_photons_inside_ring_off = onoff['inside_off'].sum()
     ratio_inside_circle = number_of_photons_inside_ring_off/number_of_photons
     ret['density_circle_model_inner_ratio'] = ratio_inside_circle
     if ratio_inside_circle > density_circle_model_max_ratio_photon_inside_ring:
-        return ret
+        return rejected(ret, 'density_circle_model_inner_ratio', timer)
 
     # ring population
     # ----------------
@@ -185,25 +209,21 @@ def detection_with_simple_ring_fit(
 
     number_of_fraction_bins = int(np.round(min_ring_fraction*number_bins))
 
-    is_populated_evenly = False
-    is_populated_at_all = False
-    most_even_population_std = 1e99
-    for i in range(ring_population_hist.shape[0]):
-        section = np.take(
-            ring_population_hist,
-            range(i, i+number_of_fraction_bins),
-            mode='wrap')
-
-        if (section > 0).sum() >= 0.5*number_of_fraction_bins:
-            is_populated_at_all = True
-            rel_std = section.std()/section.mean()
-            if rel_std < most_even_population_std:
-                most_even_population_std = rel_std
+    if not ring_population_is_even(
+        ring_population_hist,
+        number_of_fraction_bins
+    ):
+        return rejected(ret, 'ring_population', timer)
 
-    if is_populated_at_all and most_even_population_std < 0.8:
-        is_populated_evenly = True
+    ret['is_muon'] = True
+    return ret
 
-    if is_populated_evenly:
-        ret['is_muon'] = True
 
-    return ret
+def rejected(muon_features, cut, timer=NULL_TIMER):
+    """
+    Records in 'muon_features' and in the 'timer' that the event was
+    rejected by 'cut', and returns the 'muon_features'.
+    """
+    muon_features['rejected_by'] = cut
+    timer.count('cut:' + cut)
+    return muon_features
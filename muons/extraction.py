@@ -1,9 +1,21 @@
 import numpy as np
 import photon_stream as ps
 from .detection import detection
+from .prefilter import init_counts
+from .prefilter import rejecting_stage
+from .prefilter import add_to_counts
+from .phs_output import event_to_bytes
+from .phs_output import BufferedEventWriter
+from .phs_output import OUTPUT_FORMATS
+from .instrumentation import StageTimer
+from .instrumentation import NULL_TIMER
+from .instrumentation import write_stats
 import gzip
 import os
-import json
+import multiprocessing
+import threading
+import time
+from functools import partial
 
 rad2deg = np.rad2deg(1)
 
@@ -28,7 +40,12 @@ FACT_PHYSICS_SELF_TRIGGER = 4
 def extract_muons_from_run(
     input_run_path,
     output_run_path,
-    output_run_header_path
+    output_run_header_path,
+    prefilter=None,
+    number_workers=1,
+    queue_depth=64,
+    output_format='jsonl',
+    stats_path=None
 ):
     """
     Detects and extracts muon candidate events from a run. The muon candidate
@@ -44,6 +61,26 @@ def extract_muons_from_run(
 
     output_run_header_path      Path to the binary output run header.
 
+    prefilter                   Optional list of cheap cuts applied before
+                                the clustering, see muons.prefilter.
+                                Returns the counts of the prefilter.
+
+    number_workers              Number of processes for the clustering and
+                                detection. With 1, all is done in this
+                                process.
+
+    queue_depth                 Maximum number of events read ahead of the
+                                writer when 'number_workers' > 1.
+
+    output_format               'jsonl' writes the output run as gzipped
+                                JSON-lines, 'phs' in the binary
+                                photon-stream format.
+
+    stats_path                  Optional path of a JSON sidecar with the
+                                time spent in each stage, the number of
+                                events for each outcome and the peak RSS,
+                                see muons.instrumentation.
+
 
     Binary Output Format Run Header
     -------------------------------
@@ -63,46 +100,152 @@ def extract_muons_from_run(
    12)      float32     muon ring overlapp with field of view (0.0 to 1.0) [1]
    13)      float32     number of photons muon cluster [1]
     """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            "output_format must be one of {}, but is '{}'".format(
+                list(OUTPUT_FORMATS.keys()), output_format))
+    if prefilter is None:
+        prefilter = []
+    prefilter_counts = init_counts(prefilter)
+    timer = NULL_TIMER if stats_path is None else StageTimer()
+    start = time.time()
     run = ps.EventListReader(input_run_path)
-    with gzip.open(output_run_path, 'wt') as f_muon_run, \
-        open(output_run_header_path, 'wb') as f_muon_run_header:
-
-        for event in run:
-
-            if (
-                event.observation_info.trigger_type ==
-                FACT_PHYSICS_SELF_TRIGGER
-            ):
-
-                photon_clusters = ps.PhotonStreamCluster(event.photon_stream)
-                muon_features = detection(event, photon_clusters)
-
-                if muon_features['is_muon']:
-
-                    # EXPORT EVENT in JSON
-                    event_dict = ps.io.jsonl.event_to_dict(event)
-                    json.dump(event_dict, f_muon_run)
-                    f_muon_run.write('\n')
-
-                    # EXPORT EVENT header
-                    head1 = np.zeros(5, dtype=np.uint32)
-                    head1[0] = event.observation_info.night
-                    head1[1] = event.observation_info.run
-                    head1[2] = event.observation_info.event
-                    head1[3] = event.observation_info._time_unix_s
-                    head1[4] = event.observation_info._time_unix_us
-
-                    head2 = np.zeros(8, dtype=np.float32)
-                    head2[0] = event.zd
-                    head2[1] = event.az
-                    head2[2] = muon_features['muon_ring_cx']*rad2deg
-                    head2[3] = muon_features['muon_ring_cy']*rad2deg
-                    head2[4] = muon_features['muon_ring_r']*rad2deg
-                    head2[5] = muon_features['mean_arrival_time_muon_cluster']
-                    head2[6] = muon_features[
-                        'muon_ring_overlapp_with_field_of_view'
-                    ]
-                    head2[7] = muon_features['number_of_photons']
-
-                    f_muon_run_header.write(head1.tobytes())
-                    f_muon_run_header.write(head2.tobytes())
+
+    def read_self_triggered_events():
+        events = iter(run)
+        while True:
+            with timer.stage('decode'):
+                event = next(events, None)
+            if event is None:
+                return
+            with timer.stage('trigger_filter'):
+                is_self_triggered = (
+                    event.observation_info.trigger_type ==
+                    FACT_PHYSICS_SELF_TRIGGER)
+            if is_self_triggered:
+                yield event
+
+    self_triggered_events = read_self_triggered_events()
+    extract = partial(
+        extract_muon_from_event,
+        prefilter=prefilter,
+        output_format=output_format)
+    open_muon_run = gzip.open if output_format == 'jsonl' else open
+
+    with open_muon_run(output_run_path, 'wb') as f_muon_run, \
+        open(output_run_header_path, 'wb') as f_muon_run_header, \
+        BufferedEventWriter(f_muon_run) as muon_run_writer:
+
+        def write(result):
+            rejected_stage, muon = result
+            add_to_counts(prefilter_counts, rejected_stage)
+            if muon is not None:
+                event_bytes, header = muon
+                with timer.stage('write'):
+                    muon_run_writer.write(event_bytes)
+                    f_muon_run_header.write(header)
+
+        if number_workers <= 1:
+            for event in self_triggered_events:
+                write(extract(event, timer=timer))
+        else:
+            # The reader is throttled so that at most 'queue_depth' events
+            # are in flight. imap() returns the results in the order of the
+            # events, so the output is the same as in the serial loop.
+            in_flight = threading.BoundedSemaphore(queue_depth)
+
+            def read():
+                for event in self_triggered_events:
+                    in_flight.acquire()
+                    yield event
+
+            if stats_path is not None:
+                extract = partial(
+                    _extract_muon_from_event_with_stats, extract)
+            with multiprocessing.Pool(number_workers) as pool:
+                for result in pool.imap(extract, read()):
+                    in_flight.release()
+                    if stats_path is not None:
+                        result, event_stats = result
+                        timer.merge(event_stats)
+                    write(result)
+
+    if stats_path is not None:
+        write_stats(
+            stats_path,
+            timer,
+            input_run_path=input_run_path,
+            number_workers=number_workers,
+            wall_time_s=time.time() - start)
+    return prefilter_counts
+
+
+def extract_muon_from_event(
+    event,
+    prefilter=[],
+    output_format='jsonl',
+    timer=NULL_TIMER
+):
+    """
+    Runs the prefilter, the clustering and the muon detection on one event.
+    Returns the name of the prefilter stage which rejected the event, or
+    None, and the muon. The muon is None for events which are no muons, or
+    a tuple of the event serialized in the 'output_format' and its binary
+    run header, see extract_muons_from_run().
+    The detection of each event is seeded with its night, run and event id,
+    so the result does not depend on which events were processed before.
+    The 'timer' records the stages and counts the outcome of the event. An
+    event which is no muon is counted by the detection as 'cut:<name>' of
+    the cut which rejected it.
+    """
+    with timer.stage('prefilter'):
+        rejected_stage = rejecting_stage(event, prefilter)
+    if rejected_stage is not None:
+        timer.count('prefilter:' + rejected_stage)
+        return rejected_stage, None
+
+    with timer.stage('clustering'):
+        photon_clusters = ps.PhotonStreamCluster(event.photon_stream)
+    with timer.stage('cuts'):
+        muon_features = detection(
+            event,
+            photon_clusters,
+            random_state=np.random.RandomState([
+                event.observation_info.night,
+                event.observation_info.run,
+                event.observation_info.event]),
+            timer=timer)
+
+    if not muon_features['is_muon']:
+        return None, None
+    timer.count('muon')
+
+    with timer.stage('serialization'):
+        event_bytes = event_to_bytes(event, output_format=output_format)
+
+        head1 = np.zeros(5, dtype=np.uint32)
+        head1[0] = event.observation_info.night
+        head1[1] = event.observation_info.run
+        head1[2] = event.observation_info.event
+        head1[3] = event.observation_info._time_unix_s
+        head1[4] = event.observation_info._time_unix_us
+
+        head2 = np.zeros(8, dtype=np.float32)
+        head2[0] = event.zd
+        head2[1] = event.az
+        head2[2] = muon_features['muon_ring_cx']*rad2deg
+        head2[3] = muon_features['muon_ring_cy']*rad2deg
+        head2[4] = muon_features['muon_ring_r']*rad2deg
+        head2[5] = muon_features['mean_arrival_time_muon_cluster']
+        head2[6] = muon_features['muon_ring_overlapp_with_field_of_view']
+        head2[7] = muon_features['number_of_photons']
+
+    return None, (event_bytes, head1.tobytes() + head2.tobytes())
+
+
+def _extract_muon_from_event_with_stats(extract, event):
+    # In a worker process, the stages of each event are recorded by its own
+    # timer and merged in the main process.
+    timer = StageTimer()
+    result = extract(event, timer=timer)
+    return result, timer.to_dict()
@@ -0,0 +1,148 @@
+import numpy as np
+
+
+def hough_ring_refinement(
+    point_cloud,
+    cx,
+    cy,
+    r,
+    uncertainty=np.deg2rad(1),
+    epsilon=np.deg2rad(0.1111*1.5),
+    number_grid_steps=9,
+    min_number_levels=6,
+    max_number_levels=20,
+    max_number_kernel_evaluations=int(2e7),
+    max_delta_cx=np.deg2rad(0.05),
+    max_delta_cy=np.deg2rad(0.05),
+    max_delta_r=np.deg2rad(0.03)
+):
+    """
+    Refines a ring (cx, cy, r) with a coarse-to-fine Hough transformation.
+    Returns the refined (cx, cy, r).
+
+    Each level accumulates the triangular Hough response of the points on a
+    grid of ring candidates of 'number_grid_steps' in cx, cy and r around
+    the current best ring. The grid spans +- 'uncertainty' on the first
+    level and is halved on each following level. The kernel width is
+    'epsilon', but never smaller than the grid spacing.
+    The distances of the points to a candidate center are reused on the
+    finer levels, where every second grid node coincides with a node of the
+    coarser grid.
+    The refinement stops when the ring moves less than 'max_delta_cx',
+    'max_delta_cy' and 'max_delta_r' after at least 'min_number_levels',
+    after 'max_number_levels', or before a level would exceed the budget of
+    'max_number_kernel_evaluations' for the event.
+
+    Parameter
+    ---------
+    point_cloud     np.array shape=(N, 2)
+                    The cx and cy of the photons.
+
+    cx, cy, r       Initial guess of the ring.
+    """
+    point_cloud = np.asarray(point_cloud, dtype=np.float64)
+    number_points = point_cloud.shape[0]
+    if number_points == 0:
+        return cx, cy, r
+
+    grid = _grid(number_grid_steps)
+    half_steps = number_grid_steps//2
+    step0 = uncertainty/half_steps
+    number_centers = grid.shape[0]
+    cost = number_centers*number_grid_steps*number_points
+
+    # centers are kept on an integer lattice relative to the initial guess,
+    # in units of the finest possible grid spacing.
+    best_ij = np.zeros(2, dtype=np.int64)
+    best_r = r
+    distances = {}
+    number_kernel_evaluations = 0
+
+    for level in range(max_number_levels):
+        if level > 0 and (
+            number_kernel_evaluations + cost > max_number_kernel_evaluations
+        ):
+            break
+
+        step = step0/2**level
+        lattice_step = 2**(max_number_levels - level)
+        centers_ij = best_ij + grid*lattice_step
+
+        missing = [
+            k for k, ij in enumerate(map(tuple, centers_ij))
+            if ij not in distances]
+        if missing:
+            missing_xy = (
+                np.array([cx, cy]) +
+                centers_ij[missing]*(step0/2**max_number_levels))
+            missing_distances = np.hypot(
+                point_cloud[np.newaxis, :, 0] - missing_xy[:, 0, np.newaxis],
+                point_cloud[np.newaxis, :, 1] - missing_xy[:, 1, np.newaxis])
+            for k, d in zip(missing, missing_distances):
+                distances[tuple(centers_ij[k])] = d
+
+        D = np.array([distances[tuple(ij)] for ij in centers_ij])
+        radii = best_r + np.arange(-half_steps, half_steps + 1)*step
+        kernel_width = max(epsilon, step)
+
+        response = np.maximum(
+            kernel_width - np.abs(
+                D[:, :, np.newaxis] - radii[np.newaxis, np.newaxis, :]),
+            0.0).sum(axis=1)
+        number_kernel_evaluations += cost
+
+        previous_cx, previous_cy, previous_r = _ring(
+            best_ij, best_r, cx, cy, step0, max_number_levels)
+
+        # keep the current ring when it is as good as the best candidate
+        center_index = number_centers//2
+        best_center, best_radius = np.unravel_index(
+            np.argmax(response), response.shape)
+        if response[center_index, half_steps] < response[
+            best_center, best_radius
+        ]:
+            best_ij = centers_ij[best_center]
+            best_r = radii[best_radius]
+
+        # drop distances which can not be reused on the next level
+        reach = half_steps*lattice_step//2
+        distances = {
+            ij: d for ij, d in distances.items()
+            if np.abs(np.array(ij) - best_ij).max() <= reach}
+
+        new_cx, new_cy, new_r = _ring(
+            best_ij, best_r, cx, cy, step0, max_number_levels)
+        if (
+            level + 1 >= min_number_levels and
+            np.abs(new_cx - previous_cx) <= max_delta_cx and
+            np.abs(new_cy - previous_cy) <= max_delta_cy and
+            np.abs(new_r - previous_r) <= max_delta_r
+        ):
+            break
+
+    return _ring(best_ij, best_r, cx, cy, step0, max_number_levels)
+
+
+def _ring(ij, r, cx, cy, step0, max_number_levels):
+    unit = step0/2**max_number_levels
+    return cx + ij[0]*unit, cy + ij[1]*unit, r
+
+
+_grids = {}
+
+
+def _grid(number_grid_steps):
+    """
+    Returns the integer (i, j) offsets of the candidate centers for an odd
+    'number_grid_steps', with the center of the grid in the middle.
+    """
+    if number_grid_steps not in _grids:
+        if number_grid_steps < 3 or number_grid_steps % 2 == 0:
+            raise ValueError('number_grid_steps must be odd and >= 3')
+        half_steps = number_grid_steps//2
+        i, j = np.meshgrid(
+            np.arange(-half_steps, half_steps + 1),
+            np.arange(-half_steps, half_steps + 1),
+            indexing='ij')
+        _grids[number_grid_steps] = np.c_[i.ravel(), j.ravel()]
+    return _grids[number_grid_steps]
@@ -0,0 +1,152 @@
+"""
+Usage: phs_muon_stats --muon_dir=DIR
+
+Options:
+    --muon_dir=DIR      The output directory of the muon extraction. All
+                        '*_muons.stats.json' sidecars below are reduced.
+
+Opt-in timing of the stages of the muon extraction, counts of the events
+for each outcome, and the peak resident memory. The stats of a run are
+written as a JSON sidecar next to its '*_muons.info', and the sidecars of
+many runs are reduced into one summary.
+"""
+import docopt
+import glob
+import json
+import os
+import resource
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+STATS_SUFFIX = '_muons.stats.json'
+
+
+class StageTimer(object):
+    """
+    Accumulates the wall-clock time spent in named stages and counts named
+    outcomes. Stages can be nested, the time of an inner stage is not
+    counted again in the outer stage, so the seconds of all stages add up
+    to the time spent in them. The 'clock' returns the current time in
+    seconds.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._local = threading.local()
+
+    @contextmanager
+    def stage(self, name):
+        # each thread nests its own stages
+        if not hasattr(self._local, 'inner_seconds'):
+            self._local.inner_seconds = []
+        inner_seconds = self._local.inner_seconds
+        start = self.clock()
+        inner_seconds.append(0.0)
+        try:
+            yield
+        finally:
+            elapsed = self.clock() - start
+            self.seconds[name] += elapsed - inner_seconds.pop()
+            if inner_seconds:
+                inner_seconds[-1] += elapsed
+
+    def count(self, name, number=1):
+        self.counts[name] += number
+
+    def merge(self, stats):
+        """
+        Adds the seconds and counts of 'stats', see to_dict().
+        """
+        for name, seconds in stats['seconds'].items():
+            self.seconds[name] += seconds
+        for name, number in stats['counts'].items():
+            self.counts[name] += number
+
+    def to_dict(self):
+        return {
+            'seconds': dict(self.seconds),
+            'counts': dict(self.counts)}
+
+
+class NullTimer(object):
+    """
+    A StageTimer which records nothing, used when instrumentation is off.
+    """
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, number=1):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def peak_rss_bytes(who=resource.RUSAGE_SELF):
+    """
+    Returns the peak resident set size of this process, or with
+    resource.RUSAGE_CHILDREN of its largest terminated child process.
+    """
+    # ru_maxrss is in kilobytes on linux
+    return 1024*resource.getrusage(who).ru_maxrss
+
+
+def write_stats(path, timer, **info):
+    """
+    Writes the stats of the 'timer', the peak RSS and the additional 'info'
+    as JSON to 'path'.
+    """
+    stats = timer.to_dict()
+    stats['peak_rss_bytes'] = peak_rss_bytes()
+    stats['peak_rss_children_bytes'] = peak_rss_bytes(
+        resource.RUSAGE_CHILDREN)
+    stats.update(info)
+    with open(path + '.tmp', 'wt') as fout:
+        json.dump(stats, fout, indent=4)
+    os.replace(path + '.tmp', path)
+
+
+def reduce_stats(muon_dir):
+    """
+    Returns the sum of the seconds and counts of all stats sidecars below
+    'muon_dir', the maximum peak RSS, and the number of runs.
+    """
+    timer = StageTimer()
+    number_runs = 0
+    max_peak_rss_bytes = 0
+    for path in glob.glob(
+        os.path.join(muon_dir, '**', '*' + STATS_SUFFIX), recursive=True
+    ):
+        with open(path, 'rt') as fin:
+            stats = json.load(fin)
+        timer.merge(stats)
+        max_peak_rss_bytes = max(
+            max_peak_rss_bytes, stats.get('peak_rss_bytes', 0))
+        number_runs += 1
+    reduced = timer.to_dict()
+    reduced['number_runs'] = number_runs
+    reduced['max_peak_rss_bytes'] = max_peak_rss_bytes
+    return reduced
+
+
+def main():
+    try:
+        arguments = docopt.docopt(__doc__)
+        reduced = reduce_stats(arguments['--muon_dir'])
+        total_s = sum(reduced['seconds'].values())
+        for name, seconds in sorted(
+            reduced['seconds'].items(), key=lambda item: -item[1]
+        ):
+            print('{:<16s} {:12.1f}s {:6.1%}'.format(
+                name, seconds, seconds/total_s if total_s else 0.0))
+        print(json.dumps(reduced, indent=4))
+    except docopt.DocoptExit as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
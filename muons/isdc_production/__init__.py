@@ -1,3 +1,6 @@
 from . import worker_node_main
 from . import qsub
 from . import write_worker_node_script
+from . import manifest
+from . import packing
+from . import multi_run_worker_main
@@ -0,0 +1,166 @@
+"""
+A persistent manifest of the muon extraction of all photon-stream runs,
+kept in a SQLite file. It records for each input run its size and mtime,
+the output path, the state of the extraction, the runtime and the exit
+status. Planning the jobs is a diff of the input directory against the
+manifest, and the workers update the manifest when they finish.
+
+States: 'new' (no output yet), 'submitted', 'done' and 'failed'.
+A worker killed by the scheduler never records its result, so its runs are
+planned again when they are 'submitted' for longer than a timeout.
+"""
+import os
+import sqlite3
+import time
+from os.path import join
+
+RUN_SUFFIX = '.phs.jsonl.gz'
+
+# Longer than the walltime of the longest queue plus the time in the queue.
+SUBMITTED_TIMEOUT_S = 14*24*60*60
+
+
+def connect(manifest_path):
+    """
+    Returns a connection to the manifest, which is created if not existing.
+    """
+    connection = sqlite3.connect(manifest_path, timeout=60)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS runs ('
+        'input_run_path TEXT PRIMARY KEY, '
+        'size INTEGER, '
+        'mtime REAL, '
+        'output_muon_path TEXT, '
+        'state TEXT, '
+        'runtime_s REAL, '
+        'exit_status INTEGER, '
+        'updated REAL)')
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS directories ('
+        'path TEXT PRIMARY KEY, '
+        'mtime REAL)')
+    connection.commit()
+    return connection
+
+
+def scan(connection, input_phs_dir, output_muon_path, full_scan=False):
+    """
+    Adds the runs in the night directories 'input_phs_dir'/YYYY/MM/DD to
+    the manifest. Only night directories which changed since the last scan
+    are listed, unless 'full_scan'. A run whose size or mtime changed is
+    set back to 'new'. A run rewritten in place does not change its
+    directory, and is only found with 'full_scan'.
+    A run seen for the first time is 'done' when its output exists already.
+    Returns the number of runs added or changed.
+
+    Parameter
+    ---------
+    connection          The manifest, see connect().
+
+    input_phs_dir       The photon-stream directory.
+
+    output_muon_path    Function returning the output muon path for an
+                        input run path.
+
+    full_scan           List all night directories.
+    """
+    known_directories = dict(
+        connection.execute('SELECT path, mtime FROM directories'))
+    number_changed = 0
+    for night_dir in _night_directories(input_phs_dir):
+        night_mtime = os.stat(night_dir).st_mtime
+        if not full_scan and known_directories.get(night_dir) == night_mtime:
+            continue
+        # A range instead of LIKE, where '_' in a path is a wildcard.
+        # '0' follows '/' in the byte order.
+        known_runs = {
+            path: (size, mtime) for path, size, mtime in connection.execute(
+                'SELECT input_run_path, size, mtime FROM runs '
+                'WHERE input_run_path >= ? AND input_run_path < ?',
+                (join(night_dir, ''), night_dir + '0'))}
+        for entry in os.scandir(night_dir):
+            if not entry.name.endswith(RUN_SUFFIX):
+                continue
+            stat = entry.stat()
+            known = known_runs.get(entry.path)
+            if known == (stat.st_size, stat.st_mtime):
+                continue
+            out_path = output_muon_path(entry.path)
+            state = 'new'
+            if known is None and os.path.exists(out_path + '_muons.info'):
+                state = 'done'
+            connection.execute(
+                'INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    entry.path, stat.st_size, stat.st_mtime, out_path,
+                    state, None, None, time.time()))
+            number_changed += 1
+        connection.execute(
+            'INSERT OR REPLACE INTO directories VALUES (?, ?)',
+            (night_dir, night_mtime))
+        connection.commit()
+    return number_changed
+
+
+def runs_to_process(
+    connection,
+    retry_failed=False,
+    submitted_timeout_s=SUBMITTED_TIMEOUT_S,
+    now=None
+):
+    """
+    Returns the (input_run_path, size, output_muon_path) of the runs which
+    still need to be processed. These are the 'new' runs, the 'failed' runs
+    when 'retry_failed', and the runs 'submitted' longer than
+    'submitted_timeout_s' ago, whose worker was probably killed. With a
+    'submitted_timeout_s' of None, submitted runs are never planned again.
+    """
+    now = time.time() if now is None else now
+    states = ('new', 'failed') if retry_failed else ('new',)
+    stale_before = -1.0 if submitted_timeout_s is None else (
+        now - submitted_timeout_s)
+    return connection.execute(
+        'SELECT input_run_path, size, output_muon_path FROM runs '
+        'WHERE state IN ({}) OR (state = ? AND updated < ?) '
+        'ORDER BY input_run_path'.format(', '.join('?'*len(states))),
+        states + ('submitted', stale_before)).fetchall()
+
+
+def set_state(connection, input_run_paths, state):
+    """
+    Sets the state of the runs.
+    """
+    now = time.time()
+    connection.executemany(
+        'UPDATE runs SET state = ?, updated = ? WHERE input_run_path = ?',
+        [(state, now, path) for path in input_run_paths])
+    connection.commit()
+
+
+def record_result(manifest_path, input_run_path, runtime_s, exit_status):
+    """
+    Called by a worker when it finished a run. The run is 'done' for exit
+    status 0 and 'failed' otherwise.
+    """
+    connection = connect(manifest_path)
+    try:
+        connection.execute(
+            'UPDATE runs SET state = ?, runtime_s = ?, exit_status = ?, '
+            'updated = ? WHERE input_run_path = ?',
+            (
+                'done' if exit_status == 0 else 'failed',
+                runtime_s, exit_status, time.time(), input_run_path))
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def _night_directories(input_phs_dir):
+    for year in _sorted_subdirectories(input_phs_dir):
+        for month in _sorted_subdirectories(year):
+            for night in _sorted_subdirectories(month):
+                yield night
+
+
+def _sorted_subdirectories(path):
+    return sorted(e.path for e in os.scandir(path) if e.is_dir())
@@ -0,0 +1,82 @@
+"""
+Usage: phs_extract_muons_many --job=JOB_PATH [options]
+
+Options:
+    --job=JOB_PATH          A JSON list of the runs to be processed, each
+                            with 'input_run_path' and 'output_muon_path'.
+    --prefilter             Reject events with the cheap cuts of
+                            muons.prefilter.DEFAULT_PREFILTER before the
+                            clustering.
+    --workers=N             Number of processes for clustering and
+                            detection [default: 1].
+    --output_format=FMT     'jsonl' or 'phs' (binary photon-stream)
+                            [default: jsonl].
+    --manifest=PATH         Record runtime and exit status of each run in
+                            this job manifest, see manifest.py.
+    --stats                 Write the stats sidecar of each run, see
+                            phs_extract_muons.
+
+Extracts the muons of many runs in one process, see phs_extract_muons.
+A failing run does not stop the other runs. The exit status is 1 when any
+run failed.
+"""
+import docopt
+import json
+import os
+import sys
+import time
+import traceback
+from ..prefilter import DEFAULT_PREFILTER
+from .manifest import record_result
+from .worker_node_main import TimeDeltaInfo
+from .worker_node_main import extract_run
+
+
+def main():
+    try:
+        tdi = TimeDeltaInfo()
+        print(tdi.info('Start muon extraction of many runs.'))
+
+        arguments = docopt.docopt(__doc__)
+        manifest_path = arguments['--manifest']
+        with open(arguments['--job'], 'rt') as fin:
+            runs = json.load(fin)
+
+        number_failed = 0
+        for run in runs:
+            print(tdi.info('Run ' + run['input_run_path']))
+            start = time.time()
+            exit_status = 1
+            try:
+                extract_run(
+                    input_run_path=run['input_run_path'],
+                    out_path=run['output_muon_path'],
+                    tdi=tdi,
+                    prefilter=(
+                        DEFAULT_PREFILTER if arguments['--prefilter']
+                        else None),
+                    number_workers=int(arguments['--workers']),
+                    output_format=arguments['--output_format'],
+                    stats=arguments['--stats'])
+                exit_status = 0
+            except Exception:
+                traceback.print_exc()
+                number_failed += 1
+            if manifest_path is not None:
+                record_result(
+                    manifest_path=manifest_path,
+                    input_run_path=os.path.abspath(run['input_run_path']),
+                    runtime_s=time.time() - start,
+                    exit_status=exit_status)
+
+        print(tdi.info(
+            'Done. {:d} of {:d} runs failed.'.format(
+                number_failed, len(runs))))
+        if number_failed > 0:
+            sys.exit(1)
+
+    except docopt.DocoptExit as e:
+        print(e)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Packs many runs into few worker jobs of a target runtime. The runtime of a
+run is estimated from the size of its input file.
+"""
+import bisect
+import json
+import warnings
+
+DEFAULT_SECONDS_PER_BYTE = 1e-5
+
+# The queues of the FACT cluster at ISDC, the same queues qsub.fact_queues
+# submits single runs to, with their maximum walltime, shortest first.
+# The limits are the 'resources_max.walltime' of the queues, see
+# 'qstat -Q -f'. When the cluster changes, pass other limits to
+# qsub.qsub(queue_max_runtime_s=...), e.g. read with
+# load_queue_max_runtime_s().
+fact_queue_max_runtime_s = [
+    ('fact_short', 60*60),
+    ('fact_medium', 6*60*60),
+    ('fact_long', 7*24*60*60),
+]
+
+
+def load_queue_max_runtime_s(path):
+    """
+    Returns the queues and their maximum runtimes, shortest first, read
+    from a JSON file of the form {"queue name": max_runtime_s, ...}.
+    """
+    with open(path, 'rt') as fin:
+        queues = json.load(fin)
+    return sorted(queues.items(), key=lambda item: item[1])
+
+
+def estimate_seconds_per_byte(connection, default=DEFAULT_SECONDS_PER_BYTE):
+    """
+    Returns the runtime per byte of input of the runs which are done in the
+    manifest, or 'default' when there are none.
+    """
+    total_runtime_s, total_size = connection.execute(
+        'SELECT SUM(runtime_s), SUM(size) FROM runs '
+        'WHERE state = ? AND runtime_s IS NOT NULL',
+        ('done',)).fetchone()
+    if not total_size:
+        return default
+    return total_runtime_s/total_size
+
+
+def pack_jobs(jobs, target_runtime_s, seconds_per_byte):
+    """
+    Returns the jobs packed into groups with an estimated runtime of at
+    most 'target_runtime_s'. A job longer than the target gets its own
+    group. Uses best-fit decreasing bin packing, the groups keep their jobs
+    in the input order.
+
+    Parameter
+    ---------
+    jobs                List of dicts with the input file 'size' in bytes.
+
+    target_runtime_s    Target runtime of a group.
+
+    seconds_per_byte    Cost model, runtime per byte of input.
+    """
+    order = sorted(
+        range(len(jobs)), key=lambda i: jobs[i]['size'], reverse=True)
+    groups = []
+    # (remaining runtime, group index) sorted by remaining runtime
+    remaining = []
+    for i in order:
+        runtime_s = jobs[i]['size']*seconds_per_byte
+        k = bisect.bisect_left(remaining, (runtime_s, -1))
+        if k < len(remaining):
+            left_s, g = remaining.pop(k)
+        else:
+            left_s, g = target_runtime_s, len(groups)
+            groups.append([])
+        groups[g].append(i)
+        left_s -= runtime_s
+        if left_s > 0:
+            bisect.insort(remaining, (left_s, g))
+    return [[jobs[i] for i in sorted(group)] for group in groups]
+
+
+def estimated_runtime_s(group, seconds_per_byte):
+    return sum(job['size'] for job in group)*seconds_per_byte
+
+
+def choose_queue(
+    runtime_s,
+    queue_max_runtime_s=fact_queue_max_runtime_s,
+    safety_factor=2.0
+):
+    """
+    Returns the shortest queue whose maximum runtime exceeds the estimated
+    runtime times the 'safety_factor'. When no queue is long enough, the
+    longest queue is returned with a warning.
+
+    Parameter
+    ---------
+    runtime_s               Estimated runtime of the job.
+
+    queue_max_runtime_s     List of (queue, max_runtime_s), shortest first.
+
+    safety_factor           Margin for the uncertainty of the estimate.
+    """
+    for queue, max_runtime_s in queue_max_runtime_s:
+        if runtime_s*safety_factor <= max_runtime_s:
+            return queue
+    queue, max_runtime_s = queue_max_runtime_s[-1]
+    warnings.warn(
+        'Estimated runtime {:.0f}s times {:.1f} exceeds the {:.0f}s of the '
+        'longest queue {:s}.'.format(
+            runtime_s, safety_factor, max_runtime_s, queue))
+    return queue
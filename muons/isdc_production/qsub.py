@@ -4,19 +4,53 @@ from os.path import join
 from os.path import split
 from os.path import exists
 import glob
+import hashlib
+import time
 from tqdm import tqdm
 import subprocess as sp
 from .write_worker_node_script import write_worker_node_script
+from .write_worker_node_script import write_multi_run_worker_node_script
+from . import manifest
+from . import packing
+import json
 
 fact_queues = ['fact_long', 'fact_medium', 'fact_short']
 
 
+def output_muon_path(input_run_path, out_muon_dir):
+    """
+    Returns the output path of the muons of a photon-stream run
+    'YYYY/MM/DD/base.phs.jsonl.gz', which is
+    'out_muon_dir/muons/YYYY/MM/DD/base'.
+    """
+    return make_job(input_run_path, out_muon_dir)['output_muon_path']
+
+
 def qsub(
     input_phs_dir,
     out_muon_dir,
+    manifest_path=None,
+    retry_failed=False,
+    submitted_timeout_s=manifest.SUBMITTED_TIMEOUT_S,
+    target_runtime_s=None,
+    seconds_per_byte=None,
+    queue_max_runtime_s=packing.fact_queue_max_runtime_s,
 ):
     """
     Run the Muon extraction on all photon-stream runs in the 'phs' directory.
+
+    With a 'manifest_path', the runs to be processed are planned with the
+    manifest, see manifest.py, instead of checking the output of each run on
+    the file system. The workers record their result in the manifest. Runs
+    submitted longer than 'submitted_timeout_s' ago are planned again.
+
+    With a 'target_runtime_s', the runs are packed into jobs of about this
+    estimated runtime, which are processed by one worker each, see
+    packing.py. The runtime is estimated from the size of the input runs
+    with 'seconds_per_byte', which defaults to the runtimes of the runs done
+    in the manifest. Each job goes into the shortest queue of
+    'queue_max_runtime_s' which fits its estimated runtime, see
+    packing.choose_queue().
     """
     input_phs_dir = os.path.abspath(input_phs_dir)
     out_muon_dir = os.path.abspath(out_muon_dir)
@@ -24,6 +58,111 @@ def qsub(
 
     print('Start extracting muons...')
 
+    if manifest_path is None:
+        jobs = plan_jobs_with_glob(input_phs_dir, out_muon_dir)
+    else:
+        manifest_path = os.path.abspath(manifest_path)
+        connection = manifest.connect(manifest_path)
+        number_changed = manifest.scan(
+            connection,
+            input_phs_dir,
+            output_muon_path=lambda p: output_muon_path(p, out_muon_dir))
+        print('Manifest has', number_changed, 'new or changed runs.')
+        jobs = []
+        for run_path, size, out_path in manifest.runs_to_process(
+            connection,
+            retry_failed=retry_failed,
+            submitted_timeout_s=submitted_timeout_s
+        ):
+            job = make_job(run_path, out_muon_dir)
+            job['size'] = size
+            jobs.append(job)
+
+    print('There are', len(jobs), 'runs left to be processed.')
+
+    if target_runtime_s is not None:
+        if seconds_per_byte is None:
+            seconds_per_byte = packing.DEFAULT_SECONDS_PER_BYTE
+            if manifest_path is not None:
+                seconds_per_byte = packing.estimate_seconds_per_byte(
+                    connection)
+        for job in jobs:
+            if 'size' not in job:
+                job['size'] = os.path.getsize(job['input_run_path'])
+        groups = packing.pack_jobs(jobs, target_runtime_s, seconds_per_byte)
+        print('Packed into', len(groups), 'jobs.')
+        print('Submitt into qsub...')
+        plan_id = time.strftime('%Y%m%d_%H%M%S')
+        number_failed = 0
+        for i, group in enumerate(tqdm(groups)):
+            name = group_name(plan_id, i, group)
+            return_code = submit_group(
+                group,
+                name=name,
+                out_muon_dir=out_muon_dir,
+                runtime_s=packing.estimated_runtime_s(
+                    group, seconds_per_byte),
+                manifest_path=manifest_path,
+                queue_max_runtime_s=queue_max_runtime_s)
+            if return_code != 0:
+                # the runs are not marked submitted and are planned again
+                print(
+                    'qsub failed with', return_code,
+                    'for job', name, 'of', len(group), 'runs')
+                number_failed += 1
+                continue
+            if manifest_path is not None:
+                manifest.set_state(
+                    connection,
+                    [job['input_run_path'] for job in group],
+                    'submitted')
+        if number_failed > 0:
+            print(number_failed, 'of', len(groups), 'submissions failed.')
+        return
+
+    print('Submitt into qsub...')
+
+    number_failed = 0
+    for job in tqdm(jobs):
+        return_code = submit(job, out_muon_dir, manifest_path)
+        if return_code != 0:
+            # the run is not marked submitted and is planned again
+            print(
+                'qsub failed with', return_code,
+                'for', job['input_run_path'])
+            number_failed += 1
+            continue
+        if manifest_path is not None:
+            manifest.set_state(
+                connection, [job['input_run_path']], 'submitted')
+    if number_failed > 0:
+        print(number_failed, 'of', len(jobs), 'submissions failed.')
+
+
+def make_job(run_path, out_muon_dir):
+    run_path = os.path.abspath(run_path)
+    year = split(split(split(split(run_path)[0])[0])[0])[1]
+    month = split(split(split(run_path)[0])[0])[1]
+    night = split(split(run_path)[0])[1]
+    base = split(run_path)[1].split('.')[0]
+    return {
+        'input_run_path': run_path,
+        'year': year,
+        'month': month,
+        'night': night,
+        'base': base,
+        'output_muon_path': join(
+            out_muon_dir,
+            'muons',
+            year,
+            month,
+            night,
+            base
+        )
+    }
+
+
+def plan_jobs_with_glob(input_phs_dir, out_muon_dir):
     run_paths = glob.glob(join(input_phs_dir, '*/*/*/*.phs.jsonl.gz'))
 
     print('Found', len(run_paths), 'potential runs.')
@@ -31,28 +170,7 @@ def qsub(
 
     potential_jobs = []
     for run_path in tqdm(run_paths):
-
-        run_path = os.path.abspath(run_path)
-        year = split(split(split(split(run_path)[0])[0])[0])[1]
-        month = split(split(split(run_path)[0])[0])[1]
-        night = split(split(run_path)[0])[1]
-        base = split(run_path)[1].split('.')[0]
-        job = {
-            'input_run_path': run_path,
-            'year': year,
-            'month': month,
-            'night': night,
-            'base': base,
-            'output_muon_path': join(
-                out_muon_dir,
-                'muons',
-                year,
-                month,
-                night,
-                base
-            )
-        }
-        potential_jobs.append(job)
+        potential_jobs.append(make_job(run_path, out_muon_dir))
 
     print('Set up paths for', len(potential_jobs), 'potential runs.')
     print('Sort out all potential runs which were already processed...')
@@ -63,54 +181,111 @@ def qsub(
         existing_path = glob.glob(job['output_muon_path']+'*')
         if len(existing_path) == 0:
             jobs.append(job)
+    return jobs
 
-    print('There are', len(jobs), 'runs left to be processed.')
-    print('Submitt into qsub...')
 
-    for job in tqdm(jobs):
+def submit(job, out_muon_dir, manifest_path=None):
+    job['job_path'] = join(
+        out_muon_dir,
+        'job',
+        job['year'],
+        job['month'],
+        job['night'],
+        'fact_phs_muon_'+job['base']+'.sh')
 
-        job['job_path'] = join(
-            out_muon_dir,
-            'job',
-            job['year'],
-            job['month'],
-            job['night'],
-            'fact_phs_muon_'+job['base']+'.sh')
+    job['stdout_path'] = join(
+        out_muon_dir,
+        'std',
+        job['year'],
+        job['month'],
+        job['night'],
+        job['base']+'.o')
 
-        job['stdout_path'] = join(
-            out_muon_dir,
-            'std',
-            job['year'],
-            job['month'],
-            job['night'],
-            job['base']+'.o')
+    job['stderr_path'] = join(
+        out_muon_dir,
+        'std',
+        job['year'],
+        job['month'],
+        job['night'],
+        job['base']+'.e')
 
-        job['stderr_path'] = join(
-            out_muon_dir,
-            'std',
-            job['year'],
-            job['month'],
-            job['night'],
-            job['base']+'.e')
+    job_dir = os.path.split(job['job_path'])[0]
+    os.makedirs(job_dir, exist_ok=True, mode=0o755)
+
+    std_dir = os.path.split(job['stdout_path'])[0]
+    os.makedirs(std_dir, exist_ok=True, mode=0o755)
+
+    output_muon_dir = os.path.split(job['output_muon_path'])[0]
+    os.makedirs(output_muon_dir, exist_ok=True, mode=0o755)
+
+    write_worker_node_script(
+        path=job['job_path'],
+        input_run_path=job['input_run_path'],
+        output_muon_path=job['output_muon_path'],
+        manifest_path=manifest_path)
+
+    cmd = [ 'qsub',
+            '-q', fact_queues[np.random.randint(3)],
+            '-o', job['stdout_path'],
+            '-e', job['stderr_path'],
+            job['job_path']]
 
-        job_dir = os.path.split(job['job_path'])[0]
-        os.makedirs(job_dir, exist_ok=True, mode=0o755)
+    return sp.call(cmd)
 
-        std_dir = os.path.split(job['stdout_path'])[0]
-        os.makedirs(std_dir, exist_ok=True, mode=0o755)
 
+def group_name(plan_id, index, group):
+    """
+    Returns the name of the packed job of the 'group', unique for the
+    'plan_id', e.g. the time of planning, the index of the group in the
+    plan and a hash of its runs. A later plan does not overwrite the run
+    list of a job which may still be queued.
+    """
+    runs_hash = hashlib.sha1('\n'.join(
+        job['input_run_path'] for job in group).encode()).hexdigest()[:8]
+    return '{:s}_{:06d}_{:s}'.format(plan_id, index, runs_hash)
+
+
+def submit_group(
+    group,
+    name,
+    out_muon_dir,
+    runtime_s,
+    manifest_path=None,
+    queue_max_runtime_s=packing.fact_queue_max_runtime_s,
+):
+    """
+    Submits one worker job which processes all runs of the 'group', into
+    the queue of 'queue_max_runtime_s' for its estimated 'runtime_s'. The
+    'name' must be unique, see group_name(), an existing run list of the
+    same name is not overwritten.
+    """
+    job_dir = join(out_muon_dir, 'job', 'packed')
+    std_dir = join(out_muon_dir, 'std', 'packed')
+    os.makedirs(job_dir, exist_ok=True, mode=0o755)
+    os.makedirs(std_dir, exist_ok=True, mode=0o755)
+
+    runs = []
+    for job in group:
         output_muon_dir = os.path.split(job['output_muon_path'])[0]
         os.makedirs(output_muon_dir, exist_ok=True, mode=0o755)
+        runs.append({
+            'input_run_path': job['input_run_path'],
+            'output_muon_path': job['output_muon_path']})
+
+    job_list_path = join(job_dir, 'fact_phs_muon_' + name + '.json')
+    with open(job_list_path, 'xt') as fout:
+        json.dump(runs, fout, indent=0)
 
-        write_worker_node_script(
-            path=job['job_path'],
-            input_run_path=job['input_run_path'],
-            output_muon_path=job['output_muon_path'])
+    job_path = join(job_dir, 'fact_phs_muon_' + name + '.sh')
+    write_multi_run_worker_node_script(
+        path=job_path,
+        job_path=job_list_path,
+        manifest_path=manifest_path)
 
-        cmd = [ 'qsub',
-                '-q', fact_queues[np.random.randint(3)],
-                '-o', job['stdout_path'],
-                '-e', job['stderr_path'],
-                job['job_path']]
+    cmd = [ 'qsub',
+            '-q', packing.choose_queue(runtime_s, queue_max_runtime_s),
+            '-o', join(std_dir, name + '.o'),
+            '-e', join(std_dir, name + '.e'),
+            job_path]
 
-        qsub_return_code = sp.call(cmd)
+    return sp.call(cmd)
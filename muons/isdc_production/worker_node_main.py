@@ -1,14 +1,30 @@
 """
-Usage: phs_extract_muons -i=INPUT_RUN_PATH -o=OUT_PATH
+Usage: phs_extract_muons -i=INPUT_RUN_PATH -o=OUT_PATH [options]
 
 Options:
     -i --input_run_path=INPUT_RUN_PATH
     -o --out_path=OUT_PATH
+    --prefilter             Reject events with the cheap cuts of
+                            muons.prefilter.DEFAULT_PREFILTER before the
+                            clustering.
+    --workers=N             Number of processes for clustering and
+                            detection [default: 1].
+    --queue_depth=N         Maximum number of events in flight between
+                            reader and writer [default: 64].
+    --output_format=FMT     'jsonl' or 'phs' (binary photon-stream)
+                            [default: jsonl].
+    --manifest=PATH         Record runtime and exit status of the run in
+                            this job manifest, see manifest.py.
+    --stats                 Write the time of each stage, the number of
+                            events for each outcome and the peak RSS to
+                            out_path + '_muons.stats.json', see
+                            muons.instrumentation.
 
 Extracts muon events from the FACT photon stream. Writes two output files.
 
     1) A run of only muon like events.
-        out_path + '_muons.phs.jsonl.gz'
+        out_path + '_muons.phs.jsonl.gz', or with --output_format=phs
+        out_path + '_muons.phs'
 
     2) A binary info table with muon properties for each event.
         out_path + '_muons.info'
@@ -19,7 +35,12 @@ import docopt
 import os
 import shutil
 import tempfile
+import time
 from ..extraction import extract_muons_from_run
+from ..prefilter import DEFAULT_PREFILTER
+from ..phs_output import OUTPUT_FORMATS
+from ..instrumentation import STATS_SUFFIX
+from .manifest import record_result
 import datetime as dt
 from os.path import join
 from os.path import split
@@ -45,6 +66,73 @@ class TimeDeltaInfo(object):
             return info
 
 
+def extract_run(
+    input_run_path,
+    out_path,
+    tdi,
+    prefilter=None,
+    number_workers=1,
+    queue_depth=64,
+    output_format='jsonl',
+    stats=False
+):
+    """
+    Extracts the muons of one run on the worker node's temp. dir. and moves
+    the output to 'out_path' + suffix. With 'stats', the stats sidecar of
+    muons.instrumentation is written next to the '_muons.info'.
+    """
+    muon_run_suffix = OUTPUT_FORMATS[output_format]
+
+    out_muon_run_path = out_path + muon_run_suffix
+    out_muon_run_info_path = out_path + '_muons.info'
+    out_muon_run_stats_path = out_path + STATS_SUFFIX
+
+    out_dir = split(out_path)[0]
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True, mode=0o755)
+        print(tdi.info('Output directory was created.'))
+
+    with tempfile.TemporaryDirectory(prefix='relleums_fact_') as tmp:
+        print(tdi.info("Temp. dir was created on worker node: '"+tmp+"'"))
+
+        input_run_base = split(input_run_path)[1]
+        tmp_input_run_path = join(tmp, input_run_base)
+
+        shutil.copy(input_run_path, tmp_input_run_path)
+
+        tmp_out_muon_run_path = join(
+            tmp,
+            input_run_base + muon_run_suffix)
+        tmp_out_muon_run_info_path = join(
+            tmp,
+            input_run_base + '_muons.info')
+        tmp_out_muon_run_stats_path = join(
+            tmp,
+            input_run_base + STATS_SUFFIX)
+
+        print(tdi.info('Input run was copied to worker node temp. dir.'))
+
+        prefilter_counts = extract_muons_from_run(
+            input_run_path=tmp_input_run_path,
+            output_run_path=tmp_out_muon_run_path,
+            output_run_header_path=tmp_out_muon_run_info_path,
+            prefilter=prefilter,
+            number_workers=number_workers,
+            queue_depth=queue_depth,
+            output_format=output_format,
+            stats_path=tmp_out_muon_run_stats_path if stats else None)
+
+        print(tdi.info('Muons have been extracted.'))
+        print(tdi.info('Prefilter: '+str(prefilter_counts)))
+
+        shutil.copy(tmp_out_muon_run_path, out_muon_run_path)
+        shutil.copy(tmp_out_muon_run_info_path, out_muon_run_info_path)
+        if stats:
+            shutil.copy(tmp_out_muon_run_stats_path, out_muon_run_stats_path)
+
+        print(tdi.info('Done. Output has been moved to permanent storage'))
+
+
 def main():
     try:
         tdi = TimeDeltaInfo()
@@ -53,44 +141,29 @@ def main():
         arguments = docopt.docopt(__doc__)
 
         input_run_path = arguments['--input_run_path']
-        out_path = arguments['--out_path']
-
-        out_muon_run_path = out_path + '_muons.phs.jsonl.gz'
-        out_muon_run_info_path = out_path + '_muons.info'
-
-        out_dir = split(out_path)[0]
-        if out_dir:
-            os.makedirs(out_dir, exist_ok=True, mode=0o755)
-            print(tdi.info('Output directory was created.'))
-
-        with tempfile.TemporaryDirectory(prefix='relleums_fact_') as tmp:
-            print(tdi.info("Temp. dir was created on worker node: '"+tmp+"'"))
-
-            input_run_base = split(input_run_path)[1]
-            tmp_input_run_path = join(tmp, input_run_base)
-
-            shutil.copy(input_run_path, tmp_input_run_path)
-
-            tmp_out_muon_run_path = join(
-                tmp,
-                input_run_base + '_muons.phs.jsonl.gz')
-            tmp_out_muon_run_info_path = join(
-                tmp,
-                input_run_base + '_muons.info')
-
-            print(tdi.info('Input run was copied to worker node temp. dir.'))
-
-            extract_muons_from_run(
-                input_run_path=tmp_input_run_path,
-                output_run_path=tmp_out_muon_run_path,
-                output_run_header_path=tmp_out_muon_run_info_path)
-
-            print(tdi.info('Muons have been extracted.'))
-
-            shutil.copy(tmp_out_muon_run_path, out_muon_run_path)
-            shutil.copy(tmp_out_muon_run_info_path, out_muon_run_info_path)
-
-            print(tdi.info('Done. Output has been moved to permanent storage'))
+        manifest_path = arguments['--manifest']
+
+        start = time.time()
+        exit_status = 1
+        try:
+            extract_run(
+                input_run_path=input_run_path,
+                out_path=arguments['--out_path'],
+                tdi=tdi,
+                prefilter=(
+                    DEFAULT_PREFILTER if arguments['--prefilter'] else None),
+                number_workers=int(arguments['--workers']),
+                queue_depth=int(arguments['--queue_depth']),
+                output_format=arguments['--output_format'],
+                stats=arguments['--stats'])
+            exit_status = 0
+        finally:
+            if manifest_path is not None:
+                record_result(
+                    manifest_path=manifest_path,
+                    input_run_path=os.path.abspath(input_run_path),
+                    runtime_s=time.time() - start,
+                    exit_status=exit_status)
 
     except docopt.DocoptExit as e:
         print(e)
@@ -4,7 +4,8 @@ import os, stat
 def write_worker_node_script(
     path,
     input_run_path,
-    output_muon_path):
+    output_muon_path,
+    manifest_path=None):
     """
     Writes an executable bash script for a worker node to extract the muons
     from one fact photon-stream run.
@@ -13,7 +14,32 @@ def write_worker_node_script(
     sh += 'source /home/guest/relleums/.bashrc\n'
     sh += 'eval "phs_extract_muons'
     sh += ' -i ' + input_run_path
-    sh += ' -o ' + output_muon_path + '"\n'
+    sh += ' -o ' + output_muon_path
+    if manifest_path is not None:
+        sh += ' --manifest ' + manifest_path
+    sh += '"\n'
+    with open(path, 'w') as fout:
+        fout.write(sh)
+
+    st = os.stat(path)
+    os.chmod(path, st.st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def write_multi_run_worker_node_script(
+    path,
+    job_path,
+    manifest_path=None):
+    """
+    Writes an executable bash script for a worker node to extract the muons
+    from all the fact photon-stream runs listed in the JSON 'job_path'.
+    """
+    sh = '#!/bin/bash\n'
+    sh += 'source /home/guest/relleums/.bashrc\n'
+    sh += 'eval "phs_extract_muons_many'
+    sh += ' --job ' + job_path
+    if manifest_path is not None:
+        sh += ' --manifest ' + manifest_path
+    sh += '"\n'
     with open(path, 'w') as fout:
         fout.write(sh)
 
@@ -0,0 +1,88 @@
+"""
+Compare the throughput of the vectorized circle RANSAC with the
+skimage.measure.ransac path on toy muon rings.
+
+Usage: ransac_benchmark.py [--number_events=NBR] [--number_photons=NBR] [--random_seed=INT]
+
+Options:
+    --number_events=NBR     [default: 2000] Number of toy events
+    --number_photons=NBR    [default: 300] Mean number of photons per event
+    --random_seed=INT       [default: 1] Random seed
+"""
+import docopt
+import time
+import numpy as np
+from skimage.measure import ransac
+from skimage.measure import CircleModel
+from muons.circle_ransac import circle_ransac
+
+deg2rad = np.deg2rad(1)
+
+
+def toy_rings(number_events, number_photons, prng):
+    events = []
+    for i in range(number_events):
+        n = max(3, prng.poisson(number_photons))
+        cx, cy = prng.uniform(-1.5*deg2rad, 1.5*deg2rad, size=2)
+        r = prng.uniform(0.45*deg2rad, 1.6*deg2rad)
+        phi = prng.uniform(0, 2*np.pi, n)
+        xy = np.c_[cx + r*np.cos(phi), cy + r*np.sin(phi)]
+        xy += prng.normal(0, 0.05*deg2rad, size=(n, 2))
+        number_nsb = n//5
+        xy[:number_nsb] = prng.uniform(
+            -2.25*deg2rad, 2.25*deg2rad, size=(number_nsb, 2))
+        events.append(xy)
+    return events
+
+
+def skimage_path(xy, residual_threshold, max_trials, seed):
+    with np.errstate(invalid='ignore'):
+        model, inliers = ransac(
+            xy,
+            CircleModel,
+            min_samples=3,
+            residual_threshold=residual_threshold,
+            max_trials=max_trials,
+            rng=seed)
+    return model, inliers
+
+
+def vectorized_path(xy, residual_threshold, max_trials, seed):
+    return circle_ransac(
+        xy,
+        residual_threshold=residual_threshold,
+        min_samples=3,
+        max_trials=max_trials,
+        random_state=seed)
+
+
+def events_per_second(fit, events, residual_threshold, max_trials):
+    start = time.perf_counter()
+    for seed, xy in enumerate(events):
+        fit(xy, residual_threshold, max_trials, seed)
+    return len(events)/(time.perf_counter() - start)
+
+
+def main():
+    try:
+        arguments = docopt.docopt(__doc__)
+        prng = np.random.RandomState(int(arguments['--random_seed']))
+        events = toy_rings(
+            number_events=int(arguments['--number_events']),
+            number_photons=int(arguments['--number_photons']),
+            prng=prng)
+        residual_threshold = 0.25*deg2rad
+        max_trials = 15
+        for name, fit in [
+            ('skimage.measure.ransac', skimage_path),
+            ('muons.circle_ransac', vectorized_path),
+        ]:
+            rate = events_per_second(
+                fit, events, residual_threshold, max_trials)
+            print('{:<24s} {:10.1f} events/s'.format(name, rate))
+    except docopt.DocoptExit as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,264 @@
+"""
+Measure the throughput of the muon detection methods, keep the results in
+a history file and flag regressions against earlier results.
+
+Usage:
+    throughput_benchmark.py run [--history=PATH] [--label=TEXT] [--number_simulated=NBR] [--random_seed=INT] [--repetitions=NBR] [--methods=NAMES]
+    throughput_benchmark.py compare [--history=PATH] [--tolerance=FRACTION] [--baseline=NBR]
+
+Options:
+    --history=PATH          [default: detection_throughput.jsonl] JSON-lines
+                            history, one record per sample and method
+    --label=TEXT            [default: ] Free text stored with the records,
+                            e.g. the change under test
+    --number_simulated=NBR  [default: 0] Number of muons simulated as an
+                            additional, larger sample
+    --random_seed=INT       [default: 1] Random seed of the simulated sample
+                            and of the detection
+    --repetitions=NBR       [default: 3] Passes over each sample, the
+                            fastest pass is reported
+    --methods=NAMES         [default: detection,detection_with_simple_ring_fit,advanced_detection]
+                            Comma separated methods to benchmark
+    --tolerance=FRACTION    [default: 0.1] Allowed relative loss of events/s
+                            and relative gain of the 90th percentile latency
+    --baseline=NBR          [default: 5] Number of earlier records whose
+                            median is the baseline
+
+'run' measures each method on the 100 simulated muons in tests/resources
+and optionally on a larger simulated sample. For each event the clustering
+and the detection are timed separately. The events are read before the
+timing starts.
+
+'compare' compares the latest record of each (host, sample, method) with
+the median of the earlier records of the same host, sample and method. The
+exit status is 1 when any regression is found.
+"""
+import docopt
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import photon_stream as ps
+import pkg_resources
+import muons
+from muons.muon_ring_simulation import eventsDistribution as ed
+
+RESOURCE_SAMPLE = '100simulations_psf0.0.sim.phs'
+
+
+def detection_method(name):
+    if name == 'detection':
+        return muons.detection
+    if name == 'detection_with_simple_ring_fit':
+        return (
+            muons.detection_with_simple_ring_fit.
+            detection_with_simple_ring_fit)
+    if name == 'advanced_detection':
+        # needs circlehough, so it is only imported when benchmarked
+        from muons.analysis_utensils import advanced_detection
+        return advanced_detection.detection
+    raise KeyError("Unknown detection method '{}'.".format(name))
+
+
+def read_resource_sample():
+    path = pkg_resources.resource_filename(
+        'muons', os.path.join('tests', 'resources', RESOURCE_SAMPLE))
+    return list(ps.EventListReader(path))
+
+
+def simulate_sample(number_muons, random_seed):
+    """
+    Returns simulated muon events, with the defaults of scoop_simulation.py
+    and NSB rates up to the maximum. The sample is reproduced by the
+    'random_seed' alone, see eventsDistribution.event_prng().
+    """
+    with tempfile.TemporaryDirectory(prefix='muons_benchmark_') as tmp:
+        jobs = ed.create_jobs(
+            output_dir=tmp,
+            number_of_muons=number_muons,
+            max_inclination=3.0,
+            max_aperture_radius=5.0,
+            min_opening_angle=np.deg2rad(0.4),
+            max_opening_angle=np.deg2rad(1.6),
+            min_nsb_rate=28e6,
+            max_nsb_rate=140e6,
+            random_seed=random_seed)
+        path = os.path.join(tmp, 'sample.sim.phs')
+        with open(path, 'wb') as fout:
+            for job in jobs:
+                ps.io.binary.append_event_to_file(ed.run_job(job), fout)
+        return list(ps.EventListReader(path))
+
+
+def time_method(method, events, random_seed):
+    """
+    Returns the seconds of the clustering and of the detection of each
+    event.
+    """
+    # The methods draw their initial circle models from the global state.
+    np.random.seed(random_seed)
+    clustering_s = np.zeros(len(events))
+    detection_s = np.zeros(len(events))
+    for i, event in enumerate(events):
+        start = time.perf_counter()
+        clusters = ps.PhotonStreamCluster(event.photon_stream)
+        clustered = time.perf_counter()
+        method(event, clusters)
+        detection_s[i] = time.perf_counter() - clustered
+        clustering_s[i] = clustered - start
+    return clustering_s, detection_s
+
+
+def summarize(clustering_s, detection_s):
+    latency_s = clustering_s + detection_s
+    total_s = latency_s.sum()
+    return {
+        'number_events': int(latency_s.shape[0]),
+        'events_per_s': latency_s.shape[0]/total_s,
+        'latency_p50_s': float(np.percentile(latency_s, 50)),
+        'latency_p90_s': float(np.percentile(latency_s, 90)),
+        'latency_p99_s': float(np.percentile(latency_s, 99)),
+        'clustering_s': float(clustering_s.sum()),
+        'detection_s': float(detection_s.sum()),
+        'clustering_fraction': float(clustering_s.sum()/total_s),
+    }
+
+
+def benchmark(methods, samples, repetitions, random_seed):
+    """
+    Returns one record for each sample and method. Of the 'repetitions'
+    passes over a sample, the one with the most events/s is kept.
+    """
+    records = []
+    for sample_name, events in samples:
+        for method_name, method in methods:
+            summaries = [
+                summarize(*time_method(method, events, random_seed))
+                for repetition in range(repetitions)]
+            best = max(summaries, key=lambda s: s['events_per_s'])
+            best['sample'] = sample_name
+            best['method'] = method_name
+            records.append(best)
+    return records
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def append_to_history(history_path, records, label):
+    context = {
+        'unix_time': time.time(),
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'commit': git_commit(),
+        'label': label,
+    }
+    with open(history_path, 'at') as fout:
+        for record in records:
+            record = dict(record, **context)
+            fout.write(json.dumps(record) + '\n')
+
+
+def read_history(history_path):
+    with open(history_path, 'rt') as fin:
+        return [json.loads(line) for line in fin if line.strip()]
+
+
+def find_regressions(history, tolerance=0.1, baseline=5):
+    """
+    Returns the latest records of each (host, sample, method) which are
+    slower than the median of up to 'baseline' earlier records, together
+    with that median. Slower is a loss of events/s, or a gain of the 90th
+    percentile latency, larger than 'tolerance'.
+    """
+    by_key = {}
+    for record in history:
+        key = (record['host'], record['sample'], record['method'])
+        by_key.setdefault(key, []).append(record)
+    regressions = []
+    for key, records in sorted(by_key.items()):
+        if len(records) < 2:
+            continue
+        latest = records[-1]
+        earlier = records[-1 - baseline:-1]
+        median = {
+            name: float(np.median([r[name] for r in earlier]))
+            for name in ['events_per_s', 'latency_p90_s']}
+        if (
+            latest['events_per_s'] < (1 - tolerance)*median['events_per_s']
+            or
+            latest['latency_p90_s'] > (1 + tolerance)*median['latency_p90_s']
+        ):
+            regressions.append((latest, median))
+    return regressions
+
+
+def print_record(record):
+    print(
+        '{:<16s} {:<32s} {:9.1f} events/s  p50 {:7.2f}ms  p90 {:7.2f}ms  '
+        'p99 {:7.2f}ms  clustering {:5.1%}'.format(
+            record['sample'],
+            record['method'],
+            record['events_per_s'],
+            record['latency_p50_s']*1e3,
+            record['latency_p90_s']*1e3,
+            record['latency_p99_s']*1e3,
+            record['clustering_fraction']))
+
+
+def main():
+    try:
+        arguments = docopt.docopt(__doc__)
+        history_path = arguments['--history']
+        if arguments['run']:
+            random_seed = int(arguments['--random_seed'])
+            methods = [
+                (name, detection_method(name))
+                for name in arguments['--methods'].split(',')]
+            samples = [('resource', read_resource_sample())]
+            number_simulated = int(arguments['--number_simulated'])
+            if number_simulated > 0:
+                samples.append((
+                    'simulated_{:d}'.format(number_simulated),
+                    simulate_sample(number_simulated, random_seed)))
+            records = benchmark(
+                methods=methods,
+                samples=samples,
+                repetitions=int(arguments['--repetitions']),
+                random_seed=random_seed)
+            for record in records:
+                print_record(record)
+            append_to_history(history_path, records, arguments['--label'])
+        elif arguments['compare']:
+            regressions = find_regressions(
+                read_history(history_path),
+                tolerance=float(arguments['--tolerance']),
+                baseline=int(arguments['--baseline']))
+            for latest, median in regressions:
+                print('REGRESSION')
+                print_record(latest)
+                print(
+                    '    baseline {:9.1f} events/s  p90 {:7.2f}ms'.format(
+                        median['events_per_s'],
+                        median['latency_p90_s']*1e3))
+            if regressions:
+                sys.exit(1)
+            print('No regressions.')
+    except docopt.DocoptExit as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
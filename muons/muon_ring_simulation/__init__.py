@@ -1,2 +1,3 @@
 from . import eventsDistribution
 from . import single_simulation
+from . import simulation_truth
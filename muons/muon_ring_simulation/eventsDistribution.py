@@ -1,43 +1,67 @@
 import numpy as np
 from muons.muon_ring_simulation import single_simulation as rs
+from muons.muon_ring_simulation import simulation_truth
 import os
-from numbers import Number
+import glob
+import shutil
 import photon_stream as ps
 
+TRAJECTORY_STREAM = 0
+RESPONSE_STREAM = 1
+NSB_OVERLAY_STREAM = 2
 
-def draw_position_on_aperture_plane(max_aperture_radius):
-    theta = np.random.uniform(
+CHUNK_SUFFIX = '.sim.phs.chunk'
+OFFSETS_SUFFIX = '.offsets.npy'
+offsets_dtype = np.dtype([('event_id', np.uint64), ('offset', np.uint64)])
+
+
+def event_prng(random_seed, event_id, stream):
+    """
+    Returns the np.random.Generator of one 'stream' of the event 'event_id'.
+    It is the child (event_id, stream) of np.random.SeedSequence(random_seed),
+    so it does not depend on the other events, on how the events are
+    chunked, or on which worker simulates them.
+    """
+    return np.random.default_rng(np.random.SeedSequence(
+        entropy=random_seed,
+        spawn_key=(event_id, stream)))
+
+
+def draw_position_on_aperture_plane(max_aperture_radius, prng=None):
+    prng = np.random if prng is None else prng
+    theta = prng.uniform(
         low=0,
         high=2 * np.pi)
-    b = np.random.uniform(
+    b = prng.uniform(
         low=0,
         high=1)
     return theta, np.sqrt(b)*max_aperture_radius
 
 
-def draw_inclination(low=0, high=np.pi/2, size=1):
+def draw_inclination(low=0, high=np.pi/2, size=1, prng=None):
+    prng = np.random if prng is None else prng
     v_min = (np.cos(low)+1)/2
     v_max = (np.cos(high)+1)/2
-    v = np.random.uniform(
-        low=v_min,
-        high=v_max,
-        size=size)
+    # v_max < v_min, which np.random.Generator.uniform() does not accept
+    v = v_min + (v_max - v_min)*prng.uniform(size=size)
     return np.arccos(2*v - 1)
 
 
-def draw_azimuth(low=0, high=2*np.pi, size=1):
-    return np.random.uniform(
+def draw_azimuth(low=0, high=2*np.pi, size=1, prng=None):
+    prng = np.random if prng is None else prng
+    return prng.uniform(
         low=low,
         high=high,
         size=size)
 
 
-def get_trajectory(max_inclination, max_aperture_radius):
+def get_trajectory(max_inclination, max_aperture_radius, prng=None):
     max_inclination = np.deg2rad(max_inclination)
-    inclination = draw_inclination(high=max_inclination)
-    azimuth = draw_azimuth()
+    inclination = draw_inclination(high=max_inclination, prng=prng)
+    azimuth = draw_azimuth(prng=prng)
     muon_direction_ground = rs.pol2cart(1, azimuth, inclination)
-    theta, b = draw_position_on_aperture_plane(max_aperture_radius)
+    theta, b = draw_position_on_aperture_plane(
+        max_aperture_radius, prng=prng)
     muon_support_ground = rs.pol2cart(b, theta, 0.5*np.pi)
     return muon_support_ground, muon_direction_ground
 
@@ -75,25 +99,37 @@ def create_jobs(
     ch_rate=3,
     fact_aperture_radius=1.965,
     random_seed=1,
-    point_spread_function=0
+    point_spread_function=0,
+    cull_invisible=True
 ):
+    """
+    Returns the jobs to simulate 'number_of_muons' muons, and writes their
+    simulation truth to 'output_dir'.
+    With 'cull_invisible', the jobs of muons whose geometry does not allow
+    any photon to reach the camera are marked with is_simulated = False,
+    see single_simulation.may_produce_visible_ring(). Their events only
+    contain the night sky background.
+    """
     jobs = []
     new_dicts = []
+    if cull_invisible:
+        field_of_view_radius = rs.fact_field_of_view_radius()
     for event_id in range(number_of_muons):
         job = {}
-        opening_angle = np.random.uniform(min_opening_angle, max_opening_angle)
+        prng = event_prng(random_seed, event_id, TRAJECTORY_STREAM)
+        opening_angle = prng.uniform(min_opening_angle, max_opening_angle)
         muon_support_ground, muon_direction_ground = get_trajectory(
             max_inclination,
-            max_aperture_radius
+            max_aperture_radius,
+            prng=prng
         )
         casual_muon_support, casual_muon_direction = casual_trajectory(
             muon_support_ground,
             muon_direction_ground
         )
-        nsb_rate = float(np.random.uniform(
+        nsb_rate = float(prng.uniform(
             low=min_nsb_rate,
-            high=max_nsb_rate,
-            size=1
+            high=max_nsb_rate
         ))
         job["output_dir"] = output_dir
         job["casual_muon_support"] = casual_muon_support
@@ -107,6 +143,14 @@ def create_jobs(
         job["random_seed"] = random_seed
         job["point_spread_function"] = point_spread_function
         job["muon_support_ground"] = muon_support_ground
+        job["is_simulated"] = (
+            not cull_invisible or rs.may_produce_visible_ring(
+                casual_muon_support=casual_muon_support,
+                casual_muon_direction=casual_muon_direction,
+                opening_angle=opening_angle,
+                fact_aperture_radius=fact_aperture_radius,
+                point_spread_function_std=point_spread_function,
+                field_of_view_radius=field_of_view_radius))
         jobs.append(job)
         new_job_dict = job.copy()
         del new_job_dict["output_dir"]
@@ -116,8 +160,15 @@ def create_jobs(
 
 
 def run_job(job):
-    output_dir = job['output_dir']
     event_id = job['event_id']
+    prng = event_prng(job["random_seed"], event_id, RESPONSE_STREAM)
+    if not job.get("is_simulated", True):
+        return rs.create_event(
+            arrival_times=np.zeros(0),
+            ch_CHIDs=np.zeros(0, dtype=np.int64),
+            event_id=event_id,
+            nsb_rate_per_pixel=job["nsb_rate"],
+            prng=prng)
     event = rs.simulate_response(
         casual_muon_support=job["casual_muon_support"],
         casual_muon_direction=job["casual_muon_direction"],
@@ -127,58 +178,86 @@ def run_job(job):
         arrival_time_std=job["arrival_time_std"],
         ch_rate=job["ch_rate"],
         fact_aperture_radius=job["fact_aperture_radius"],
-        point_spread_function_std=job["point_spread_function"]
+        point_spread_function_std=job["point_spread_function"],
+        prng=prng
     )
     return event
 
 
+def chunk_path(output_dir, chunk_index):
+    return os.path.join(
+        output_dir, "{:06d}".format(chunk_index) + CHUNK_SUFFIX)
+
+
 def run_chunk_job(chunk_job):
-    events = []
+    """
+    Simulates the events of a chunk into chunk_job["path"]. The byte offset
+    of each event in the chunk is written to chunk_job["path"] +
+    OFFSETS_SUFFIX.
+    """
     simulationPath = chunk_job["path"]
-    for job in chunk_job["jobs"]:
-        event = run_job(job)
-        events.append(event)
+    offsets = np.zeros(len(chunk_job["jobs"]), dtype=offsets_dtype)
     with open(simulationPath + ".temp", "wb") as fOut:
-        for event in events:
+        for i, job in enumerate(chunk_job["jobs"]):
+            event = run_job(job)
+            offsets[i] = (job["event_id"], fOut.tell())
             ps.io.binary.append_event_to_file(event, fOut)
+    np.save(simulationPath + OFFSETS_SUFFIX, offsets)
     os.rename(simulationPath + ".temp", simulationPath)
     return 0
 
 
+def merge_chunks(output_dir, output_path, buffer_size=2**24):
+    """
+    Concatenates the chunks in 'output_dir' in the order of their chunk
+    index into 'output_path', and removes them. The chunks are streamed
+    with buffers of 'buffer_size' bytes. The byte offsets of the events
+    are written to 'output_path' + OFFSETS_SUFFIX, see read_offsets().
+    Returns the number of chunks merged.
+    """
+    chunk_paths = sorted(
+        glob.glob(os.path.join(output_dir, "*" + CHUNK_SUFFIX)),
+        key=lambda path: int(os.path.basename(path).split(".")[0]))
+    offsets = []
+    with open(output_path + ".temp", "wb") as fOut:
+        for path in chunk_paths:
+            chunk_offsets = np.load(path + OFFSETS_SUFFIX)
+            chunk_offsets["offset"] += np.uint64(fOut.tell())
+            offsets.append(chunk_offsets)
+            with open(path, "rb") as fIn:
+                shutil.copyfileobj(fIn, fOut, buffer_size)
+    if offsets:
+        offsets = np.concatenate(offsets)
+    else:
+        offsets = np.zeros(0, dtype=offsets_dtype)
+    np.save(output_path + OFFSETS_SUFFIX, offsets)
+    os.rename(output_path + ".temp", output_path)
+    for path in chunk_paths:
+        os.remove(path)
+        os.remove(path + OFFSETS_SUFFIX)
+    return len(chunk_paths)
 
-def save_simulationTruth(jobs, output_dir):
-    filename = "simulationtruth.csv"
-    simTruthPath = os.path.join(output_dir, filename)
-    header, values = get_header_and_values(jobs)
-    np.savetxt(
-        simTruthPath,
-        values,
-        fmt = "%s",
-        delimiter=",",
-        comments="",
-        header=header
-    )
+
+def read_offsets(simulation_path):
+    """
+    Returns a dict of the byte offset of each event_id in the simulation
+    file. Seek to the offset to read the event with the photon-stream
+    binary reader.
+    """
+    offsets = np.load(simulation_path + OFFSETS_SUFFIX)
+    return dict(zip(
+        offsets["event_id"].tolist(), offsets["offset"].tolist()))
 
 
-def create_new_dict(dictionary):
-    keys = dictionary.keys()
-    new_dict = {}
-    for key in keys:
-        if isinstance(dictionary[key], Number):
-            new_dict[key] = dictionary[key]
-        else:
-            for i, value in enumerate(dictionary[key]):
-                new_key = "_".join([key, str(i)])
-                new_dict[new_key] = value
-    return new_dict
-
-
-def get_header_and_values(dictionaries):
-    values = []
-    for dictionary in dictionaries:
-        new_dict = create_new_dict(dictionary)
-        value = list(new_dict.values())
-        values.append(value)
-    headers = new_dict.keys()
-    header = ",".join(headers)
-    return header, values
+def save_simulationTruth(jobs, output_dir):
+    """
+    Writes the simulation truth of the 'jobs' to 'simulationtruth.npy' in
+    'output_dir', and exports it to 'simulationtruth.csv'.
+    """
+    truth = simulation_truth.from_jobs(jobs, key_aliases={
+        "nsb_rate_per_pixel": "nsb_rate",
+        "point_spread_function_std": "point_spread_function"})
+    simulation_truth.write(
+        os.path.join(output_dir, "simulationtruth.npy"), truth)
+    simulation_truth.export_csv(
+        os.path.join(output_dir, "simulationtruth.csv"), truth)
@@ -16,9 +16,9 @@ Options:
     --arrival_time_std=STD             [default: 500e-12] Standard deviation of the arrival times of photons
     --ch_rate=CHR                      [default: 3.0] Rate of Cherenkov photons to be generated per meter
     --fact_aperture_radius=RDS         [default: 1.965] Aperture radius of FACT telescope in m
-    --random_seed=INT                  [default: 1] Random seed
+    --random_seed=INT                  [default: 1] Random seed, each muon is simulated with its own stream of it, see eventsDistribution.event_prng()
     --point_spread_function_std=FLT    [default: 0] Standard deviation of the point spread function
-    --chunck_files=BOOL                [default: False] Whether to chunck the simulation files into one big file
+    --chunck_files=BOOL                [default: False] Whether to merge the simulation chunks into one big file, with the byte offset of each event in 'simulations.sim.phs.offsets.npy'
 """
 import docopt
 import scoop
@@ -26,14 +26,12 @@ from muons.muon_ring_simulation import eventsDistribution as ed
 import photon_stream as ps
 import numpy as np
 import os
-import glob
 
 
 def main():
     try:
         arguments = docopt.docopt(__doc__)
         rndm_seed = int(arguments['--random_seed'])
-        np.random.seed(seed=rndm_seed)
         output_dir = arguments["--output_dir"]
         if not os.path.isdir(output_dir):
             os.makedirs(output_dir)
@@ -72,7 +70,7 @@ def main():
             jobs_in_chunk.append(job)
             if (len(jobs_in_chunk) == NUM_EVENTS_IN_CHUNK) or i == len(jobs) - 1:
                 chunk_job = {
-                    "path": os.path.join(output_dir, "{:06d}.sim.phs.chunk".format(chunk_index)),
+                    "path": ed.chunk_path(output_dir, chunk_index),
                     "jobs": jobs_in_chunk 
                 }
                 chunk_jobs.append(chunk_job)
@@ -83,12 +81,9 @@ def main():
             scoop.futures.map(ed.run_chunk_job, chunk_jobs)
         )
         if arguments['--chunck_files'] == "True":
-            with open(os.path.join(output_dir, "simulations.sim.phs"), "wb") as fOut:
-                wild_card_path = os.path.join(output_dir, "*.sim.phs.chunk")
-                for path in glob.glob(wild_card_path):
-                    with open(path, "rb") as fIn:
-                        fOut.write(fIn.read())
-                    os.remove(path)
+            ed.merge_chunks(
+                output_dir=output_dir,
+                output_path=os.path.join(output_dir, "simulations.sim.phs"))
     except docopt.DocoptExit as e:
         print(e)
 
@@ -0,0 +1,152 @@
+"""
+The simulation truth of simulated muons, one row for each event, stored as
+a structured '.simulationtruth.npy' array. The CSV '.simulationtruth.csv'
+is only written as an export, e.g. for pandas.
+Muons with 'is_simulated' 0 were culled for their geometry, their events
+contain no Cherenkov photons.
+"""
+import os
+import numpy as np
+
+NPY_SUFFIX = '.simulationtruth.npy'
+CSV_SUFFIX = '.simulationtruth.csv'
+
+VECTOR_COLUMNS = [
+    'casual_muon_support',
+    'casual_muon_direction',
+    'muon_support_ground',
+]
+
+# of columns which older jobs and CSV files do not have
+DEFAULTS = {
+    'is_simulated': 1,
+    # the muons are supported on the ground, z = 0
+    'muon_support_ground2': 0.0,
+}
+
+# column names of the CSV files of earlier versions
+LEGACY_NAMES = {
+    'nsb_rate_per_pixel': 'nsb_rate',
+    'point_spread_function_std': 'point_spread_function',
+}
+for _vector in VECTOR_COLUMNS:
+    for _component in range(3):
+        LEGACY_NAMES[_vector + str(_component)] = (
+            _vector + '_' + str(_component))
+
+simulation_truth_dtype = np.dtype([
+    ('casual_muon_support0', np.float64),
+    ('casual_muon_support1', np.float64),
+    ('casual_muon_support2', np.float64),
+    ('casual_muon_direction0', np.float64),
+    ('casual_muon_direction1', np.float64),
+    ('casual_muon_direction2', np.float64),
+    ('event_id', np.int64),
+    ('nsb_rate_per_pixel', np.float64),
+    ('ch_rate', np.float64),
+    ('opening_angle', np.float64),
+    ('fact_aperture_radius', np.float64),
+    ('arrival_time_std', np.float64),
+    ('random_seed', np.int64),
+    ('point_spread_function_std', np.float64),
+    ('muon_support_ground0', np.float64),
+    ('muon_support_ground1', np.float64),
+    ('muon_support_ground2', np.float64),
+    ('is_simulated', np.int64),
+])
+
+
+def from_jobs(jobs, key_aliases=None):
+    """
+    Returns the simulation truth of the simulation 'jobs', a list of dicts.
+    The vectors, e.g. 'casual_muon_support', are split into one column for
+    each component.
+
+    Parameter
+    ---------
+    jobs            The simulation jobs.
+
+    key_aliases     Maps a column name to the key used in the jobs, when
+                    they differ. None when all keys are the column names.
+    """
+    key_aliases = key_aliases or {}
+    truth = np.zeros(len(jobs), dtype=simulation_truth_dtype)
+    if len(jobs) == 0:
+        return truth
+    for name in VECTOR_COLUMNS:
+        key = key_aliases.get(name, name)
+        vectors = np.array([job[key] for job in jobs], dtype=np.float64)
+        vectors = vectors.reshape(len(jobs), -1)
+        for component in range(vectors.shape[1]):
+            truth[name + str(component)] = vectors[:, component]
+    for name in simulation_truth_dtype.names:
+        if name[:-1] in VECTOR_COLUMNS:
+            continue
+        key = key_aliases.get(name, name)
+        truth[name] = [job.get(key, DEFAULTS.get(key)) for job in jobs]
+    return truth
+
+
+def write(path, truth):
+    """
+    Writes the simulation 'truth' as '.npy' to 'path'.
+    """
+    # np.save() appends no '.npy' when writing to a file object
+    with open(path + '.temp', 'wb') as fout:
+        np.save(fout, truth)
+    os.replace(path + '.temp', path)
+
+
+def export_csv(path, truth):
+    """
+    Writes the simulation 'truth' as CSV to 'path'.
+    """
+    fmt = [
+        '%d' if truth.dtype[name].kind == 'i' else '%f'
+        for name in truth.dtype.names]
+    np.savetxt(
+        path,
+        truth,
+        fmt=fmt,
+        delimiter=',',
+        comments='',
+        header=','.join(truth.dtype.names))
+
+
+def read(path):
+    """
+    Returns the simulation truth in 'path', a '.npy' file, or a CSV file as
+    written by export_csv() or by earlier versions of the simulation.
+    Columns of a CSV file are also found by their LEGACY_NAMES. Missing
+    columns are set to their DEFAULTS, other missing columns raise a
+    ValueError.
+    """
+    if path.endswith('.npy'):
+        return np.load(path)
+    table = np.genfromtxt(path, delimiter=',', names=True, ndmin=1)
+    truth = np.zeros(table.shape[0], dtype=simulation_truth_dtype)
+    for name in simulation_truth_dtype.names:
+        if name in table.dtype.names:
+            truth[name] = table[name]
+        elif LEGACY_NAMES.get(name) in table.dtype.names:
+            truth[name] = table[LEGACY_NAMES[name]]
+        elif name in DEFAULTS:
+            truth[name] = DEFAULTS[name]
+        else:
+            raise ValueError(
+                "The simulation truth '{}' has no column '{}'.".format(
+                    path, name))
+    return truth
+
+
+def index_by_event_id(truth):
+    """
+    Returns the simulation truth as an array indexed by event_id. Rows of
+    event_ids which are not in 'truth' are zero.
+    """
+    if truth.shape[0] == 0:
+        return truth
+    indexed = np.zeros(truth['event_id'].max() + 1, dtype=truth.dtype)
+    indexed[truth['event_id']] = truth
+    return indexed
+
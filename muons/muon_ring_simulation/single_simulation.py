@@ -1,15 +1,15 @@
 import numpy as np
 import fact
-import scipy
+import scipy.spatial
 import photon_stream as ps
-import single_photon_extractor as spe
 
 
 def pol2cart(r, azimuth, inclination):
     x = r * np.cos(azimuth) * np.sin(inclination)
     y = r * np.sin(azimuth) * np.sin(inclination)
     z = r * np.cos(inclination)
-    return np.array([float(x), float(y), float(z)])
+    # x, y, z are scalars or arrays of size 1
+    return np.array([x, y, z], dtype=np.float64).reshape(3)
 
 
 def position_on_ray(support, direction, alpha):
@@ -25,32 +25,45 @@ def emit_photons(
     casual_muon_support,
     casual_muon_direction,
     opening_angle,
-    ch_rate
+    ch_rate,
+    prng=None
 ):
-    casual_muon_support = np.array(casual_muon_support)
-    casual_muon_direction = np.array(casual_muon_direction)
-    path_length = 0
-    photon_emission_pos = []
-    photon_directions = []
+    """
+    Returns the emission positions and the directions of the Cherenkov
+    photons of a muon, emitted with 'ch_rate' photons per meter along its
+    path from the 'casual_muon_support' down to the ground (z = 0).
+    The photons of this Poisson process are drawn all at once: their number
+    for the path length, and their path lengths uniformly along the path.
+    This is statistically equivalent to walking along the path in
+    exponentially distributed steps of get_d_alpha().
+    The photons are drawn from 'prng', a np.random.Generator, or from the
+    global np.random state when None.
+    """
+    prng = np.random if prng is None else prng
+    casual_muon_support = np.array(casual_muon_support, dtype=np.float64)
+    casual_muon_direction = np.array(casual_muon_direction, dtype=np.float64)
+    if casual_muon_direction[2] >= 0:
+        raise ValueError(
+            'The muon must travel down to the ground, but its direction '
+            'has z = {}.'.format(casual_muon_direction[2]))
+    path_length_to_ground = max(
+        0.0, -casual_muon_support[2]/casual_muon_direction[2])
+    number_photons = prng.poisson(ch_rate*path_length_to_ground)
+    path_lengths = np.sort(
+        prng.uniform(0, path_length_to_ground, number_photons))
+    photon_emission_pos = position_on_ray(
+        casual_muon_support,
+        casual_muon_direction,
+        path_lengths[:, np.newaxis])
     u, v = get_u_v(casual_muon_direction)
-    while True:
-        d_alpha = get_d_alpha(ch_rate)
-        path_length += d_alpha
-        ch_emission_position = position_on_ray(
-            casual_muon_support,
-            casual_muon_direction,
-            path_length
-        )
-        if ch_emission_position[2] <= 0:
-            break
-        photon_emission_pos.append(ch_emission_position)
-        direction_of_photon = draw_direction_of_cherenkov_photon(
-            opening_angle,
-            u,
-            v,
-            casual_muon_direction)
-        photon_directions.append(direction_of_photon)
-    return np.array(photon_emission_pos), np.array(photon_directions)
+    photon_directions = draw_directions_of_cherenkov_photons(
+        opening_angle,
+        u,
+        v,
+        casual_muon_direction,
+        number_photons,
+        prng=prng)
+    return photon_emission_pos, photon_directions
 
 
 def get_u_v(direction):
@@ -77,6 +90,156 @@ def draw_direction_of_cherenkov_photon(
     return cherenkov_ph_dir/np.linalg.norm(cherenkov_ph_dir)
 
 
+def draw_directions_of_cherenkov_photons(
+    opening_angle,
+    u,
+    v,
+    casual_muon_direction,
+    number_photons,
+    prng=None
+):
+    """
+    Returns the directions of 'number_photons' Cherenkov photons, see
+    draw_direction_of_cherenkov_photon().
+    """
+    prng = np.random if prng is None else prng
+    azimuths = prng.uniform(
+        low=0,
+        high=2*np.pi,
+        size=number_photons)
+    return directions_of_cherenkov_photons(
+        opening_angle, u, v, casual_muon_direction, azimuths)
+
+
+def directions_of_cherenkov_photons(
+    opening_angle,
+    u,
+    v,
+    casual_muon_direction,
+    azimuths
+):
+    """
+    Returns the directions of the Cherenkov photons at the 'azimuths' on
+    the Cherenkov cone of the muon.
+    """
+    azimuths = np.asarray(azimuths)[:, np.newaxis]
+    positions_on_ring = np.cos(azimuths)*u + np.sin(azimuths)*v
+    dist_on_mu_path = 1 / np.tan(opening_angle)
+    cherenkov_ph_dirs = (
+        dist_on_mu_path*casual_muon_direction + positions_on_ring)
+    return cherenkov_ph_dirs/np.linalg.norm(
+        cherenkov_ph_dirs, axis=1)[:, np.newaxis]
+
+
+def azimuths_towards_aperture(
+    casual_muon_support,
+    casual_muon_direction,
+    opening_angle,
+    aperture_radius,
+    number_bins=3600
+):
+    """
+    Returns a mask of the 'number_bins' azimuth bins of the Cherenkov cone,
+    True for the bins whose photons can hit the aperture, a disk of
+    'aperture_radius' around the origin on the ground.
+
+    The photons of azimuth phi emitted a path length r before the muon's
+    impact on the ground land on the segment impact + r*q(phi), with the
+    horizontal q(phi) = w(phi)*d_z/w_z(phi) - d of the muon's direction d
+    and the photon's direction w(phi). A bin is True when the segment at
+    its center passes the aperture closer than the aperture radius plus
+    the distance the segment's end moves within the bin.
+    """
+    casual_muon_support = np.array(casual_muon_support, dtype=np.float64)
+    casual_muon_direction = np.array(casual_muon_direction, dtype=np.float64)
+    path_length_to_ground = max(
+        0.0, -casual_muon_support[2]/casual_muon_direction[2])
+    impact = (
+        casual_muon_support + path_length_to_ground*casual_muon_direction)
+    u, v = get_u_v(casual_muon_direction)
+    bin_width = 2*np.pi/number_bins
+    # the bin edges and centers, alternating
+    azimuths = np.arange(2*number_bins + 1)*bin_width/2
+    directions = directions_of_cherenkov_photons(
+        opening_angle, u, v, casual_muon_direction, azimuths)
+    downwards = directions[:, 2] < 0
+    # photons which do not go down are left to perfect_imaging()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = (
+            directions[:, 0:2]*(
+                casual_muon_direction[2]/directions[:, 2])[:, np.newaxis] -
+            casual_muon_direction[0:2])
+    segments = path_length_to_ground*q
+    # distance of the origin to the segment from impact to impact + segment
+    along = np.clip(
+        -np.dot(segments, impact[0:2]) /
+        np.maximum(np.sum(segments**2, axis=1), np.finfo(float).tiny),
+        0.0, 1.0)
+    closest = impact[0:2] + along[:, np.newaxis]*segments
+    distances = np.hypot(closest[:, 0], closest[:, 1])
+
+    centers = slice(1, None, 2)
+    edge_motion = np.maximum(
+        np.linalg.norm(segments[centers] - segments[0:-1:2], axis=1),
+        np.linalg.norm(segments[2::2] - segments[centers], axis=1))
+    return (
+        ~downwards[centers] |
+        ~downwards[0:-1:2] |
+        ~downwards[2::2] |
+        (distances[centers] <= aperture_radius + edge_motion))
+
+
+def emit_photons_towards_aperture(
+    casual_muon_support,
+    casual_muon_direction,
+    opening_angle,
+    ch_rate,
+    aperture_radius,
+    number_bins=3600,
+    prng=None
+):
+    """
+    Returns the emission positions and the directions of the Cherenkov
+    photons of a muon, as emit_photons(), but only the photons at the
+    azimuths which can hit the aperture, see azimuths_towards_aperture().
+    The number of photons is scaled with the fraction of these azimuths, so
+    the photons which hit the aperture are statistically the same as the
+    ones of emit_photons(). The photons of the other azimuths are never
+    drawn.
+    """
+    prng = np.random if prng is None else prng
+    casual_muon_support = np.array(casual_muon_support, dtype=np.float64)
+    casual_muon_direction = np.array(casual_muon_direction, dtype=np.float64)
+    if casual_muon_direction[2] >= 0:
+        raise ValueError(
+            'The muon must travel down to the ground, but its direction '
+            'has z = {}.'.format(casual_muon_direction[2]))
+    bins = np.flatnonzero(azimuths_towards_aperture(
+        casual_muon_support,
+        casual_muon_direction,
+        opening_angle,
+        aperture_radius,
+        number_bins=number_bins))
+    path_length_to_ground = max(
+        0.0, -casual_muon_support[2]/casual_muon_direction[2])
+    number_photons = prng.poisson(
+        ch_rate*path_length_to_ground*bins.shape[0]/number_bins)
+    path_lengths = np.sort(
+        prng.uniform(0, path_length_to_ground, number_photons))
+    photon_emission_pos = position_on_ray(
+        casual_muon_support,
+        casual_muon_direction,
+        path_lengths[:, np.newaxis])
+    azimuth_bins = bins[
+        np.floor(prng.uniform(0, bins.shape[0], number_photons)).astype(int)]
+    azimuths = (
+        azimuth_bins + prng.uniform(0, 1, number_photons))*2*np.pi/number_bins
+    u, v = get_u_v(casual_muon_direction)
+    photon_directions = directions_of_cherenkov_photons(
+        opening_angle, u, v, casual_muon_direction, azimuths)
+    return photon_emission_pos, photon_directions
+
+
 def project_ch_photon_on_ground(
     photon_emission_positions,
     photon_directions
@@ -113,15 +276,109 @@ def perfect_imaging(
     return photon_directions[inside_aperture, 0:2]
 
 
-def create_fact_pixel_tree():
+def fact_pixel_directions():
     x_pos_mm, y_pos_mm = fact.instrument.get_pixel_coords()
     x_angle = np.arctan(x_pos_mm/fact.instrument.constants.FOCAL_LENGTH_MM)
     y_angle = np.arctan(y_pos_mm/fact.instrument.constants.FOCAL_LENGTH_MM)
-    return scipy.spatial.KDTree(np.c_[x_angle, y_angle])
+    return np.c_[x_angle, y_angle]
+
+
+def create_fact_pixel_tree():
+    return scipy.spatial.cKDTree(fact_pixel_directions())
+
 
+_fact_pixel_tree = None
 
-def artificial_point_spread_function(number_photons, standard_dev):
-    return np.random.normal(
+
+def fact_pixel_tree():
+    """
+    Returns the FACT pixel tree of create_fact_pixel_tree(). It is built on
+    the first call in a process and reused afterwards. Worker processes
+    forked after the first call inherit it, and it can be pickled.
+    """
+    global _fact_pixel_tree
+    if _fact_pixel_tree is None:
+        _fact_pixel_tree = create_fact_pixel_tree()
+    return _fact_pixel_tree
+
+
+def fact_field_of_view_radius(
+    pixel_radius=np.deg2rad(fact.instrument.camera.FOV_PER_PIXEL_DEG)/2
+):
+    """
+    Returns the radius of the circle which contains all FACT pixels.
+    """
+    return np.linalg.norm(fact_pixel_tree().data, axis=1).max() + pixel_radius
+
+
+def max_angle_to_muon(opening_angle, casual_muon_direction):
+    """
+    Returns the largest angle between the muon and the directions of its
+    Cherenkov photons drawn in draw_directions_of_cherenkov_photons(). The
+    u, v of get_u_v() are not orthonormal for all directions, so this can
+    differ from the 'opening_angle'.
+    """
+    u, v = get_u_v(casual_muon_direction)
+    max_ring_radius = np.linalg.svd(np.c_[u, v], compute_uv=False)[0]
+    dist_on_mu_path = 1 / np.tan(opening_angle)
+    if dist_on_mu_path <= max_ring_radius:
+        return np.pi
+    return np.arctan(max_ring_radius/(dist_on_mu_path - max_ring_radius))
+
+
+def may_produce_visible_ring(
+    casual_muon_support,
+    casual_muon_direction,
+    opening_angle,
+    fact_aperture_radius,
+    point_spread_function_std,
+    field_of_view_radius
+):
+    """
+    Returns False when the geometry of the muon does not allow any of its
+    Cherenkov photons to hit the aperture and to be imaged into the field
+    of view, so the muon does not need to be simulated. The bounds are
+    conservative, True does not mean that there will be photons.
+
+    With the inclination i of the muon and the largest angle a between the
+    muon and its photons, see max_angle_to_muon(), the photons are imaged
+    at least sin(i - a) away from the center of the camera, blurred by the
+    point spread function. A photon emitted at path length s before the
+    muon's impact on the ground lands at most
+    s*(max(|cos(i)/cos(i +- a) - 1|) + 2*sin(a/2)) away from the impact.
+    """
+    casual_muon_support = np.array(casual_muon_support, dtype=np.float64)
+    casual_muon_direction = np.array(casual_muon_direction, dtype=np.float64)
+    casual_muon_direction /= np.linalg.norm(casual_muon_direction)
+    inclination = np.arccos(-casual_muon_direction[2])
+    max_angle = max_angle_to_muon(opening_angle, casual_muon_direction)
+
+    min_zenith = max(inclination - max_angle, 0.0)
+    if (
+        np.sin(min_zenith) >
+        field_of_view_radius + 5*point_spread_function_std
+    ):
+        return False
+
+    max_zenith = inclination + max_angle
+    if max_zenith >= np.pi/2:
+        return True
+    path_length = max(
+        0.0, -casual_muon_support[2]/casual_muon_direction[2])
+    impact = casual_muon_support + path_length*casual_muon_direction
+    max_stretch = max(
+        np.cos(inclination)/np.cos(max_zenith) - 1,
+        1 - np.cos(inclination)/np.cos(min_zenith))
+    max_distance_to_impact = path_length*(
+        max_stretch + 2*np.sin(max_angle/2))
+    return bool(
+        np.hypot(impact[0], impact[1]) - fact_aperture_radius <=
+        max_distance_to_impact)
+
+
+def artificial_point_spread_function(number_photons, standard_dev, prng=None):
+    prng = np.random if prng is None else prng
+    return prng.normal(
         loc=0,
         scale=standard_dev,
         size=(number_photons, 2))
@@ -140,37 +397,135 @@ def assign_to_pixels(
 
 def arrival_times_for_cherenkov_photons_from_muon(
     number_photons,
-    arrival_time_std
+    arrival_time_std,
+    prng=None
 ):
-    return np.random.normal(
+    prng = np.random if prng is None else prng
+    return prng.normal(
         loc=0.0,
         scale=arrival_time_std,
         size=number_photons)
 
 
-def create_raw_photon_stream(pixel_CHIDs, arrival_times, nsb_rate_per_pixel):
+def generate_nsb(
+    nsb_rate_per_pixel,
+    number_pixel=ps.io.magic_constants.NUMBER_OF_PIXELS,
+    number_time_slices=ps.io.magic_constants.NUMBER_OF_TIME_SLICES,
+    time_slice_duration=ps.io.magic_constants.TIME_SLICE_DURATION_S,
+    prng=None
+):
+    """
+    Returns the pixel ids and the arrival slices of night sky background
+    photons. The number of photons in each pixel is Poisson distributed
+    with 'nsb_rate_per_pixel' over the region of interest, and their
+    arrival slices are uniform in the region of interest.
+    """
+    prng = np.random if prng is None else prng
+    exposure_time = number_time_slices*time_slice_duration
+    number_photons = prng.poisson(
+        nsb_rate_per_pixel*exposure_time,
+        size=number_pixel)
+    pixel_ids = np.repeat(np.arange(number_pixel), number_photons)
+    # np.random.Generator has no randint()
+    arrival_slices = np.floor(prng.uniform(
+        0, number_time_slices, size=pixel_ids.shape[0])).astype(np.int64)
+    return pixel_ids, arrival_slices
+
+
+def raw_photon_stream_from_pixels_and_slices(
+    pixel_ids,
+    arrival_slices,
+    number_pixel=ps.io.magic_constants.NUMBER_OF_PIXELS
+):
+    """
+    Returns the raw photon-stream of the photons in 'pixel_ids' with
+    'arrival_slices'. The photons of each pixel are sorted by arrival slice
+    and followed by a LINEBREAK.
+    """
+    pixel_ids = np.asarray(pixel_ids, dtype=np.int64)
+    arrival_slices = np.asarray(arrival_slices, dtype=np.int64)
+    if np.any(arrival_slices < 0) or np.any(
+        arrival_slices >= ps.io.binary.LINEBREAK
+    ):
+        raise ValueError(
+            'Arrival slices must be in [0, {:d}).'.format(
+                ps.io.binary.LINEBREAK))
+    order = np.lexsort((arrival_slices, pixel_ids))
+    number_photons = pixel_ids.shape[0]
+    raw = np.full(
+        number_photons + number_pixel,
+        ps.io.binary.LINEBREAK,
+        dtype=np.uint8)
+    # Photon k of the sorted photons is preceded by the LINEBREAKs of the
+    # pixels before its own.
+    raw[np.arange(number_photons) + pixel_ids[order]] = arrival_slices[order]
+    return raw
+
+
+def pixels_and_slices_from_raw_photon_stream(raw):
+    """
+    Returns the pixel ids and the arrival slices of the photons in the raw
+    photon-stream 'raw', see raw_photon_stream_from_pixels_and_slices().
+    """
+    raw = np.asarray(raw)
+    is_linebreak = raw == ps.io.binary.LINEBREAK
+    # the pixel of a photon is the number of LINEBREAKs before it
+    pixel_ids = np.cumsum(is_linebreak)[~is_linebreak]
+    arrival_slices = raw[~is_linebreak].astype(np.int64)
+    return pixel_ids.astype(np.int64), arrival_slices
+
+
+def overlay_nsb(
+    raw,
+    nsb_rate_per_pixel,
+    number_pixel=ps.io.magic_constants.NUMBER_OF_PIXELS,
+    prng=None
+):
+    """
+    Returns the raw photon-stream 'raw' with night sky background photons
+    of 'nsb_rate_per_pixel' added, see generate_nsb().
+    """
+    pixel_ids, arrival_slices = pixels_and_slices_from_raw_photon_stream(raw)
+    nsb_pixel_ids, nsb_arrival_slices = generate_nsb(
+        nsb_rate_per_pixel, number_pixel=number_pixel, prng=prng)
+    return raw_photon_stream_from_pixels_and_slices(
+        np.concatenate([nsb_pixel_ids, pixel_ids]),
+        np.concatenate([nsb_arrival_slices, arrival_slices]),
+        number_pixel=number_pixel)
+
+
+def create_raw_photon_stream(
+    pixel_CHIDs,
+    arrival_times,
+    nsb_rate_per_pixel,
+    prng=None
+):
     arrival_slices = np.round(
         arrival_times/ps.io.magic_constants.TIME_SLICE_DURATION_S).astype(
-            np.int)
-    lol = spe.air_shower_classification.air_shower_classification.generate_nsb(
-        nsb_rate_per_pixel
-    )
-    for i in range(len(lol)):
-        lol[i] = list(lol[i])
-    for photon, chid in enumerate(pixel_CHIDs):
-        lol[chid].append(arrival_slices[photon])
-    return ps.representations.list_of_lists_to_raw_phs(lol)
+            np.int64)
+    nsb_pixel_ids, nsb_arrival_slices = generate_nsb(
+        nsb_rate_per_pixel, prng=prng)
+    return raw_photon_stream_from_pixels_and_slices(
+        np.concatenate([nsb_pixel_ids, pixel_CHIDs]).astype(np.int64),
+        np.concatenate([nsb_arrival_slices, arrival_slices]))
 
 
-def create_event(arrival_times, ch_CHIDs, event_id, nsb_rate_per_pixel):
-    arrival_times += 22e-9
+def create_event(
+    arrival_times,
+    ch_CHIDs,
+    event_id,
+    nsb_rate_per_pixel,
+    prng=None
+):
+    arrival_times = arrival_times + 22e-9
     phs = ps.PhotonStream()
     phs.slice_duration = np.float32(
         ps.io.magic_constants.TIME_SLICE_DURATION_S)
     phs.raw = create_raw_photon_stream(
         ch_CHIDs,
         arrival_times,
-        nsb_rate_per_pixel)
+        nsb_rate_per_pixel,
+        prng=prng)
     event = ps.Event()
     event.photon_stream = phs
     event.photon_stream.saturated_pixels = np.zeros(0, dtype=np.uint16)
@@ -193,27 +548,48 @@ def simulate_response(
     arrival_time_std,
     ch_rate,
     fact_aperture_radius,
-    point_spread_function_std
+    point_spread_function_std,
+    prng=None,
+    only_towards_aperture=True
 ):
-    ch_sup, ch_dir = emit_photons(
-        casual_muon_support,
-        casual_muon_direction,
-        opening_angle,
-        ch_rate)
+    """
+    Returns the simulated FACT event of a muon. All random numbers are
+    drawn from 'prng', a np.random.Generator, or from the global np.random
+    state when None.
+    With 'only_towards_aperture', only the photons which can hit the
+    aperture are emitted, see emit_photons_towards_aperture().
+    """
+    if only_towards_aperture:
+        ch_sup, ch_dir = emit_photons_towards_aperture(
+            casual_muon_support,
+            casual_muon_direction,
+            opening_angle,
+            ch_rate,
+            aperture_radius=fact_aperture_radius,
+            prng=prng)
+    else:
+        ch_sup, ch_dir = emit_photons(
+            casual_muon_support,
+            casual_muon_direction,
+            opening_angle,
+            ch_rate,
+            prng=prng)
     photons_cx_cy = perfect_imaging(
         ch_sup,
         ch_dir,
         aperture_radius=fact_aperture_radius)
     fuzz_cx_cy = photons_cx_cy + artificial_point_spread_function(
         number_photons=photons_cx_cy.shape[0],
-        standard_dev=point_spread_function_std)
+        standard_dev=point_spread_function_std,
+        prng=prng)
     inside_pixels, ch_CHIDs = assign_to_pixels(
         fuzz_cx_cy,
-        create_fact_pixel_tree())
+        fact_pixel_tree())
     ch_CHIDs = ch_CHIDs[inside_pixels]
     arrival_times = arrival_times_for_cherenkov_photons_from_muon(
         number_photons=ch_CHIDs.shape[0],
-        arrival_time_std=arrival_time_std)
+        arrival_time_std=arrival_time_std,
+        prng=prng)
     event = create_event(
-        arrival_times, ch_CHIDs, event_id, nsb_rate_per_pixel)
-    return event
\ No newline at end of file
+        arrival_times, ch_CHIDs, event_id, nsb_rate_per_pixel, prng=prng)
+    return event
@@ -0,0 +1,102 @@
+"""
+Usage: phs_muons_jsonl_to_phs -i=INPUT_RUN_PATH -o=OUTPUT_RUN_PATH
+
+Options:
+    -i --input_run_path=INPUT_RUN_PATH      A muon run in JSON-lines, e.g.
+                                            '*_muons.phs.jsonl.gz'.
+    -o --output_run_path=OUTPUT_RUN_PATH    The same run in the binary
+                                            photon-stream format, e.g.
+                                            '*_muons.phs'.
+
+Converts an extracted muon run from JSON-lines into the binary photon-stream
+format, which is much faster to read.
+"""
+import docopt
+import io
+import json
+import photon_stream as ps
+
+OUTPUT_FORMATS = {
+    'jsonl': '_muons.phs.jsonl.gz',
+    'phs': '_muons.phs',
+}
+
+
+def event_to_bytes(event, output_format='jsonl'):
+    """
+    Returns the event serialized for a muon run of the 'output_format'.
+    'jsonl' is one line of JSON, 'phs' is the binary photon-stream format.
+    """
+    if output_format == 'jsonl':
+        event_json = json.dumps(ps.io.jsonl.event_to_dict(event))
+        return (event_json + '\n').encode()
+    elif output_format == 'phs':
+        buff = io.BytesIO()
+        ps.io.binary.append_event_to_file(event, buff)
+        return buff.getvalue()
+    raise ValueError(
+        "output_format must be one of {}, but is '{}'".format(
+            list(OUTPUT_FORMATS.keys()), output_format))
+
+
+class BufferedEventWriter(object):
+    """
+    Collects serialized events and writes them to a file in chunks of at
+    least 'buffer_size' bytes, instead of one write for each event.
+    The writer must be closed, or used as a context, to write the rest.
+    """
+    def __init__(self, fout, buffer_size=2**22):
+        self.fout = fout
+        self.buffer_size = buffer_size
+        self.chunks = []
+        self.size = 0
+
+    def write(self, event_bytes):
+        self.chunks.append(event_bytes)
+        self.size += len(event_bytes)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.fout.write(b''.join(self.chunks))
+        self.chunks = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def convert_jsonl_to_phs(input_run_path, output_run_path):
+    """
+    Converts a run from JSON-lines into the binary photon-stream format.
+    Returns the number of events.
+    """
+    number_events = 0
+    run = ps.EventListReader(input_run_path)
+    with open(output_run_path, 'wb') as fout, \
+            BufferedEventWriter(fout) as writer:
+        for event in run:
+            writer.write(event_to_bytes(event, output_format='phs'))
+            number_events += 1
+    return number_events
+
+
+def main():
+    try:
+        arguments = docopt.docopt(__doc__)
+        convert_jsonl_to_phs(
+            input_run_path=arguments['--input_run_path'],
+            output_run_path=arguments['--output_run_path'])
+    except docopt.DocoptExit as e:
+        print(e)
+
+
+if __name__ == '__main__':
+    main()
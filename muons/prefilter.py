@@ -0,0 +1,235 @@
+"""
+A cascade of cheap event-level cuts which runs on the raw photon stream
+before the expensive clustering. Events which can not be muons are rejected
+early.
+
+A prefilter is a list of stages. Each stage is a dict with the name of the
+stage in 'stage' and the parameters of the stage's cut, e.g.
+
+    [
+        {'stage': 'number_photons', 'min_number_photons': 20},
+        {'stage': 'arrival_time_peak', 'min_number_photons_in_peak': 15},
+    ]
+
+The stages are evaluated in order and the first stage which rejects an
+event stops the cascade.
+"""
+import numpy as np
+import photon_stream as ps
+from .circle_ransac import circle_ransac
+from .detection import detection
+from .trigger import max_trigger_patch_response
+from .trigger import pixels_and_slices_from_raw
+
+deg2rad = np.deg2rad(1)
+
+
+def number_photons_stage(
+    event,
+    min_number_photons=20,
+    max_number_photons=np.inf
+):
+    """
+    Keeps events with a total number of photons in the given range.
+    """
+    number_photons = event.photon_stream.number_photons
+    return min_number_photons <= number_photons <= max_number_photons
+
+
+def arrival_time_peak_stage(
+    event,
+    min_number_photons_in_peak=15,
+    peak_duration=10e-9
+):
+    """
+    Keeps events with at least 'min_number_photons_in_peak' photons arriving
+    within 'peak_duration'. The photons of a muon ring arrive within a few
+    ns, while the night-sky-background is spread over the full readout.
+    """
+    arrival_times = np.sort(event.photon_stream.point_cloud[:, 2])
+    return max_number_photons_in_window(
+        arrival_times, peak_duration) >= min_number_photons_in_peak
+
+
+def trigger_patch_response_stage(
+    event,
+    min_trigger_patch_response=10
+):
+    """
+    Keeps events with a maximum trigger-patch response of at least
+    'min_trigger_patch_response', see muons.trigger.
+    """
+    pixels, slices = pixels_and_slices_from_raw(event.photon_stream.raw)
+    response = max_trigger_patch_response(pixels, slices)
+    return response >= min_trigger_patch_response
+
+
+def ring_score_stage(
+    event,
+    min_ring_score=0.3,
+    peak_duration=10e-9,
+    residual_threshold=0.25,
+    max_trials=15,
+    min_ring_radius=0.3,
+    max_ring_radius=2.0
+):
+    """
+    Keeps events where a coarse ring fit describes the photons of the
+    arrival time peak. The ring score is the ratio of photons in the peak
+    within 'residual_threshold' of the best of 'max_trials' circles fitted
+    to the pixel positions. Rings with radii outside of 'min_ring_radius'
+    and 'max_ring_radius' score 0.
+    """
+    point_cloud = event.photon_stream.point_cloud
+    peak = point_cloud[
+        arrival_time_peak_mask(point_cloud[:, 2], peak_duration)]
+    if peak.shape[0] < 3:
+        return False
+    (cx, cy, r), inliers = circle_ransac(
+        xy=peak[:, 0:2],
+        residual_threshold=residual_threshold*deg2rad,
+        max_trials=max_trials,
+        random_state=peak.shape[0])
+    if not (min_ring_radius*deg2rad <= r <= max_ring_radius*deg2rad):
+        return False
+    return inliers.sum()/peak.shape[0] >= min_ring_score
+
+
+STAGES = {
+    'number_photons': number_photons_stage,
+    'arrival_time_peak': arrival_time_peak_stage,
+    'trigger_patch_response': trigger_patch_response_stage,
+    'ring_score': ring_score_stage,
+}
+
+DEFAULT_PREFILTER = [
+    {'stage': 'number_photons'},
+    {'stage': 'arrival_time_peak'},
+]
+
+
+def max_number_photons_in_window(sorted_arrival_times, window_duration):
+    """
+    Returns the maximum number of photons arriving within
+    'window_duration'.
+    """
+    if sorted_arrival_times.shape[0] == 0:
+        return 0
+    end = np.searchsorted(
+        sorted_arrival_times,
+        sorted_arrival_times + window_duration,
+        side='right')
+    return int(np.max(end - np.arange(sorted_arrival_times.shape[0])))
+
+
+def arrival_time_peak_mask(arrival_times, window_duration):
+    """
+    Returns a mask of the photons in the time window of 'window_duration'
+    with most photons.
+    """
+    order = np.argsort(arrival_times)
+    sorted_arrival_times = arrival_times[order]
+    mask = np.zeros(arrival_times.shape[0], dtype=np.bool_)
+    if arrival_times.shape[0] == 0:
+        return mask
+    end = np.searchsorted(
+        sorted_arrival_times,
+        sorted_arrival_times + window_duration,
+        side='right')
+    start = np.argmax(end - np.arange(arrival_times.shape[0]))
+    mask[order[start:end[start]]] = True
+    return mask
+
+
+def init_counts(prefilter):
+    """
+    Returns the counts of a prefilter: the number of events seen, and the
+    number of events rejected by each stage.
+    """
+    counts = {'number_events': 0, 'number_passed': 0, 'rejected': {}}
+    for stage in prefilter:
+        counts['rejected'][stage['stage']] = 0
+    return counts
+
+
+def rejecting_stage(event, prefilter):
+    """
+    Returns the name of the first stage of the prefilter which rejects the
+    event, or None when the event passes all stages.
+    """
+    for stage in prefilter:
+        parameters = {k: v for k, v in stage.items() if k != 'stage'}
+        if not STAGES[stage['stage']](event, **parameters):
+            return stage['stage']
+    return None
+
+
+def add_to_counts(counts, stage):
+    """
+    Counts one event rejected by 'stage', or passed when 'stage' is None.
+    """
+    counts['number_events'] += 1
+    if stage is None:
+        counts['number_passed'] += 1
+    else:
+        counts['rejected'][stage] += 1
+
+
+def passes_prefilter(event, prefilter, counts=None):
+    """
+    Returns True when the event passes all stages of the prefilter.
+    When 'counts' are given, see init_counts(), they are updated.
+    """
+    stage = rejecting_stage(event, prefilter)
+    if counts is not None:
+        add_to_counts(counts, stage)
+    return stage is None
+
+
+def validate_prefilter(
+    run,
+    prefilter=DEFAULT_PREFILTER,
+    detection_method=detection
+):
+    """
+    Runs the prefilter and the full detection on every event of a sample
+    run, and reports the muons which the prefilter would have dropped.
+    Returns a dict with the prefilter counts, the number of muons found by
+    the full detection, and the stage and (night, run, event) of each
+    dropped muon.
+
+    Parameter
+    ---------
+    run                 An iterable of events, e.g. ps.EventListReader.
+
+    prefilter           The stages to validate.
+
+    detection_method    Called with (event, clusters), returns the muon
+                        features.
+    """
+    counts = init_counts(prefilter)
+    number_muons = 0
+    dropped_muons = []
+    for event in run:
+        stage = rejecting_stage(event, prefilter)
+        add_to_counts(counts, stage)
+        clusters = ps.PhotonStreamCluster(event.photon_stream)
+        muon_features = detection_method(event, clusters)
+        if muon_features['is_muon']:
+            number_muons += 1
+            if stage is not None:
+                dropped_muons.append({
+                    'stage': stage,
+                    'id': _event_id(event)})
+    return {
+        'counts': counts,
+        'number_muons': number_muons,
+        'dropped_muons': dropped_muons}
+
+
+def _event_id(event):
+    if hasattr(event, 'observation_info'):
+        info = event.observation_info
+        return (int(info.night), int(info.run), int(info.event))
+    truth = event.simulation_truth
+    return (int(truth.reuse), int(truth.run), int(truth.event))
@@ -2,11 +2,13 @@
 Find point spread function for all runs
 Call with 'python -m scoop --hostfile scoop_hosts.txt'
 
-Usage: scoop_find_all.py --muon_dir=DIR --output_dir=DIR
+Usage: scoop_find_all.py --muon_dir=DIR --output_dir=DIR [--suffix=SUF]
 
 Options:
     --muon_dir=DIR      The location of muon data
     --output_dir=DIR    The output of caluculated fuzzyness
+    --suffix=SUF        [default: .phs.jsonl.gz] Format of the input file name,
+                        '.phs' for muon runs in binary photon-stream format
 """
 import docopt
 import scoop
@@ -44,9 +46,11 @@ def main():
         arguments = docopt.docopt(__doc__)
         muon_dir = arguments['--muon_dir']
         output_dir = arguments['--output_dir']
+        suffix = arguments['--suffix']
         jobs = create_jobs(
             muon_dir,
-            output_dir,)
+            output_dir,
+            suffix=suffix)
         job_return_codes = list(scoop.futures.map(run, jobs))
     except docopt.DocoptExit as e:
         print(e)
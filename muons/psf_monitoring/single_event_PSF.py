@@ -2,6 +2,9 @@ import photon_stream as ps
 from muons.detection import detection
 import json
 import numpy as np
+from muons.ring_metrics import radial_distances
+from muons.ring_metrics import hough_response
+from muons.ring_metrics import ring_metrics_batch
 import os
 
 
@@ -19,20 +22,10 @@ def evaluate_ring(
     r,
     hough_epsilon=np.deg2rad(0.5*0.1111)
 ):
-    total_amplitude = 0
-    point_positions_max = point_positions.shape[0]
-    for i_point in range(point_positions_max):
-        point_x = point_positions[i_point, 0]
-        point_y = point_positions[i_point, 1]
-        r_point = calculate_point_distance(
-            ring_cx=cx, ring_cy=cy,
-            point_x=point_x, point_y=point_y)
-        point_contribution = apply_triangular_evaluation(
-            ring_radius=r, amplitude=1,
-            r_point=r_point, hough_epsilon=hough_epsilon)
-        total_amplitude += point_contribution
-        normed_amplitude = total_amplitude/point_positions_max
-    return normed_amplitude
+    return hough_response(
+        distances=radial_distances(point_positions, cx, cy),
+        r=r,
+        hough_epsilon=hough_epsilon)
 
 
 def calculate_point_distance(
@@ -83,7 +76,8 @@ def calculate_PSF(hough_response):
 
 
 def calculate_one_run(inpath, outpath):
-    hough_responses = []
+    muon_point_positions = []
+    muon_rings = []
     run = ps.EventListReader(inpath)
     number_muons = 0
     for event in run:
@@ -97,11 +91,20 @@ def calculate_one_run(inpath, outpath):
             cx = muon_props["muon_ring_cx"]
             cy = muon_props["muon_ring_cy"]
             r = muon_props["muon_ring_r"]
-            total_amplitude = evaluate_ring(
-                point_positions, cx, cy, r)
-            hough_responses.append(total_amplitude)
+            muon_point_positions.append(point_positions)
+            muon_rings.append([cx, cy, r])
             number_muons += 1
-    hough_responses = np.multiply(hough_responses, 100)
+    offsets = np.zeros(number_muons + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([pp.shape[0] for pp in muon_point_positions])
+    muon_rings = np.array(muon_rings).reshape(-1, 3)
+    metrics = ring_metrics_batch(
+        point_cloud=np.concatenate(
+            [np.zeros(shape=(0, 2))] + muon_point_positions),
+        offsets=offsets,
+        cx=muon_rings[:, 0],
+        cy=muon_rings[:, 1],
+        r=muon_rings[:, 2])
+    hough_responses = np.multiply(metrics['hough_response'], 100)
     psf_values = calculate_PSF(hough_responses)
     psf_error = psf_values * 1/np.sqrt(number_muons)
     average_psf = float(np.average(psf_values))
@@ -0,0 +1,142 @@
+import numpy as np
+from .tools import segment_ids
+from .tools import segment_sum
+
+ring_metrics_dtype = np.dtype([
+    ('number_of_photons', np.uint32),
+    ('hough_response', np.float64),
+    ('radial_std', np.float64),
+    ('median_radius', np.float64)])
+
+
+def radial_distances(point_cloud, cx, cy):
+    """
+    Returns the distances of the points to the ring center (cx, cy).
+
+    Parameter
+    ---------
+    point_cloud     np.array shape=(N, 2) or (N, 3)
+                    The cx and cy of the photons.
+
+    cx, cy          Center of the ring, scalars or arrays of length N.
+    """
+    point_cloud = np.asarray(point_cloud, dtype=np.float64)
+    return np.hypot(
+        point_cloud[:, 0] - np.asarray(cx),
+        point_cloud[:, 1] - np.asarray(cy))
+
+
+def triangular_response(distances, r, hough_epsilon):
+    """
+    Returns the triangular Hough contribution of each point to a ring of
+    radius r. A point on the ring contributes 1, a point 'hough_epsilon' or
+    further away from the ring contributes 0.
+    """
+    return np.maximum(
+        hough_epsilon - np.abs(distances - r), 0.0)/hough_epsilon
+
+
+def hough_response(distances, r, hough_epsilon=np.deg2rad(0.5*0.1111)):
+    """
+    Returns the triangular Hough response of a ring normalized to the
+    number of points. NaN for no points.
+    """
+    distances = np.asarray(distances)
+    if distances.shape[0] == 0:
+        return np.nan
+    return triangular_response(distances, r, hough_epsilon).sum()/(
+        distances.shape[0])
+
+
+def ring_metrics(
+    point_cloud,
+    cx,
+    cy,
+    r,
+    hough_epsilon=np.deg2rad(0.5*0.1111)
+):
+    """
+    Returns the ring quality metrics of one event, see ring_metrics_batch().
+
+    Parameter
+    ---------
+    point_cloud     np.array shape=(N, 2) or (N, 3)
+                    The cx and cy of the photons.
+
+    cx, cy, r       The ring.
+    """
+    point_cloud = np.asarray(point_cloud)
+    return ring_metrics_batch(
+        point_cloud=point_cloud,
+        offsets=[0, point_cloud.shape[0]],
+        cx=[cx],
+        cy=[cy],
+        r=[r],
+        hough_epsilon=hough_epsilon)[0]
+
+
+def ring_metrics_batch(
+    point_cloud,
+    offsets,
+    cx,
+    cy,
+    r,
+    hough_epsilon=np.deg2rad(0.5*0.1111)
+):
+    """
+    Returns the ring quality metrics of many events in a structured array
+    with dtype 'ring_metrics_dtype', one row for each event.
+    All metrics are derived from the distances of the photons to the center
+    of their event's ring:
+    'hough_response' is the triangular Hough response normalized to the
+    number of photons, 'radial_std' is the standard deviation of the
+    distances to the ring and 'median_radius' is the median distance to
+    the center. Events without photons are NaN.
+
+    Parameter
+    ---------
+    point_cloud     np.array shape=(N, 2) or (N, 3)
+                    The concatenated photons of all events.
+
+    offsets         np.array shape=(number_events + 1, )
+                    Start of each event in 'point_cloud' followed by N.
+
+    cx, cy, r       np.arrays shape=(number_events, )
+                    The rings of the events.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    number_events = offsets.shape[0] - 1
+    ids = segment_ids(offsets)
+    number_of_photons = np.diff(offsets)
+    cx = np.asarray(cx, dtype=np.float64)
+    cy = np.asarray(cy, dtype=np.float64)
+    r = np.asarray(r, dtype=np.float64)
+
+    distances = radial_distances(point_cloud, cx[ids], cy[ids])
+    deviation = distances - r[ids]
+
+    ret = np.zeros(number_events, dtype=ring_metrics_dtype)
+    ret['number_of_photons'] = number_of_photons
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret['hough_response'] = segment_sum(
+            triangular_response(distances, r[ids], hough_epsilon),
+            ids,
+            number_events)/number_of_photons
+        mean_deviation = segment_sum(
+            deviation, ids, number_events)/number_of_photons
+        ret['radial_std'] = np.sqrt(segment_sum(
+            (deviation - mean_deviation[ids])**2,
+            ids,
+            number_events)/number_of_photons)
+
+    # median from the distances sorted within each event
+    sorted_distances = distances[np.lexsort((distances, ids))]
+    has_photons = number_of_photons > 0
+    low = offsets[:-1] + (number_of_photons - 1)//2
+    high = offsets[:-1] + number_of_photons//2
+    median_radius = np.full(number_events, np.nan)
+    median_radius[has_photons] = 0.5*(
+        sorted_distances[low[has_photons]] +
+        sorted_distances[high[has_photons]])
+    ret['median_radius'] = median_radius
+    return ret
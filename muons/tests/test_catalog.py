@@ -0,0 +1,60 @@
+import numpy as np
+import muons
+import tempfile
+import os
+
+
+def write_info(path, night, run, events, radius=1.0):
+    rows = np.zeros(len(events), dtype=muons.extraction.header_dtype)
+    rows['Night'] = night
+    rows['Run'] = run
+    rows['Event'] = events
+    rows['UnixTime_s'] = 1388534400 + np.asarray(events)
+    rows['ring_radius'] = radius
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows.tofile(path)
+
+
+def test_catalog_is_sorted_and_updated_incrementally():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        muon_dir = os.path.join(tmp, 'muons')
+        catalog_dir = os.path.join(tmp, 'catalog')
+        run_011_path = os.path.join(
+            muon_dir, '2014', '01', '02', '20140102_011_muons.info')
+        write_info(run_011_path, 20140102, 11, [7, 3, 5])
+        write_info(
+            os.path.join(
+                muon_dir, '2014', '01', '01', '20140101_104_muons.info'),
+            20140101, 104, [42, 1], radius=0.5)
+
+        assert muons.catalog.update_catalog(muon_dir, catalog_dir) == 2
+        assert muons.catalog.update_catalog(muon_dir, catalog_dir) == 0
+        catalog = muons.catalog.read_catalog(catalog_dir)
+        assert isinstance(catalog['Event'], np.memmap)
+        np.testing.assert_array_equal(
+            catalog['Night'], [20140101]*2 + [20140102]*3)
+        np.testing.assert_array_equal(catalog['Event'], [1, 42, 3, 5, 7])
+
+        # a new run and a reprocessed run with fewer muons
+        write_info(
+            os.path.join(
+                muon_dir, '2014', '01', '03', '20140103_001_muons.info'),
+            20140103, 1, [2])
+        write_info(run_011_path, 20140102, 11, [5, 9], radius=1.2)
+        os.utime(run_011_path, (0, 0))
+        assert muons.catalog.update_catalog(muon_dir, catalog_dir) == 2
+        catalog = muons.catalog.read_catalog(catalog_dir)
+        np.testing.assert_array_equal(catalog['Event'], [1, 42, 5, 9, 2])
+        assert np.all(np.diff(catalog['key'].astype(np.int64)) > 0)
+
+        nights = muons.catalog.select_nights(catalog, 20140102, 20140103)
+        np.testing.assert_array_equal(catalog['Run'][nights], [11, 11, 1])
+
+        rows = muons.catalog.select_range(catalog, 'ring_radius', 1.0, 2.0)
+        np.testing.assert_array_equal(catalog['Event'][rows], [5, 9, 2])
+        rows = muons.catalog.select_range(
+            catalog, 'UnixTime_s', 1388534400, 1388534400 + 6)
+        np.testing.assert_array_equal(catalog['Event'][rows], [1, 5, 2])
+
+        assert muons.catalog.find_event(catalog, 20140102, 11, 9) == 3
+        assert muons.catalog.find_event(catalog, 20140102, 11, 7) == -1
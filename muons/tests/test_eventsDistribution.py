@@ -1,6 +1,10 @@
 import numpy as np
 from scipy import stats
 from muons.muon_ring_simulation import eventsDistribution as ms
+from muons.muon_ring_simulation import single_simulation as rs
+from muons.muon_ring_simulation import simulation_truth
+import tempfile
+import os
 
 
 def test_draw_inclination():
@@ -63,3 +67,94 @@ def test_casaul_trajectory2():
         )[0],
         [0, 0, 1000]
     )
+
+
+def test_jobs_do_not_depend_on_number_of_muons():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        jobs = {}
+        for number_of_muons in [3, 10]:
+            jobs[number_of_muons] = ms.create_jobs(
+                output_dir=tmp,
+                number_of_muons=number_of_muons,
+                max_inclination=3.0,
+                max_aperture_radius=5.0,
+                min_opening_angle=np.deg2rad(0.4),
+                max_opening_angle=np.deg2rad(1.6),
+                min_nsb_rate=28e6,
+                max_nsb_rate=140e6,
+                random_seed=42)
+    for job_3, job_10 in zip(jobs[3], jobs[10]):
+        assert job_3['opening_angle'] == job_10['opening_angle']
+        assert job_3['nsb_rate'] == job_10['nsb_rate']
+        np.testing.assert_array_equal(
+            job_3['casual_muon_support'], job_10['casual_muon_support'])
+    assert jobs[10][3]['opening_angle'] != jobs[10][4]['opening_angle']
+
+
+def test_event_streams_are_reproducible_and_independent():
+    def emit(event_id):
+        return rs.emit_photons(
+            casual_muon_support=[0, 1.5, 1000],
+            casual_muon_direction=[0, 0, -1],
+            opening_angle=np.deg2rad(1.2),
+            ch_rate=3,
+            prng=ms.event_prng(1, event_id, ms.RESPONSE_STREAM))
+    np.random.seed(0)
+    first = emit(7)
+    np.random.seed(1)
+    emit(3)
+    again = emit(7)
+    np.testing.assert_array_equal(first[0], again[0])
+    np.testing.assert_array_equal(first[1], again[1])
+    assert first[0].shape != emit(8)[0].shape or np.any(
+        first[0] != emit(8)[0])
+
+
+def test_merge_chunks_in_chunk_index_order_with_offsets():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        events = {}
+        event_id = 0
+        for chunk_index in [2, 0, 11, 1]:
+            offsets = np.zeros(3, dtype=ms.offsets_dtype)
+            with open(ms.chunk_path(tmp, chunk_index), 'wb') as fout:
+                for i in range(3):
+                    payload = bytes([event_id])*(event_id + 1)
+                    offsets[i] = (event_id, fout.tell())
+                    fout.write(payload)
+                    events[event_id] = (chunk_index, payload)
+                    event_id += 1
+            np.save(
+                ms.chunk_path(tmp, chunk_index) + ms.OFFSETS_SUFFIX, offsets)
+        merged_path = os.path.join(tmp, 'simulations.sim.phs')
+        assert ms.merge_chunks(tmp, merged_path, buffer_size=4) == 4
+        with open(merged_path, 'rb') as f:
+            merged = f.read()
+        offsets = ms.read_offsets(merged_path)
+        assert sorted(os.listdir(tmp)) == [
+            'simulations.sim.phs', 'simulations.sim.phs.offsets.npy']
+
+    expected_order = sorted(events, key=lambda e: (events[e][0], e))
+    assert merged == b''.join(events[e][1] for e in expected_order)
+    for e, (chunk_index, payload) in events.items():
+        assert merged[offsets[e]:offsets[e] + len(payload)] == payload
+
+
+def test_culled_jobs_are_recorded_in_the_simulation_truth():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        kwargs = dict(
+            output_dir=tmp,
+            number_of_muons=50,
+            max_inclination=10.0,
+            max_aperture_radius=300.0,
+            min_opening_angle=np.deg2rad(0.4),
+            max_opening_angle=np.deg2rad(1.6),
+            min_nsb_rate=28e6,
+            max_nsb_rate=140e6)
+        jobs = ms.create_jobs(cull_invisible=False, **kwargs)
+        assert all(job['is_simulated'] for job in jobs)
+        jobs = ms.create_jobs(**kwargs)
+        truth = simulation_truth.read(
+            os.path.join(tmp, 'simulationtruth.npy'))
+    is_simulated = [job['is_simulated'] for job in jobs]
+    assert not all(is_simulated)
+    np.testing.assert_array_equal(truth['is_simulated'], is_simulated)
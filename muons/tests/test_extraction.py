@@ -0,0 +1,161 @@
+import numpy as np
+import photon_stream as ps
+import muons
+import tempfile
+import os
+import gzip
+import json
+import pkg_resources
+
+
+FACT_PEDESTAL_TRIGGER = 1024
+
+
+def write_observation_run_of_simulated_muons(path, pedestal_every=10):
+    """
+    Writes the 100 simulated muons in tests/resources as an observed run in
+    JSON-lines, because the extraction reads the night, run, event and
+    trigger type of observed events. Every 'pedestal_every'th event is
+    written with the pedestal trigger, which the extraction skips.
+    Returns the number of self-triggered events.
+    """
+    simulation_path = pkg_resources.resource_filename(
+        'muons',
+        os.path.join('tests', 'resources', '100simulations_psf0.0.sim.phs'))
+    linebreak = bytes([ps.io.binary.LINEBREAK])
+    number_self_triggered = 0
+    with gzip.open(path, 'wt') as fout:
+        for i, event in enumerate(ps.EventListReader(simulation_path)):
+            raw = event.photon_stream.raw.tobytes()
+            if i % pedestal_every == pedestal_every - 1:
+                trigger = FACT_PEDESTAL_TRIGGER
+            else:
+                trigger = muons.extraction.FACT_PHYSICS_SELF_TRIGGER
+                number_self_triggered += 1
+            fout.write(json.dumps({
+                'Night': 20140101,
+                'Run': 104,
+                'Event': i + 1,
+                'UnixTime_s_us': [1388577600 + i, 0],
+                'Trigger': trigger,
+                'Az': 0.0,
+                'Zd': 0.0,
+                'PhotonArrivals_500ps': [
+                    list(pixel) for pixel in raw.split(linebreak)[:-1]],
+                'SaturatedPixels': [],
+            }) + '\n')
+    return number_self_triggered
+
+
+def test_observation_run_of_simulated_muons_is_read_back():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        muon_sample_path = os.path.join(tmp, 'run.phs.jsonl.gz')
+        number_self_triggered = write_observation_run_of_simulated_muons(
+            muon_sample_path)
+        events = list(ps.EventListReader(muon_sample_path))
+    assert len(events) == 100
+    assert number_self_triggered == 90
+    assert events[0].observation_info.trigger_type == (
+        muons.extraction.FACT_PHYSICS_SELF_TRIGGER)
+    assert events[9].observation_info.trigger_type == FACT_PEDESTAL_TRIGGER
+    assert events[9].observation_info.event == 10
+
+
+def test_parallel_extraction_writes_same_output_as_serial():
+    outputs = {}
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        muon_sample_path = os.path.join(tmp, 'run.phs.jsonl.gz')
+        write_observation_run_of_simulated_muons(muon_sample_path)
+        for number_workers in [1, 3]:
+            out_path = os.path.join(tmp, str(number_workers))
+            muons.extract_muons_from_run(
+                input_run_path=muon_sample_path,
+                output_run_path=out_path + '_muons.phs.jsonl.gz',
+                output_run_header_path=out_path + '_muons.info',
+                number_workers=number_workers,
+                queue_depth=4)
+            with gzip.open(out_path + '_muons.phs.jsonl.gz', 'rb') as f:
+                run = f.read()
+            with open(out_path + '_muons.info', 'rb') as f:
+                info = f.read()
+            outputs[number_workers] = (run, info)
+
+    assert len(outputs[1][1]) > 0
+    assert outputs[1][0] == outputs[3][0]
+    assert outputs[1][1] == outputs[3][1]
+
+
+def test_buffered_event_writer_writes_all_events_in_order():
+    chunks = [bytes([i])*i for i in range(1, 40)]
+
+    class Recorder(object):
+        def __init__(self):
+            self.writes = []
+
+        def write(self, b):
+            self.writes.append(b)
+
+    recorder = Recorder()
+    with muons.phs_output.BufferedEventWriter(
+        recorder, buffer_size=100
+    ) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    assert b''.join(recorder.writes) == b''.join(chunks)
+    assert len(recorder.writes) < len(chunks)
+
+
+def test_binary_output_has_same_events_as_jsonl():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        muon_sample_path = os.path.join(tmp, 'run.phs.jsonl.gz')
+        write_observation_run_of_simulated_muons(muon_sample_path)
+        jsonl_path = os.path.join(tmp, 'run_muons.phs.jsonl.gz')
+        phs_path = os.path.join(tmp, 'run_muons.phs')
+        converted_path = os.path.join(tmp, 'converted_muons.phs')
+        for output_format, path in [('jsonl', jsonl_path), ('phs', phs_path)]:
+            muons.extract_muons_from_run(
+                input_run_path=muon_sample_path,
+                output_run_path=path,
+                output_run_header_path=path + '.info',
+                output_format=output_format)
+        with open(jsonl_path + '.info', 'rb') as f:
+            info = f.read()
+        with open(phs_path + '.info', 'rb') as f:
+            assert f.read() == info
+        muons.phs_output.convert_jsonl_to_phs(jsonl_path, converted_path)
+
+        jsonl_events = list(ps.EventListReader(jsonl_path))
+        assert len(jsonl_events) > 0
+        for path in [phs_path, converted_path]:
+            events = list(ps.EventListReader(path))
+            assert len(events) == len(jsonl_events)
+            for event, jsonl_event in zip(events, jsonl_events):
+                assert (
+                    event.observation_info.event ==
+                    jsonl_event.observation_info.event)
+                np.testing.assert_array_equal(
+                    event.photon_stream.raw,
+                    jsonl_event.photon_stream.raw)
+
+
+def test_extraction_stats_count_every_self_triggered_event():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        muon_sample_path = os.path.join(tmp, 'run.phs.jsonl.gz')
+        number_events = write_observation_run_of_simulated_muons(
+            muon_sample_path)
+        out_path = os.path.join(tmp, 'run')
+        stats_path = out_path + muons.instrumentation.STATS_SUFFIX
+        muons.extract_muons_from_run(
+            input_run_path=muon_sample_path,
+            output_run_path=out_path + '_muons.phs.jsonl.gz',
+            output_run_header_path=out_path + '_muons.info',
+            stats_path=stats_path)
+        with open(stats_path, 'rt') as f:
+            stats = json.load(f)
+        number_muons = os.stat(out_path + '_muons.info').st_size//(
+            muons.extraction.header_dtype.itemsize)
+
+    assert sum(stats['counts'].values()) == number_events
+    assert stats['counts']['muon'] == number_muons
+    for stage in ['decode', 'clustering', 'ransac', 'cuts', 'write']:
+        assert stats['seconds'][stage] > 0
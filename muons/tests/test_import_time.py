@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET_S = float(
+    os.environ.get('MUONS_IMPORT_TIME_BUDGET_S', '5.0'))
+
+HEAVY_MODULES = [
+    'matplotlib',
+    'pandas',
+    'scoop',
+    'muons.analysis_utensils',
+    'muons.muon_ring_simulation',
+    'muons.psf_monitoring',
+    'muons.isdc_production',
+]
+
+
+def test_import_of_extraction_is_light_and_fast():
+    script = (
+        'import sys, time\n'
+        't = time.perf_counter()\n'
+        'import muons.extraction\n'
+        'print(time.perf_counter() - t)\n'
+        'print(",".join(m for m in {} if m in sys.modules))\n'.format(
+            repr(HEAVY_MODULES)))
+    out = subprocess.check_output([sys.executable, '-c', script])
+    import_time_s, loaded = out.decode().splitlines()[-2:]
+    assert loaded == ''
+    assert float(import_time_s) < IMPORT_TIME_BUDGET_S
+
+
+def test_lazy_submodules_load_on_access():
+    script = (
+        'import sys\n'
+        'import muons\n'
+        'assert "muons.isdc_production" not in sys.modules\n'
+        'muons.isdc_production.qsub\n'
+        'assert "muons.isdc_production" in sys.modules\n'
+        'assert "isdc_production" in dir(muons)\n')
+    subprocess.check_call([sys.executable, '-c', script])
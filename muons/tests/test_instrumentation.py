@@ -0,0 +1,55 @@
+import muons
+import tempfile
+import os
+import time
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_nested_stages_are_not_counted_twice():
+    clock = FakeClock()
+    timer = muons.instrumentation.StageTimer(clock=clock)
+    with timer.stage('outer'):
+        clock.sleep(2.0)
+        with timer.stage('inner'):
+            clock.sleep(5.0)
+        clock.sleep(1.0)
+    with timer.stage('inner'):
+        clock.sleep(0.5)
+    assert timer.seconds['inner'] == 5.5
+    assert timer.seconds['outer'] == 3.0
+
+
+def test_stage_timer_measures_wall_clock_time():
+    timer = muons.instrumentation.StageTimer()
+    with timer.stage('sleep'):
+        time.sleep(0.02)
+    assert timer.seconds['sleep'] >= 0.02
+
+
+def test_reduce_stats_sums_all_sidecars():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        for night in ['20140101', '20140102']:
+            os.makedirs(os.path.join(tmp, night))
+            timer = muons.instrumentation.StageTimer()
+            timer.seconds['clustering'] = 2.0
+            timer.count('muon', 3)
+            timer.count('cut:muon_ring_r')
+            muons.instrumentation.write_stats(
+                os.path.join(
+                    tmp, night, '001' + muons.instrumentation.STATS_SUFFIX),
+                timer)
+        reduced = muons.instrumentation.reduce_stats(tmp)
+    assert reduced['number_runs'] == 2
+    assert reduced['seconds'] == {'clustering': 4.0}
+    assert reduced['counts'] == {'muon': 6, 'cut:muon_ring_r': 2}
+    assert reduced['max_peak_rss_bytes'] > 0
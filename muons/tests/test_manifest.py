@@ -0,0 +1,172 @@
+import os
+import json
+import pytest
+import tempfile
+import time
+from muons.isdc_production import manifest
+
+
+def touch(path, content=b'phs'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_manifest_plans_only_unprocessed_runs():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        phs_dir = os.path.join(tmp, 'phs')
+        out_dir = os.path.join(tmp, 'out')
+
+        def output_muon_path(input_run_path):
+            base = os.path.basename(input_run_path).split('.')[0]
+            return os.path.join(out_dir, base)
+
+        run_a = os.path.join(phs_dir, '2014', '01', '01', 'a.phs.jsonl.gz')
+        run_b = os.path.join(phs_dir, '2014', '01', '01', 'b.phs.jsonl.gz')
+        run_c = os.path.join(phs_dir, '2014', '01', '02', 'c.phs.jsonl.gz')
+        for path in [run_a, run_b, run_c]:
+            touch(path)
+        touch(os.path.join(out_dir, 'b_muons.info'), b'')
+
+        connection = manifest.connect(os.path.join(tmp, 'manifest.sqlite'))
+        assert manifest.scan(connection, phs_dir, output_muon_path) == 3
+        todo = [r[0] for r in manifest.runs_to_process(connection)]
+        assert todo == [run_a, run_c]
+
+        manifest.set_state(connection, todo, 'submitted')
+        assert manifest.runs_to_process(connection) == []
+        manifest.record_result(
+            os.path.join(tmp, 'manifest.sqlite'), run_a, 12.0, 0)
+        manifest.record_result(
+            os.path.join(tmp, 'manifest.sqlite'), run_c, 3.0, 1)
+        assert manifest.scan(connection, phs_dir, output_muon_path) == 0
+        assert manifest.runs_to_process(connection) == []
+        todo = manifest.runs_to_process(connection, retry_failed=True)
+        assert [r[0] for r in todo] == [run_c]
+
+        run_d = os.path.join(phs_dir, '2014', '01', '02', 'd.phs.jsonl.gz')
+        touch(run_d, b'longer run')
+        assert manifest.scan(connection, phs_dir, output_muon_path) == 1
+        todo = manifest.runs_to_process(connection)
+        assert todo == [(run_d, 10, output_muon_path(run_d))]
+        connection.close()
+
+
+def test_manifest_plans_stale_submitted_runs_again():
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        phs_dir = os.path.join(tmp, 'phs')
+
+        def output_muon_path(input_run_path):
+            return os.path.join(tmp, 'out', os.path.basename(input_run_path))
+
+        # '_' is a LIKE wildcard, which must not match the sibling night.
+        run_a = os.path.join(phs_dir, '2014', '01', '0_', 'a.phs.jsonl.gz')
+        run_b = os.path.join(phs_dir, '2014', '01', '01', 'b.phs.jsonl.gz')
+        for path in [run_a, run_b]:
+            touch(path)
+        connection = manifest.connect(os.path.join(tmp, 'manifest.sqlite'))
+        assert manifest.scan(connection, phs_dir, output_muon_path) == 2
+        manifest.set_state(connection, [run_a, run_b], 'submitted')
+        assert manifest.scan(
+            connection, phs_dir, output_muon_path, full_scan=True) == 0
+
+        now = time.time()
+        assert manifest.runs_to_process(connection, now=now) == []
+        stale = manifest.runs_to_process(
+            connection, now=now + manifest.SUBMITTED_TIMEOUT_S + 1)
+        assert [r[0] for r in stale] == sorted([run_a, run_b])
+        assert manifest.runs_to_process(
+            connection,
+            submitted_timeout_s=None,
+            now=now + manifest.SUBMITTED_TIMEOUT_S + 1) == []
+        connection.close()
+
+
+def test_pack_jobs_respects_target_runtime():
+    from muons.isdc_production import packing
+    sizes = [50, 10, 120, 30, 30, 70, 5, 90, 40, 20]
+    jobs = [{'input_run_path': str(i), 'size': s} for i, s in enumerate(sizes)]
+    groups = packing.pack_jobs(jobs, target_runtime_s=100, seconds_per_byte=1)
+
+    packed = sorted(job['input_run_path'] for g in groups for job in g)
+    assert packed == sorted(job['input_run_path'] for job in jobs)
+    for group in groups:
+        runtime_s = packing.estimated_runtime_s(group, seconds_per_byte=1)
+        assert runtime_s <= 100 or len(group) == 1
+    # 465 in total needs at least 5 groups
+    assert len(groups) == 5
+
+    assert packing.choose_queue(10*60) == 'fact_short'
+    assert packing.choose_queue(2*60*60) == 'fact_medium'
+    with pytest.warns(UserWarning):
+        assert packing.choose_queue(1e9) == 'fact_long'
+
+
+def test_queue_limits_are_read_from_json():
+    from muons.isdc_production import packing
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        path = os.path.join(tmp, 'queues.json')
+        with open(path, 'wt') as fout:
+            json.dump({'long': 100, 'short': 10}, fout)
+        queues = packing.load_queue_max_runtime_s(path)
+    assert queues == [('short', 10), ('long', 100)]
+    assert packing.choose_queue(4, queues) == 'short'
+    assert packing.choose_queue(40, queues) == 'long'
+
+
+def test_packed_job_names_differ_between_plans_and_run_lists():
+    from muons.isdc_production import qsub
+    group = [{'input_run_path': '/phs/2014/01/01/a.phs.jsonl.gz'}]
+    other_group = [{'input_run_path': '/phs/2014/01/01/b.phs.jsonl.gz'}]
+    name = qsub.group_name('20260101_120000', 0, group)
+    assert name.startswith('20260101_120000_000000_')
+    assert name == qsub.group_name('20260101_120000', 0, list(group))
+    assert name != qsub.group_name('20260101_130000', 0, group)
+    assert name != qsub.group_name('20260101_120000', 0, other_group)
+
+
+def test_failed_submissions_are_not_marked_submitted(monkeypatch):
+    from muons.isdc_production import qsub
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        phs_dir = os.path.join(tmp, 'phs')
+        run_a = os.path.join(phs_dir, '2014', '01', '01', 'a.phs.jsonl.gz')
+        run_b = os.path.join(phs_dir, '2014', '01', '01', 'b.phs.jsonl.gz')
+        for path in [run_a, run_b]:
+            touch(path)
+
+        def submit(job, out_muon_dir, manifest_path=None):
+            return 1 if job['input_run_path'] == run_a else 0
+
+        monkeypatch.setattr(qsub, 'submit', submit)
+        manifest_path = os.path.join(tmp, 'manifest.sqlite')
+        qsub.qsub(phs_dir, os.path.join(tmp, 'out'), manifest_path)
+
+        connection = manifest.connect(manifest_path)
+        assert [r[0] for r in manifest.runs_to_process(connection)] == [run_a]
+        connection.close()
+
+
+def test_failed_packed_submissions_are_not_marked_submitted(monkeypatch):
+    from muons.isdc_production import qsub
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        phs_dir = os.path.join(tmp, 'phs')
+        run_a = os.path.join(phs_dir, '2014', '01', '01', 'a.phs.jsonl.gz')
+        run_b = os.path.join(phs_dir, '2014', '01', '02', 'b.phs.jsonl.gz')
+        for path in [run_a, run_b]:
+            touch(path)
+
+        def submit_group(group, name, out_muon_dir, runtime_s, **kwargs):
+            return 1 if group[0]['input_run_path'] == run_a else 0
+
+        monkeypatch.setattr(qsub, 'submit_group', submit_group)
+        manifest_path = os.path.join(tmp, 'manifest.sqlite')
+        qsub.qsub(
+            phs_dir,
+            os.path.join(tmp, 'out'),
+            manifest_path,
+            target_runtime_s=1,
+            seconds_per_byte=1)
+
+        connection = manifest.connect(manifest_path)
+        assert [r[0] for r in manifest.runs_to_process(connection)] == [run_a]
+        connection.close()
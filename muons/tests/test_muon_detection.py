@@ -5,6 +5,7 @@ import muons
 import tempfile
 import os
 import pkg_resources
+from types import SimpleNamespace
 
 
 def test_ring_overlapp():
@@ -85,3 +86,334 @@ def test_muon_detection():
 
     assert precision > 0.995
     assert sensitivity > 0.76
+
+
+def toy_point_clouds(number_events=60, seed=0):
+    prng = np.random.RandomState(seed)
+    point_clouds = []
+    for i in range(number_events):
+        n = prng.randint(0, 400)
+        if i % 3 == 0:
+            cx, cy = prng.uniform(-0.02, 0.02, size=2)
+            r = prng.uniform(0.008, 0.025)
+            phi = prng.uniform(0, 2*np.pi, n)
+            x = cx + r*np.cos(phi) + prng.normal(0, 5e-4, n)
+            y = cy + r*np.sin(phi) + prng.normal(0, 5e-4, n)
+            nsb = n//8
+            x[:nsb] = prng.uniform(-0.04, 0.04, nsb)
+            y[:nsb] = prng.uniform(-0.04, 0.04, nsb)
+        else:
+            x = prng.uniform(-0.04, 0.04, n)
+            y = prng.uniform(-0.04, 0.04, n)
+        t = prng.normal(2e-8, 1e-9*(1 + i % 3), n)
+        point_clouds.append(np.c_[x, y, t])
+    return point_clouds
+
+
+def test_batch_detection_matches_single_event_detection():
+    fov_radius = np.deg2rad(2.25)
+    point_clouds = toy_point_clouds()
+    flat, offsets = muons.batch_detection.concatenate_point_clouds(
+        point_clouds)
+
+    np.random.seed(seed=1)
+    batch = muons.batch_detection.batch_detection(
+        point_cloud=flat,
+        offsets=offsets,
+        field_of_view_radius=fov_radius)
+    assert batch.shape[0] == len(point_clouds)
+    assert batch['is_muon'].sum() > 0
+
+    dwsrf = muons.detection_with_simple_ring_fit.detection_with_simple_ring_fit
+    np.random.seed(seed=1)
+    for i, point_cloud in enumerate(point_clouds):
+        event = SimpleNamespace(photon_stream=SimpleNamespace(
+            geometry=SimpleNamespace(fov_radius=fov_radius)))
+        clusters = SimpleNamespace(
+            labels=np.zeros(point_cloud.shape[0]),
+            point_cloud=point_cloud.copy())
+        single = dwsrf(event, clusters)
+
+        assert single['is_muon'] == batch['is_muon'][i]
+        for key in single:
+            if key not in ['is_muon', 'rejected_by']:
+                np.testing.assert_almost_equal(single[key], batch[key][i])
+
+
+def test_circle_ransac_finds_ring_among_outliers():
+    prng = np.random.RandomState(0)
+    phi = prng.uniform(0, 2*np.pi, 300)
+    xy = np.c_[0.01 + 0.02*np.cos(phi), -0.005 + 0.02*np.sin(phi)]
+    xy += prng.normal(0, 3e-4, size=xy.shape)
+    xy[:60] = prng.uniform(-0.04, 0.04, size=(60, 2))
+
+    (cx, cy, r), inliers = muons.circle_ransac.circle_ransac(
+        xy, residual_threshold=np.deg2rad(0.25), random_state=1)
+    np.testing.assert_almost_equal(cx, 0.01, 3)
+    np.testing.assert_almost_equal(cy, -0.005, 3)
+    np.testing.assert_almost_equal(r, 0.02, 3)
+    assert inliers[60:].sum() > 0.95*240
+
+    (cx2, cy2, r2), inliers2 = muons.circle_ransac.circle_ransac(
+        xy, residual_threshold=np.deg2rad(0.25), random_state=1)
+    assert (cx, cy, r) == (cx2, cy2, r2)
+    np.testing.assert_equal(inliers, inliers2)
+
+
+def test_circle_ransac_collinear_points():
+    (cx, cy, r), inliers = muons.circle_ransac.circle_ransac(
+        np.array([[0.0, 0.0], [1.0, 1.0], [2.0, 2.0]]),
+        residual_threshold=0.1)
+    assert np.isnan(r)
+    assert inliers.sum() == 0
+
+
+def test_algebraic_circle_fit_is_circumcircle():
+    xy = np.array([[[1.0, 0.0], [0.0, 1.0], [-1.0, 0.0]]]) + 2.0
+    cx, cy, r = muons.circle_ransac.algebraic_circle_fit(xy)
+    np.testing.assert_almost_equal(cx[0], 2.0)
+    np.testing.assert_almost_equal(cy[0], 2.0)
+    np.testing.assert_almost_equal(r[0], 1.0)
+
+
+def toy_ring(cx, cy, r, number_photons=400, seed=0):
+    prng = np.random.RandomState(seed)
+    phi = prng.uniform(0, 2*np.pi, number_photons)
+    xy = np.c_[cx + r*np.cos(phi), cy + r*np.sin(phi)]
+    xy += prng.normal(0, np.deg2rad(0.05), size=xy.shape)
+    return xy
+
+
+def test_hough_ring_refinement_converges():
+    deg = np.deg2rad(1)
+    xy = toy_ring(cx=0.2*deg, cy=-0.1*deg, r=1.0*deg)
+    cx, cy, r = muons.hough.hough_ring_refinement(
+        xy, cx=0.0, cy=0.0, r=0.8*deg)
+    assert np.abs(cx - 0.2*deg) < 0.03*deg
+    assert np.abs(cy + 0.1*deg) < 0.03*deg
+    assert np.abs(r - 1.0*deg) < 0.03*deg
+
+
+def test_hough_ring_refinement_budget():
+    deg = np.deg2rad(1)
+    xy = toy_ring(cx=0.2*deg, cy=-0.1*deg, r=1.0*deg)
+    one_level = 9*9*9*xy.shape[0]
+    coarse = muons.hough.hough_ring_refinement(
+        xy, cx=0.0, cy=0.0, r=0.8*deg,
+        max_number_kernel_evaluations=one_level)
+    np.testing.assert_almost_equal(np.array(coarse)/deg, [0.25, 0.0, 1.05])
+
+
+def ring_population_is_even_loop(
+    ring_population_hist,
+    number_of_fraction_bins,
+    max_relative_std=0.8
+):
+    is_populated_at_all = False
+    most_even_population_std = 1e99
+    for i in range(ring_population_hist.shape[0]):
+        section = np.take(
+            ring_population_hist,
+            range(i, i+number_of_fraction_bins),
+            mode='wrap')
+        if (section > 0).sum() >= 0.5*number_of_fraction_bins:
+            is_populated_at_all = True
+            rel_std = section.std()/section.mean()
+            if rel_std < most_even_population_std:
+                most_even_population_std = rel_std
+    return bool(
+        is_populated_at_all and
+        most_even_population_std < max_relative_std)
+
+
+def test_ring_population_is_even_matches_loop():
+    prng = np.random.RandomState(0)
+    hists = []
+    number_of_fraction_bins = []
+    for i in range(500):
+        number_bins = prng.randint(0, 60)
+        hist = prng.poisson(prng.uniform(0, 4), size=number_bins)
+        hist[prng.uniform(size=number_bins) < prng.uniform()] = 0
+        hists.append(hist)
+        number_of_fraction_bins.append(prng.randint(0, 2*number_bins + 2))
+
+    is_even_batch = muons.tools.ring_population_is_even_batch(
+        ring_population_hists=np.concatenate(hists),
+        hist_offsets=np.r_[0, np.cumsum([h.shape[0] for h in hists])],
+        number_of_fraction_bins=number_of_fraction_bins)
+
+    for i, (hist, w) in enumerate(zip(hists, number_of_fraction_bins)):
+        with np.errstate(invalid='ignore'):
+            expected = ring_population_is_even_loop(hist, w)
+        assert muons.tools.ring_population_is_even(hist, w) == expected
+        assert is_even_batch[i] == expected
+
+
+def test_ring_population_is_even_same_muon_decisions(monkeypatch):
+    dwsrf_module = muons.detection_with_simple_ring_fit
+
+    muon_sample_path = pkg_resources.resource_filename(
+        'muons',
+        os.path.join('tests', 'resources', '100simulations_psf0.0.sim.phs')
+    )
+    run = ps.EventListReader(muon_sample_path)
+
+    number_muons = 0
+    for i, event in enumerate(run):
+        clusters = ps.PhotonStreamCluster(event.photon_stream)
+        ret = dwsrf_module.detection_with_simple_ring_fit(
+            event, clusters, random_state=i)
+        with monkeypatch.context() as m:
+            m.setattr(
+                dwsrf_module,
+                'ring_population_is_even',
+                ring_population_is_even_loop)
+            ret_loop = dwsrf_module.detection_with_simple_ring_fit(
+                event, clusters, random_state=i)
+        assert ret['is_muon'] == ret_loop['is_muon']
+        number_muons += ret['is_muon']
+    assert number_muons > 0
+
+
+def cut_hist_loop(point_cloud):
+    r = np.sqrt(point_cloud[:, 0]**2 + point_cloud[:, 1]**2)
+    r_stedev = np.std(r)
+    r_average = np.average(r)
+    t_stdev = np.std(point_cloud[:, 2])
+    t_average = np.average(point_cloud[:, 2])
+    kept = []
+    for photon in point_cloud:
+        photon_r = np.sqrt(photon[0]**2 + photon[1]**2)
+        if not (photon_r > r_average + 1.95*r_stedev) and not (
+            photon_r < r_average - 1.95*r_stedev
+        ):
+            if not (photon[2] > t_average + 1.95*t_stdev) and not (
+                photon[2] < t_average - 1.95*t_stdev
+            ):
+                kept.append(photon)
+    return np.array(kept).reshape(-1, 3)
+
+
+def test_sigma_clipping_mask_matches_loop():
+    point_clouds = toy_point_clouds(number_events=30, seed=1)
+    flat, offsets = muons.batch_detection.concatenate_point_clouds(
+        point_clouds)
+    batch_mask = muons.tools.sigma_clipping_mask_batch(flat, offsets)
+    for i, point_cloud in enumerate(point_clouds):
+        mask = muons.tools.sigma_clipping_mask(point_cloud)
+        np.testing.assert_array_equal(
+            mask, batch_mask[offsets[i]:offsets[i + 1]])
+        np.testing.assert_array_equal(
+            point_cloud[mask], cut_hist_loop(point_cloud))
+
+
+def test_sigma_clipping_mask_iterative():
+    point_cloud = toy_point_clouds(number_events=3, seed=2)[0]
+    once = muons.tools.sigma_clipping_mask(point_cloud)
+    iterated = muons.tools.sigma_clipping_mask(
+        point_cloud, max_iterations=100)
+    assert iterated.sum() < once.sum()
+    assert not (iterated & ~once).any()
+    # converged, one more pass on the kept photons drops nothing
+    assert muons.tools.sigma_clipping_mask(point_cloud[iterated]).all()
+
+
+def test_ring_metrics_batch_matches_single_events():
+    point_clouds = toy_point_clouds(number_events=20, seed=3)
+    flat, offsets = muons.batch_detection.concatenate_point_clouds(
+        point_clouds)
+    prng = np.random.RandomState(0)
+    cx = prng.uniform(-0.01, 0.01, len(point_clouds))
+    cy = prng.uniform(-0.01, 0.01, len(point_clouds))
+    r = prng.uniform(0.008, 0.025, len(point_clouds))
+    epsilon = np.deg2rad(0.5*0.1111)
+
+    batch = muons.ring_metrics.ring_metrics_batch(
+        flat, offsets, cx, cy, r, hough_epsilon=epsilon)
+    for i, point_cloud in enumerate(point_clouds):
+        single = muons.ring_metrics.ring_metrics(
+            point_cloud, cx[i], cy[i], r[i], hough_epsilon=epsilon)
+        if point_cloud.shape[0] == 0:
+            assert np.isnan(batch['hough_response'][i])
+            continue
+        d = np.hypot(point_cloud[:, 0] - cx[i], point_cloud[:, 1] - cy[i])
+        response = 0.0
+        for d_point in d:
+            if r[i] - epsilon < d_point < r[i] + epsilon:
+                response += (epsilon - abs(d_point - r[i]))/epsilon
+        for metrics in [single, batch[i]]:
+            np.testing.assert_almost_equal(
+                metrics['hough_response'], response/d.shape[0])
+            np.testing.assert_almost_equal(
+                metrics['radial_std'], np.std(d - r[i]))
+            np.testing.assert_almost_equal(
+                metrics['median_radius'], np.median(d))
+
+
+def toy_ring_point_cloud(
+    prng, n, cx, cy, r, phi_max=2*np.pi, sigma=0.02, t_std=1e-9
+):
+    # cx, cy, r, and sigma in deg
+    phi = prng.uniform(0, phi_max, n)
+    x = np.deg2rad(cx + r*np.cos(phi) + prng.normal(0, sigma, n))
+    y = np.deg2rad(cy + r*np.sin(phi) + prng.normal(0, sigma, n))
+    return np.c_[x, y, prng.normal(2e-8, t_std, n)]
+
+
+def toy_nsb_point_cloud(prng, n, half_width):
+    # half_width in deg
+    xy = np.deg2rad(prng.uniform(-half_width, half_width, size=(n, 2)))
+    return np.c_[xy, prng.normal(2e-8, 1e-9, n)]
+
+
+def test_detection_names_the_rejecting_cut():
+    prng = np.random.RandomState(0)
+    point_clouds = {
+        None: np.r_[
+            toy_ring_point_cloud(prng, 200, 0.3, -0.2, 1.0),
+            toy_nsb_point_cloud(prng, 20, 2.0)],
+        'number_of_photons': toy_ring_point_cloud(prng, 2, 0.0, 0.0, 1.0),
+        'initial_circle_model': np.c_[
+            np.linspace(0, 0.01, 20),
+            np.linspace(0, 0.01, 20),
+            np.zeros(20)],
+        'muon_ring_r': toy_ring_point_cloud(prng, 200, 0.0, 0.0, 0.2),
+        'muon_ring_overlapp_with_field_of_view': toy_ring_point_cloud(
+            prng, 200, 3.2, 0.0, 1.0),
+        'arrival_time_stddev': toy_ring_point_cloud(
+            prng, 200, 0.0, 0.0, 1.0, t_std=1e-8),
+        'initial_circle_model_photon_ratio': np.r_[
+            toy_ring_point_cloud(prng, 100, 0.0, 0.0, 1.0),
+            toy_nsb_point_cloud(prng, 120, 2.0)],
+        'visible_muon_ring_circumfance': toy_ring_point_cloud(
+            prng, 200, 2.5, 0.0, 0.5),
+        'density_circle_model_on_off_ratio': np.r_[
+            toy_ring_point_cloud(prng, 200, 0.0, 0.0, 1.0, sigma=0.15),
+            toy_nsb_point_cloud(prng, 20, 2.0)],
+        'density_circle_model_inner_ratio': np.r_[
+            toy_ring_point_cloud(prng, 140, 0.0, 0.0, 1.0),
+            toy_nsb_point_cloud(prng, 60, 0.5),
+            toy_nsb_point_cloud(prng, 20, 2.0)],
+        'ring_population': np.r_[
+            toy_ring_point_cloud(prng, 200, 0.0, 0.0, 1.0, phi_max=0.3*np.pi),
+            toy_nsb_point_cloud(prng, 20, 2.0)],
+    }
+    assert set(point_clouds) == set(
+        [None] + muons.detection_with_simple_ring_fit.CUTS)
+
+    dwsrf = muons.detection_with_simple_ring_fit.detection_with_simple_ring_fit
+    event = SimpleNamespace(photon_stream=SimpleNamespace(
+        geometry=SimpleNamespace(fov_radius=np.deg2rad(2.25))))
+    for cut, point_cloud in point_clouds.items():
+        clusters = SimpleNamespace(
+            labels=np.zeros(point_cloud.shape[0]),
+            point_cloud=point_cloud)
+        timer = muons.instrumentation.StageTimer()
+        features = dwsrf(event, clusters, random_state=0, timer=timer)
+
+        assert features['rejected_by'] == cut
+        assert features['is_muon'] == (cut is None)
+        if cut is None:
+            assert 'cut:' not in ''.join(timer.counts)
+        else:
+            assert timer.counts == {'cut:' + cut: 1}
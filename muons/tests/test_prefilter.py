@@ -0,0 +1,52 @@
+import numpy as np
+import muons
+from types import SimpleNamespace
+
+
+def toy_event(arrival_times):
+    arrival_times = np.asarray(arrival_times, dtype=np.float64)
+    point_cloud = np.zeros(shape=(arrival_times.shape[0], 3))
+    point_cloud[:, 2] = arrival_times
+    return SimpleNamespace(photon_stream=SimpleNamespace(
+        number_photons=arrival_times.shape[0],
+        point_cloud=point_cloud))
+
+
+def test_max_number_photons_in_window():
+    t = np.array([0.0, 1.0, 2.0, 2.5, 3.0, 10.0])
+    assert muons.prefilter.max_number_photons_in_window(t, 1.0) == 3
+    assert muons.prefilter.max_number_photons_in_window(t, 0.1) == 1
+    assert muons.prefilter.max_number_photons_in_window(t, 100.0) == 6
+    assert muons.prefilter.max_number_photons_in_window(
+        np.zeros(0), 1.0) == 0
+
+    mask = muons.prefilter.arrival_time_peak_mask(t[::-1], 1.0)
+    np.testing.assert_array_equal(
+        mask, [False, True, True, True, False, False])
+
+
+def test_prefilter_counts_rejections_per_stage():
+    prefilter = [
+        {'stage': 'number_photons', 'min_number_photons': 5},
+        {
+            'stage': 'arrival_time_peak',
+            'min_number_photons_in_peak': 5,
+            'peak_duration': 5e-9},
+    ]
+    prng = np.random.RandomState(0)
+    events = [
+        toy_event(prng.uniform(0, 50e-9, 3)),
+        toy_event(np.linspace(0, 500e-9, 20)),
+        toy_event(np.r_[prng.normal(20e-9, 1e-9, 30)]),
+    ]
+    counts = muons.prefilter.init_counts(prefilter)
+    passed = [
+        muons.prefilter.passes_prefilter(event, prefilter, counts)
+        for event in events]
+
+    assert passed == [False, False, True]
+    assert counts['number_events'] == 3
+    assert counts['number_passed'] == 1
+    assert counts['rejected'] == {
+        'number_photons': 1,
+        'arrival_time_peak': 1}
@@ -0,0 +1,96 @@
+import numpy as np
+from muons.muon_ring_simulation import simulation_truth
+import tempfile
+import os
+import pkg_resources
+import pytest
+
+
+def make_jobs(event_ids):
+    return [{
+        'casual_muon_support': [event_id, 1.0, 1000.0],
+        'casual_muon_direction': [0.01*event_id, 0.0, -1.0],
+        'event_id': event_id,
+        'nsb_rate': 35e6,
+        'ch_rate': 3.0,
+        'opening_angle': 0.02,
+        'fact_aperture_radius': 1.965,
+        'arrival_time_std': 5e-10,
+        'random_seed': 1,
+        'point_spread_function': 0.0,
+        'muon_support_ground': [0.5, 0.25, 0.0],
+    } for event_id in event_ids]
+
+
+def test_write_read_and_csv_export_roundtrip():
+    truth = simulation_truth.from_jobs(make_jobs([3, 0, 1]), key_aliases={
+        'nsb_rate_per_pixel': 'nsb_rate',
+        'point_spread_function_std': 'point_spread_function'})
+    np.testing.assert_array_equal(truth['casual_muon_support0'], [3, 0, 1])
+    np.testing.assert_array_equal(truth['muon_support_ground1'], 0.25)
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        npy_path = os.path.join(tmp, 'run' + simulation_truth.NPY_SUFFIX)
+        csv_path = os.path.join(tmp, 'run' + simulation_truth.CSV_SUFFIX)
+        simulation_truth.write(npy_path, truth)
+        simulation_truth.export_csv(csv_path, truth)
+        from_npy = simulation_truth.read(npy_path)
+        from_csv = simulation_truth.read(csv_path)
+    np.testing.assert_array_equal(from_npy, truth)
+    for name in truth.dtype.names:
+        np.testing.assert_allclose(from_csv[name], truth[name], atol=1e-6)
+
+
+def test_index_by_event_id():
+    truth = simulation_truth.from_jobs(make_jobs([3, 0, 1]), key_aliases={
+        'nsb_rate_per_pixel': 'nsb_rate',
+        'point_spread_function_std': 'point_spread_function'})
+    indexed = simulation_truth.index_by_event_id(truth)
+    assert indexed.shape[0] == 4
+    np.testing.assert_array_equal(indexed['event_id'], [0, 1, 0, 3])
+    assert indexed[3]['casual_muon_direction0'] == 0.03
+
+
+def test_read_existing_csv():
+    path = pkg_resources.resource_filename(
+        'muons',
+        os.path.join(
+            'tests', 'resources', '100simulations_psf0.0.simulationtruth.csv'))
+    indexed = simulation_truth.index_by_event_id(simulation_truth.read(path))
+    assert indexed.shape[0] == 100
+    np.testing.assert_almost_equal(
+        indexed[0]['casual_muon_direction0'], -0.051820, 6)
+    np.testing.assert_almost_equal(
+        indexed[0]['casual_muon_direction1'], -0.000037, 6)
+
+
+def test_read_csv_with_legacy_names_and_missing_columns():
+    legacy_header = [
+        'casual_muon_support_0', 'casual_muon_support_1',
+        'casual_muon_support_2', 'casual_muon_direction_0',
+        'casual_muon_direction_1', 'casual_muon_direction_2', 'event_id',
+        'nsb_rate', 'ch_rate', 'opening_angle', 'fact_aperture_radius',
+        'arrival_time_std', 'random_seed', 'point_spread_function',
+        'muon_support_ground_0', 'muon_support_ground_1',
+        'muon_support_ground_2']
+    values = [
+        1.0, 2.0, 1000.0, 0.01, 0.0, -1.0, 7, 35e6, 3.0, 0.02, 1.965,
+        5e-10, 1, 0.001, 0.5, 0.25, 0.0]
+    with tempfile.TemporaryDirectory(prefix='muons_') as tmp:
+        path = os.path.join(tmp, 'simulationtruth.csv')
+        with open(path, 'wt') as fout:
+            fout.write(','.join(legacy_header) + '\n')
+            fout.write(','.join(str(v) for v in values) + '\n')
+        truth = simulation_truth.read(path)
+
+        with open(path, 'wt') as fout:
+            fout.write(','.join(legacy_header[1:]) + '\n')
+            fout.write(','.join(str(v) for v in values[1:]) + '\n')
+        with pytest.raises(ValueError):
+            simulation_truth.read(path)
+
+    assert truth['casual_muon_support0'][0] == 1.0
+    assert truth['event_id'][0] == 7
+    assert truth['nsb_rate_per_pixel'][0] == 35e6
+    assert truth['point_spread_function_std'][0] == 0.001
+    assert truth['muon_support_ground1'][0] == 0.25
+    assert truth['is_simulated'][0] == 1
@@ -2,6 +2,8 @@ import numpy as np
 from muons.muon_ring_simulation import single_simulation as rs
 import photon_stream as ps
 from scipy import stats
+import scipy.spatial
+import pytest
 
 np.random.seed(seed=1)
 
@@ -230,3 +232,194 @@ def test_artificial_point_spread_function():
     np.testing.assert_almost_equal(np.std(psf[:, 1]), 1.0, 1)
 
 
+
+
+def emit_photons_loop(
+    casual_muon_support,
+    casual_muon_direction,
+    opening_angle,
+    ch_rate
+):
+    # the former emission, one exponential step and one direction at a time
+    path_length = 0
+    photon_emission_pos = []
+    photon_directions = []
+    u, v = rs.get_u_v(casual_muon_direction)
+    while True:
+        path_length += rs.get_d_alpha(ch_rate)
+        position = rs.position_on_ray(
+            casual_muon_support, casual_muon_direction, path_length)
+        if position[2] <= 0:
+            break
+        photon_emission_pos.append(position)
+        photon_directions.append(rs.draw_direction_of_cherenkov_photon(
+            opening_angle, u, v, casual_muon_direction))
+    return np.array(photon_emission_pos), np.array(photon_directions)
+
+
+def test_emit_photons_statistically_equivalent_to_loop():
+    np.random.seed(0)
+    support = np.array([10.0, -20.0, 200.0])
+    direction = np.array([-0.05, 0.1, -1.0])
+    direction /= np.linalg.norm(direction)
+    opening_angle = np.deg2rad(1.2)
+    emissions = {}
+    for name, emit in [
+        ('loop', emit_photons_loop),
+        ('array', rs.emit_photons),
+    ]:
+        positions, directions, numbers = [], [], []
+        for i in range(50):
+            pos, dirs = emit(support, direction, opening_angle, ch_rate=3)
+            positions.append(pos)
+            directions.append(dirs)
+            numbers.append(pos.shape[0])
+        emissions[name] = (
+            np.concatenate(positions), np.concatenate(directions), numbers)
+
+    loop_pos, loop_dirs, loop_numbers = emissions['loop']
+    pos, dirs, numbers = emissions['array']
+    assert stats.ks_2samp(loop_numbers, numbers).pvalue > 1e-3
+    assert np.all(pos[:, 2] > 0)
+    assert stats.ks_2samp(loop_pos[:, 2], pos[:, 2]).pvalue > 1e-3
+    assert stats.ks_2samp(
+        np.arccos(np.dot(loop_dirs, direction)),
+        np.arccos(np.dot(dirs, direction))).pvalue > 1e-3
+    for axis in [0, 1]:
+        assert stats.ks_2samp(
+            loop_dirs[:, axis], dirs[:, axis]).pvalue > 1e-3
+
+
+def test_emit_photons_upward_muon_raises():
+    with pytest.raises(ValueError):
+        rs.emit_photons(
+            casual_muon_support=[0, 0, 1000],
+            casual_muon_direction=[0, 0, 1],
+            opening_angle=np.deg2rad(1.2),
+            ch_rate=3)
+
+
+def test_cached_pixel_tree_assigns_like_kdtree():
+    assert rs.fact_pixel_tree() is rs.fact_pixel_tree()
+    prng = np.random.RandomState(0)
+    photons_cx_cy = prng.uniform(
+        -np.deg2rad(2.5), np.deg2rad(2.5), size=(10000, 2))
+    inside, chids = rs.assign_to_pixels(photons_cx_cy, rs.fact_pixel_tree())
+    kdtree = scipy.spatial.KDTree(rs.fact_pixel_directions())
+    kdtree_inside, kdtree_chids = rs.assign_to_pixels(photons_cx_cy, kdtree)
+    np.testing.assert_array_equal(inside, kdtree_inside)
+    np.testing.assert_array_equal(chids[inside], kdtree_chids[inside])
+    assert inside.sum() > 0
+
+
+def test_raw_photon_stream_from_pixels_and_slices_matches_list_of_lists():
+    prng = np.random.RandomState(0)
+    number_pixel = 1440
+    pixel_ids = prng.randint(0, number_pixel, size=5000)
+    arrival_slices = prng.randint(0, 100, size=5000)
+    lol = [[] for pixel in range(number_pixel)]
+    for pixel, arrival_slice in zip(pixel_ids, arrival_slices):
+        lol[pixel].append(arrival_slice)
+    expected = []
+    for pixel in lol:
+        expected += sorted(pixel) + [ps.io.binary.LINEBREAK]
+    raw = rs.raw_photon_stream_from_pixels_and_slices(
+        pixel_ids, arrival_slices, number_pixel=number_pixel)
+    assert raw.dtype == np.uint8
+    np.testing.assert_array_equal(raw, expected)
+
+
+def test_raw_photon_stream_without_photons_has_only_linebreaks():
+    raw = rs.raw_photon_stream_from_pixels_and_slices(
+        np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+    assert raw.shape[0] == 1440
+    assert np.all(raw == ps.io.binary.LINEBREAK)
+
+
+def test_culled_muons_have_no_photons_in_the_camera():
+    prng = np.random.default_rng(0)
+    field_of_view_radius = rs.fact_field_of_view_radius()
+    number_culled = 0
+    for i in range(200):
+        inclination = prng.uniform(0, np.deg2rad(10))
+        casual_muon_direction = -rs.pol2cart(
+            1, prng.uniform(0, 2*np.pi), inclination)
+        casual_muon_support = np.array([
+            prng.uniform(-300, 300), prng.uniform(-300, 300), 1e3])
+        opening_angle = np.deg2rad(prng.uniform(0.4, 1.6))
+        if rs.may_produce_visible_ring(
+            casual_muon_support=casual_muon_support,
+            casual_muon_direction=casual_muon_direction,
+            opening_angle=opening_angle,
+            fact_aperture_radius=5.0,
+            point_spread_function_std=0.0,
+            field_of_view_radius=field_of_view_radius
+        ):
+            continue
+        number_culled += 1
+        ch_sup, ch_dir = rs.emit_photons(
+            casual_muon_support,
+            casual_muon_direction,
+            opening_angle,
+            ch_rate=1.0,
+            prng=prng)
+        photons_cx_cy = rs.perfect_imaging(
+            ch_sup, ch_dir, aperture_radius=5.0)
+        inside_pixels, ch_CHIDs = rs.assign_to_pixels(
+            photons_cx_cy, rs.fact_pixel_tree())
+        assert inside_pixels.sum() == 0
+    assert number_culled > 0
+
+
+def test_emission_towards_aperture_statistically_equivalent_to_all():
+    prng = np.random.default_rng(0)
+    support = np.array([6.0, -9.0, 1000.0])
+    direction = np.array([-0.01, 0.02, -1.0])
+    direction /= np.linalg.norm(direction)
+    opening_angle = np.deg2rad(1.2)
+    aperture_radius = 1.965
+    imaged = {}
+    for name, emit in [
+        ('all', rs.emit_photons),
+        ('towards_aperture', lambda *args, **kwargs: (
+            rs.emit_photons_towards_aperture(
+                *args, aperture_radius=aperture_radius, **kwargs))),
+    ]:
+        cx_cy, numbers = [], []
+        for i in range(200):
+            ch_sup, ch_dir = emit(
+                support, direction, opening_angle, ch_rate=3, prng=prng)
+            photons_cx_cy = rs.perfect_imaging(
+                ch_sup, ch_dir, aperture_radius=aperture_radius)
+            cx_cy.append(photons_cx_cy)
+            numbers.append(photons_cx_cy.shape[0])
+        imaged[name] = (np.concatenate(cx_cy), numbers)
+
+    all_cx_cy, all_numbers = imaged['all']
+    cx_cy, numbers = imaged['towards_aperture']
+    assert np.mean(numbers) > 10
+    assert stats.ks_2samp(all_numbers, numbers).pvalue > 1e-3
+    for axis in [0, 1]:
+        assert stats.ks_2samp(
+            all_cx_cy[:, axis], cx_cy[:, axis]).pvalue > 1e-3
+    assert rs.azimuths_towards_aperture(
+        support, direction, opening_angle, aperture_radius).mean() < 0.5
+
+
+def test_overlay_nsb_keeps_the_photons_of_the_pure_ring():
+    prng = np.random.default_rng(0)
+    pixel_ids = prng.integers(0, 1440, size=300)
+    arrival_slices = prng.integers(0, 100, size=300)
+    raw = rs.raw_photon_stream_from_pixels_and_slices(
+        pixel_ids, arrival_slices)
+    round_trip = rs.pixels_and_slices_from_raw_photon_stream(raw)
+    np.testing.assert_array_equal(
+        rs.raw_photon_stream_from_pixels_and_slices(*round_trip), raw)
+    np.testing.assert_array_equal(
+        rs.overlay_nsb(raw, 0, prng=prng), raw)
+
+    overlaid = rs.pixels_and_slices_from_raw_photon_stream(
+        rs.overlay_nsb(raw, 35e6, prng=prng))
+    assert overlaid[0].shape[0] > 300
+    photons = set(zip(*overlaid))
+    assert set(zip(pixel_ids, arrival_slices)) <= photons
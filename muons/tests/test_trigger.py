@@ -0,0 +1,50 @@
+import numpy as np
+import photon_stream as ps
+import muons
+
+
+def toy_photons(number_photons, seed):
+    prng = np.random.RandomState(seed)
+    pixels = prng.randint(0, 1440, number_photons)
+    slices = prng.randint(0, 100, number_photons)
+    # a bright flash in a few trigger-patches
+    flash = prng.uniform(size=number_photons) < 0.3
+    pixels[flash] = prng.randint(0, 27, flash.sum())
+    slices[flash] = prng.randint(40, 60, flash.sum())
+    return pixels, slices
+
+
+def image_sequence(pixels, slices):
+    sequence = np.zeros(shape=(100, 1440))
+    np.add.at(sequence, (slices, pixels), 1)
+    return sequence
+
+
+def test_sparse_trigger_patch_response_matches_image_sequence():
+    for seed in range(10):
+        pixels, slices = toy_photons(number_photons=50*seed, seed=seed)
+        expected = muons.trigger.max_trigger_patch_response_in_image_sequence(
+            image_sequence(pixels, slices))
+        assert muons.trigger.max_trigger_patch_response(
+            pixels, slices) == expected
+
+
+def test_sparse_trigger_patch_response_batch():
+    events = [toy_photons(number_photons=97*i, seed=i) for i in range(12)]
+    offsets = np.r_[0, np.cumsum([p.shape[0] for p, s in events])]
+    response = muons.trigger.max_trigger_patch_response_batch(
+        pixels=np.concatenate([p for p, s in events]),
+        slices=np.concatenate([s for p, s in events]),
+        offsets=offsets)
+    for i, (pixels, slices) in enumerate(events):
+        assert response[i] == muons.trigger.max_trigger_patch_response(
+            pixels, slices)
+
+
+def test_pixels_and_slices_from_raw():
+    LB = ps.io.binary.LINEBREAK
+    raw = np.array([LB, 35, 36, LB, LB, 40, LB], dtype=np.uint8)
+    pixels, slices = muons.trigger.pixels_and_slices_from_raw(
+        raw, slice_offset=30)
+    np.testing.assert_array_equal(pixels, [1, 1, 3])
+    np.testing.assert_array_equal(slices, [5, 6, 10])
@@ -94,3 +94,244 @@ def xy2polar(xy):
     rphi[:, 0] = np.sqrt(xy[:, 0]**2, xy[:, 1]**2)
     rphi[:, 1] = np.arctan2(xy[:, 1], xy[:, 0])
     return rphi
+
+
+def circle_overlapp_array(cx1, cy1, r1, cx2, cy2, r2):
+    """
+    Vectorized circle_overlapp().
+    Returns the fraction [0,1] of the circumference of the smaller circle
+    which is inside the larger circle for arrays of circle pairs.
+    """
+    cx1, cy1, r1, cx2, cy2, r2 = np.broadcast_arrays(
+        *[np.asarray(v, dtype=np.float64)
+          for v in (cx1, cy1, r1, cx2, cy2, r2)]
+    )
+    d = np.sqrt((cx2 - cx1)**2 + (cy2 - cy1)**2)
+    r_large = np.maximum(r1, r2)
+    r_small = np.minimum(r1, r2)
+
+    d_sq = d**2
+    r_large_sq = r_large**2
+    r_small_sq = r_small**2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # http://mathworld.wolfram.com/Circle-CircleIntersection.html
+        a = 1/d * np.sqrt(
+            4*d_sq*r_large_sq - (d_sq - r_small_sq + r_large_sq)**2)
+        x = np.sqrt(r_large_sq - r_small_sq)
+        half_angle = np.arcsin((a/2)/r_small)
+        overlapp_angle = np.where(
+            d >= x,
+            2*half_angle,
+            2*np.pi - 2*half_angle)
+
+    overlapp_ratio = overlapp_angle/(2*np.pi)
+    overlapp_ratio = np.where(
+        d <= np.abs(r_large - r_small), 1.0, overlapp_ratio)
+    overlapp_ratio = np.where(d > r_large + r_small, 0.0, overlapp_ratio)
+    return overlapp_ratio
+
+
+def segment_ids(offsets):
+    """
+    Returns the segment index of each element in a ragged array.
+
+    Parameter
+    ---------
+    offsets     np.array shape=(number_segments + 1, )
+                Start of each segment in the flat array, followed by the
+                total length of the flat array.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return np.repeat(
+        np.arange(offsets.shape[0] - 1),
+        np.diff(offsets))
+
+
+def segment_sum(values, ids, number_segments):
+    """
+    Returns the sum of 'values' within each segment.
+    Empty segments sum up to zero.
+    """
+    return np.bincount(ids, weights=values, minlength=number_segments)
+
+
+def segment_mean_std(values, ids, number_segments):
+    """
+    Returns the mean and the standard deviation of 'values' within each
+    segment. Empty segments return NaN.
+    """
+    counts = np.bincount(ids, minlength=number_segments)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = segment_sum(values, ids, number_segments)/counts
+        deviation = values - mean[ids]
+        std = np.sqrt(
+            segment_sum(deviation**2, ids, number_segments)/counts)
+    return mean, std
+
+
+def ring_population_is_even(
+    ring_population_hist,
+    number_of_fraction_bins,
+    max_relative_std=0.8
+):
+    """
+    Returns True when there is a continuous section of
+    'number_of_fraction_bins' bins in the azimuthal population histogram
+    of a ring which is populated evenly.
+    A section counts when at least half of its bins are populated, and it is
+    even when its relative standard deviation is below 'max_relative_std'.
+    The sections wrap around the end of the histogram. All sections are
+    evaluated at once using circular prefix sums.
+
+    Parameter
+    ---------
+    ring_population_hist        Number of photons in each azimuth bin.
+
+    number_of_fraction_bins     Number of bins in one section.
+    """
+    ring_population_hist = np.asarray(ring_population_hist)
+    return bool(ring_population_is_even_batch(
+        ring_population_hists=ring_population_hist,
+        hist_offsets=[0, ring_population_hist.shape[0]],
+        number_of_fraction_bins=[number_of_fraction_bins],
+        max_relative_std=max_relative_std)[0])
+
+
+def ring_population_is_even_batch(
+    ring_population_hists,
+    hist_offsets,
+    number_of_fraction_bins,
+    max_relative_std=0.8
+):
+    """
+    Batched ring_population_is_even() for many rings.
+    Returns a boolean array, one entry for each ring.
+
+    Parameter
+    ---------
+    ring_population_hists       The concatenated azimuth histograms of all
+                                rings.
+
+    hist_offsets                np.array shape=(number_rings + 1, )
+                                Start of each histogram followed by the
+                                total number of bins.
+
+    number_of_fraction_bins     Number of bins in one section for each ring.
+    """
+    hists = np.asarray(ring_population_hists, dtype=np.int64)
+    hist_offsets = np.asarray(hist_offsets, dtype=np.int64)
+    number_bins = np.diff(hist_offsets)
+    number_rings = number_bins.shape[0]
+    w = np.asarray(number_of_fraction_bins, dtype=np.int64)
+
+    # Each histogram is extended circularly by w - 1 bins, so that every
+    # section is a contiguous slice of the extended histograms.
+    ext_length = np.where(number_bins > 0, number_bins + w - 1, 0)
+    ext_length = np.maximum(ext_length, 0)
+    ext_offsets = np.zeros(number_rings + 1, dtype=np.int64)
+    ext_offsets[1:] = np.cumsum(ext_length)
+    ext_ids = segment_ids(ext_offsets)
+    position = np.arange(ext_offsets[-1]) - ext_offsets[ext_ids]
+    ext = hists[hist_offsets[ext_ids] + position % number_bins[ext_ids]]
+
+    def prefix(values):
+        c = np.zeros(values.shape[0] + 1, dtype=np.int64)
+        np.cumsum(values, out=c[1:])
+        return c
+
+    c1 = prefix(ext)
+    c2 = prefix(ext*ext)
+    cnz = prefix((ext > 0).astype(np.int64))
+
+    window_offsets = np.zeros(number_rings + 1, dtype=np.int64)
+    window_offsets[1:] = np.cumsum(np.where(w > 0, number_bins, 0))
+    window_ids = segment_ids(window_offsets)
+    start = (
+        ext_offsets[window_ids] +
+        np.arange(window_offsets[-1]) - window_offsets[window_ids])
+    end = start + w[window_ids]
+    s1 = c1[end] - c1[start]
+    s2 = c2[end] - c2[start]
+    populated = cnz[end] - cnz[start]
+
+    window_w = w[window_ids]
+    is_populated = populated >= 0.5*window_w
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # std/mean of a section is sqrt(w*s2 - s1**2)/s1
+        relative_std = np.sqrt(
+            (window_w*s2 - s1*s1).astype(np.float64))/s1
+    is_even = is_populated & (relative_std < max_relative_std)
+    return np.bincount(
+        window_ids[is_even], minlength=number_rings) > 0
+
+
+def sigma_clipping_mask(
+    point_cloud,
+    number_sigma=1.95,
+    max_iterations=1
+):
+    """
+    Returns a boolean mask of the photons which are kept by a sigma clipping
+    in radius sqrt(cx**2 + cy**2) and arrival time.
+    A photon is dropped when its radius or its arrival time is outside of
+    the average +- 'number_sigma' standard deviations. With
+    'max_iterations' > 1, average and standard deviation are recomputed
+    from the kept photons until no further photon is dropped.
+
+    Parameter
+    ---------
+    point_cloud         np.array shape=(N, 3)
+                        The photons (cx, cy, t).
+
+    number_sigma        Width of the kept range in standard deviations.
+
+    max_iterations      Maximum number of clipping passes.
+    """
+    point_cloud = np.asarray(point_cloud)
+    return sigma_clipping_mask_batch(
+        point_cloud=point_cloud,
+        offsets=[0, point_cloud.shape[0]],
+        number_sigma=number_sigma,
+        max_iterations=max_iterations)
+
+
+def sigma_clipping_mask_batch(
+    point_cloud,
+    offsets,
+    number_sigma=1.95,
+    max_iterations=1
+):
+    """
+    Batched sigma_clipping_mask() for many events. Averages and standard
+    deviations are taken within each event.
+
+    Parameter
+    ---------
+    point_cloud         np.array shape=(N, 3)
+                        The concatenated photons (cx, cy, t) of all events.
+
+    offsets             np.array shape=(number_events + 1, )
+                        Start of each event in 'point_cloud' followed by N.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    number_events = offsets.shape[0] - 1
+    ids = segment_ids(offsets)
+    r = np.hypot(point_cloud[:, 0], point_cloud[:, 1])
+    t = point_cloud[:, 2]
+
+    mask = np.ones(r.shape[0], dtype=np.bool_)
+    for iteration in range(max_iterations):
+        kept_ids = ids[mask]
+        new_mask = mask.copy()
+        for values in [r, t]:
+            average, stddev = segment_mean_std(
+                values[mask], kept_ids, number_events)
+            upper = (average + number_sigma*stddev)[ids]
+            lower = (average - number_sigma*stddev)[ids]
+            with np.errstate(invalid='ignore'):
+                new_mask &= ~(values > upper) & ~(values < lower)
+        if np.array_equal(new_mask, mask):
+            break
+        mask = new_mask
+    return mask
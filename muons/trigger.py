@@ -42,3 +42,122 @@ def max_trigger_patch_response_in_image_sequence(image_sequence):
             axis=0)
 
     return np.max(trigger_patch_sequence_convolved)
+
+
+NUM_PIXEL_IN_TRIGGER_PATCH = 9
+NUM_SLICES_INTEGRATION_WINDOW = 20
+
+
+def pixels_and_slices_from_raw(raw, slice_offset=None):
+    """
+    Returns the pixel-CHIDs and the arrival time-slices of the photons in a
+    raw photon-stream, without building the dense image sequence.
+
+    Parameter
+    ---------
+        raw                     np.array dtype=uint8
+                                The raw photon-stream. The arrival slices
+                                of each pixel are followed by a LINEBREAK.
+
+        slice_offset            Subtracted from the raw arrival slices to
+                                get the time-slices of the image sequence.
+                                Default is the photon-stream's offset after
+                                the begin of the region of interest.
+    """
+    if slice_offset is None:
+        slice_offset = (
+            ps.io.magic_constants.
+            NUMBER_OF_TIME_SLICES_OFFSET_AFTER_BEGIN_OF_ROI)
+    raw = np.asarray(raw)
+    is_linebreak = raw == ps.io.binary.LINEBREAK
+    pixels = np.cumsum(is_linebreak) - is_linebreak
+    is_photon = ~is_linebreak
+    slices = raw[is_photon].astype(np.int64) - slice_offset
+    return pixels[is_photon], slices
+
+
+def max_trigger_patch_response(pixels, slices):
+    """
+    Returns the maximum response of a trigger-patch in a sliding time-window
+    of 10ns, same as max_trigger_patch_response_in_image_sequence(), but
+    from the photons directly.
+    The photons are histogrammed into (trigger-patch, time-slice) and the
+    sliding window is the difference of a cumulative sum along the time.
+
+    Parameter
+    ---------
+        pixels                  np.array
+                                The pixel-CHIDs of the photons.
+
+        slices                  np.array
+                                The arrival time-slices of the photons.
+    """
+    NUM_TIME_SLICES = ps.io.magic_constants.NUMBER_OF_TIME_SLICES
+    NUM_PIXELS = ps.io.magic_constants.NUMBER_OF_PIXELS
+    NUM_TRIGGER_PATCHES = NUM_PIXELS//NUM_PIXEL_IN_TRIGGER_PATCH
+    # The image-sequence version never integrates the last time-slice.
+    num_slices = NUM_TIME_SLICES - 1
+
+    pixels = np.asarray(pixels, dtype=np.int64)
+    slices = np.asarray(slices, dtype=np.int64)
+    valid = (slices >= 0) & (slices < num_slices)
+    patches = pixels[valid]//NUM_PIXEL_IN_TRIGGER_PATCH
+
+    cumulative = np.zeros(
+        shape=(NUM_TRIGGER_PATCHES, num_slices + 1), dtype=np.int64)
+    cumulative[:, 1:] = np.bincount(
+        patches*num_slices + slices[valid],
+        minlength=NUM_TRIGGER_PATCHES*num_slices).reshape(
+            (NUM_TRIGGER_PATCHES, num_slices))
+    np.cumsum(cumulative, axis=1, out=cumulative)
+
+    window = min(NUM_SLICES_INTEGRATION_WINDOW, num_slices)
+    response = cumulative[:, window:] - cumulative[:, :-window]
+    return int(response.max())
+
+
+def max_trigger_patch_response_batch(pixels, slices, offsets):
+    """
+    Returns the maximum trigger-patch response, see
+    max_trigger_patch_response(), for each event in a batch of events.
+    The photons are sorted by (event, trigger-patch, time-slice) and the
+    number of photons in the window starting at each photon is found with a
+    binary search.
+
+    Parameter
+    ---------
+        pixels, slices          np.arrays
+                                The concatenated pixel-CHIDs and arrival
+                                time-slices of the photons of all events.
+
+        offsets                 np.array shape=(number_events + 1, )
+                                Start of each event followed by the total
+                                number of photons.
+    """
+    NUM_TIME_SLICES = ps.io.magic_constants.NUMBER_OF_TIME_SLICES
+    NUM_PIXELS = ps.io.magic_constants.NUMBER_OF_PIXELS
+    NUM_TRIGGER_PATCHES = NUM_PIXELS//NUM_PIXEL_IN_TRIGGER_PATCH
+    num_slices = NUM_TIME_SLICES - 1
+
+    offsets = np.asarray(offsets, dtype=np.int64)
+    number_events = offsets.shape[0] - 1
+    events = np.repeat(np.arange(number_events), np.diff(offsets))
+    pixels = np.asarray(pixels, dtype=np.int64)
+    slices = np.asarray(slices, dtype=np.int64)
+    valid = (slices >= 0) & (slices < num_slices)
+
+    rows = (
+        events[valid]*NUM_TRIGGER_PATCHES +
+        pixels[valid]//NUM_PIXEL_IN_TRIGGER_PATCH)
+    keys = np.sort(rows*num_slices + slices[valid])
+    row_start = keys - keys % num_slices
+    window_end = np.minimum(
+        keys % num_slices + NUM_SLICES_INTEGRATION_WINDOW, num_slices)
+    count = (
+        np.searchsorted(keys, row_start + window_end, side='left') -
+        np.searchsorted(keys, keys, side='left'))
+
+    response = np.zeros(number_events, dtype=np.int64)
+    np.maximum.at(
+        response, keys//(num_slices*NUM_TRIGGER_PATCHES), count)
+    return response
@@ -1,4 +1,5 @@
 import photon_stream as ps
+import muons
 import numpy as np
 import matplotlib.pyplot as plt
 import os
@@ -8,9 +9,11 @@ from datetime import datetime as dt
 dpi = 150
 figw = 10
 figh = 10
-m = np.fromfile('muon.info', dtype=ps.muons.extraction.header_dtype)
+m = muons.catalog.read_catalog('muon_catalog')
 
-print('Total number of muons', m.shape[0]/1e6, 'M muon events')
+number_muons = m['key'].shape[0]
+
+print('Total number of muons', number_muons/1e6, 'M muon events')
 
 
 # suspicious time
@@ -165,7 +168,7 @@ fnm = 'ring_radius_histogram_all_time.png'
 if not os.path.exists(fnm):
 	min_radius = np.min(m['ring_radius'])
 	max_radius = np.max(m['ring_radius'])
-	nbins = int(0.1*np.sqrt(m.shape[0]))
+	nbins = int(0.1*np.sqrt(number_muons))
 	step = (max_radius - min_radius)/nbins
 	binedges = np.linspace(min_radius, max_radius, nbins)
 	bincounts, binedges = np.histogram(m['ring_radius'], bins=binedges)
@@ -183,7 +186,7 @@ if not os.path.exists(fnm):
 #------------------------------
 fnm = 'ring_overlap_histogram_all_time.png'
 if not os.path.exists(fnm):
-	nbins = int(0.1*np.sqrt(m.shape[0]))
+	nbins = int(0.1*np.sqrt(number_muons))
 	step = 0.99/nbins
 	binedges = np.linspace(0, 0.99, nbins)
 	bincounts, binedges = np.histogram(m['ring_overlap_with_fov'], bins=binedges)
@@ -202,7 +205,7 @@ fnm = 'arrival_time_histogram_all_time.png'
 if not os.path.exists(fnm):
 	min_t = np.min(m['arrival_time'])
 	max_t = np.max(m['arrival_time'])
-	nbins = int(0.1*np.sqrt(m.shape[0]))
+	nbins = int(0.1*np.sqrt(number_muons))
 	step = (max_t - min_t)/nbins
 	binedges = np.linspace(min_t, max_t, nbins)
 	bincounts, binedges = np.histogram(m['arrival_time'], bins=binedges)
@@ -224,7 +227,7 @@ fnm = 'event_number_histogram_all_time.png'
 if not os.path.exists(fnm):
 	min_t = np.min(m['Event'])
 	max_t = np.max(m['Event'])
-	nbins = int(0.1*np.sqrt(m.shape[0]))
+	nbins = int(0.1*np.sqrt(number_muons))
 	step = (max_t - min_t)/nbins
 	binedges = np.linspace(min_t, max_t, nbins)
 	bincounts, binedges = np.histogram(m['Event'], bins=binedges)
@@ -244,7 +247,7 @@ fnm = 'run_number_histogram_all_time.png'
 if not os.path.exists(fnm):
 	min_t = np.min(m['Run'])
 	max_t = np.max(m['Run'])
-	nbins = int(0.01*np.sqrt(m.shape[0]))
+	nbins = int(0.01*np.sqrt(number_muons))
 	step = (max_t - min_t)/nbins
 	binedges = np.linspace(min_t, max_t, nbins)
 	bincounts, binedges = np.histogram(m['Run'], bins=binedges)
@@ -265,7 +268,7 @@ fnm = 'ring_radius_histogram_vs_time'
 if not os.path.exists(fnm+'0.png'):
 	min_radius = np.min(m['ring_radius'])
 	max_radius = np.max(m['ring_radius'])
-	nbins1 = int(np.sqrt(m.shape[0]))
+	nbins1 = int(np.sqrt(number_muons))
 	ntimebins = 64
 	nbins = int(nbins1/ntimebins)
 	step = (max_radius - min_radius)/nbins
@@ -496,27 +499,12 @@ if not os.path.exists(fnm):
 #------------------------------
 fnm = 'rates.png'
 if not os.path.exists(fnm):
-	night = -1
-	run = -1
-	new_run = False
-	events_in_run = 0
-	start = 0
-	for event in m:
-		if event['Night'] > night:
-			night = event['Night']
-			run = event['Run']
-			new_run = True
-
-		if event['Run'] > run:
-			run = event['Run']
-			new_run = True
-
-		if new_run:
-			print(night, run, events_in_run)
-			start = event['UnixTime']
-			new_run = False
-			events_in_run = 0
-		else:
-			events_in_run += 1
+	# The catalog is sorted by (Night, Run, Event), the events of a run
+	# are one block of rows.
+	night_run = m['key'] >> np.uint64(muons.catalog.KEY_EVENT_BITS)
+	run_starts = np.concatenate([[0], np.flatnonzero(np.diff(night_run)) + 1])
+	events_in_run = np.diff(np.append(run_starts, number_muons))
+	for start, number in zip(run_starts, events_in_run):
+		print(m['Night'][start], m['Run'][start], m['UnixTime_s'][start], number)
 
 
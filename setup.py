@@ -9,6 +9,7 @@ setup(
     author_email='sebmuell@phys.ethz.ch',
     license='MIT',
     packages=find_packages(),
+    python_requires='>=3.7',
     package_data={
         'muons': [
             'tests/resources/*', ]
@@ -24,10 +25,18 @@ setup(
         'msgpack_numpy',
         'circlehough',
         'scoop',
-        'numpy>=1.15.0'
+        'numpy>=1.17.0'
     ],
     entry_points={'console_scripts': [
         'phs_extract_muons = ' +
-        'muons.isdc_production.worker_node_main:main', ]},
+        'muons.isdc_production.worker_node_main:main',
+        'phs_extract_muons_many = ' +
+        'muons.isdc_production.multi_run_worker_main:main',
+        'phs_muons_jsonl_to_phs = ' +
+        'muons.phs_output:main',
+        'phs_muon_catalog = ' +
+        'muons.catalog:main',
+        'phs_muon_stats = ' +
+        'muons.instrumentation:main', ]},
     zip_safe=False,
 )